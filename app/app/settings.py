@@ -76,6 +76,8 @@ SECURE_HSTS_PRELOAD = True
 
 # File Upload Settings
 DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024
+# Stream uploaded files to disk, hashing and checking video headers per chunk (social/uploads.py)
+FILE_UPLOAD_HANDLERS = ['social.uploads.MediaUploadHandler']
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 1000
 FILE_UPLOAD_PERMISSIONS = 0o644
 FILE_UPLOAD_DIRECTORY_PERMISSIONS = 0o755
@@ -143,6 +145,18 @@ DATABASES = {
     }
 }
 
+# Cache
+# Shared by every gunicorn worker and the outbox worker, so version keys such as
+# the node registry's (social/node_registry.py) invalidate all of them.
+# The table is created with `manage.py createcachetable`.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.db.DatabaseCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "django_cache"),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -215,4 +229,16 @@ GITHUB_CALLBACK_URL = "http://localhost:8000/social/github/callback/"
 CURRENT_NODE_URL = f"http://{NODE_IP}/social/api/"
 CURRENT_NODE_NAME = "LocalNode"
 CURRENT_NODE_USERNAME = "admin"
-CURRENT_NODE_PASSWORD = "secret"
\ No newline at end of file
+CURRENT_NODE_PASSWORD = "secret"
+
+# Outbound inbox deliveries (see social/outbox.py and `manage.py run_outbox`)
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BACKOFF_SECONDS = 30
+OUTBOX_MAX_BACKOFF_SECONDS = 6 * 60 * 60
+OUTBOX_PER_NODE_CONCURRENCY = 4
+OUTBOX_REQUEST_TIMEOUT = 10
+
+# Shared node-to-node HTTP client (social/federation.py)
+FEDERATION_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+FEDERATION_POOL_SIZE = 10
+FEDERATION_RETRIES = 2
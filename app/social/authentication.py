@@ -6,7 +6,7 @@ from rest_framework.exceptions import AuthenticationFailed
 from django.contrib.auth.models import User
 
 from app.settings import CURRENT_NODE_URL
-from .models import Node
+from . import node_registry
 
 class NodeBasicAuthentication(BaseAuthentication):
     """
@@ -38,11 +38,8 @@ class NodeBasicAuthentication(BaseAuthentication):
             raise AuthenticationFailed("Invalid basic auth credentials.")
 
         # Grab node object to attempt to check credentials
-        try:
-            node = Node.objects.get(auth_username=username)
-            print(f'print from authentication.py {node}')
-            #node = Node.objects.get(base_url=CURRENT_NODE_URL)
-        except Node.DoesNotExist:
+        node = node_registry.by_username(username)
+        if node is None:
             raise AuthenticationFailed("Invalid node credentials.")
         if not node.enabled:
             raise AuthenticationFailed("This node is disabled.")
@@ -8,6 +8,11 @@ import uuid
 from datetime import datetime
 import traceback
 from .distribution_utils import distribute_likes, distribute_comment_likes
+from . import counters
+from . import fqid
+from . import node_registry
+from . import outbox
+from . import resolver
 from django.http import JsonResponse, HttpResponseNotFound
 from django.contrib.auth.decorators import login_required
 
@@ -16,7 +21,9 @@ def is_comment_liked(request, comment_id):
     """API endpoint to check if the current user has liked a specific comment"""
     try:
         # Try to find the comment by its ID
-        comment = Comment.objects.get(id__contains=comment_id)
+        comment = resolver.resolve_comment(comment_id)
+        if comment is None:
+            raise Comment.DoesNotExist
         
         # Check if the current user has liked this comment
         user = request.user
@@ -58,30 +65,25 @@ def send_comment_like_to_inbox(request):
         liker = Author.objects.get(user=request.user)
         
         # Try to get the comment from our database (it might be cached)
-        uuid_part = comment_fqid.split('/')[-1]
-        existing_comment = Comment.objects.filter(id__endswith=uuid_part).first()
+        existing_comment = resolver.resolve_comment(comment_fqid)
         
         if not existing_comment:
             print('failed to get existing comment')
             # Create a placeholder for the comment
             # Extract post and author info from the IDs
-            if '/authors/' in post_fqid and '/posts/' in post_fqid:
-                parts = post_fqid.split('/authors/')
-                host = parts[0]
-                remainder = parts[1]
-                post_author_id = remainder.split('/posts/')[0]
+            parsed_post = fqid.parse(post_fqid)
+            if parsed_post is not None and parsed_post.kind == "posts":
+                post_author_id = parsed_post.author_id
                 
-                try:
-                    # Try to find the remote author in our database
-                    remote_author = Author.objects.get(id__endswith=post_author_id)
-                except Author.DoesNotExist:
-                    # Create a placeholder remote author
-                    remote_author = Author.objects.create(
-                        id=f"{host}/authors/{post_author_id}",
-                        host=host,
-                        displayName="Remote Author",
-                        page=f"{host}/authors/{post_author_id}"
-                    )
+                # Try to find the remote author in our database, or create a placeholder
+                remote_author, _ = Author.objects.get_or_create(
+                    id=post_author_id,
+                    defaults={
+                        "host": parsed_post.api_root,
+                        "displayName": "Remote Author",
+                        "page": post_author_id,
+                    }
+                )
                 
                 # Create a placeholder comment
                 existing_comment = Comment(
@@ -109,12 +111,9 @@ def send_comment_like_to_inbox(request):
             print(f"Found a post, author ID: {post_author_id}")
         except Post.DoesNotExist:
             # Extract from the post_fqid
-            if '/authors/' in post_fqid and '/posts/' in post_fqid:
-                parts = post_fqid.split('/authors/')
-                host = parts[0]
-                remainder = parts[1]
-                author_id_part = remainder.split('/posts/')[0]
-                post_author_id = f"{host}/authors/{author_id_part}"
+            parsed_post = fqid.parse(post_fqid)
+            if parsed_post is not None and parsed_post.kind == "posts":
+                post_author_id = parsed_post.author_id
                 print(f"Extracted post author ID: {post_author_id}")
         
         # Comment already exists (should always happen)
@@ -140,7 +139,7 @@ def send_comment_like_to_inbox(request):
             )
             action = 'liked'
             # Update like count
-            like_count = Like.objects.filter(object=existing_comment.id).count()
+            like_count = counters.like_count(existing_comment.id)
             print(f"From comment_like_views: Updated like count: {like_count}")
             
             # Determine if this is a local or remote post/comment
@@ -160,7 +159,7 @@ def send_comment_like_to_inbox(request):
                 host = post_author_host
                 
                 # Get the foreign node information
-                node = Node.objects.get(base_url__contains=host.split('//')[1])
+                node = node_registry.get_by_host(host)
                 
                 # Construct inbox URL
                 inbox_url = f"{post_author_id}/inbox"
@@ -183,22 +182,13 @@ def send_comment_like_to_inbox(request):
                     "summary": f"{liker.displayName} liked your comment"
                 }
                 
-                # Send to inbox
-                response = requests.post(
-                    inbox_url,
-                    json=like_data,
-                    auth=(node.auth_username, node.auth_password),
-                    headers={"Content-Type": "application/json"},
-                    timeout=5
-                )
-                
-                if response.status_code >= 400:
-                    print(f"Error sending comment like to inbox: {response.status_code} - {response.text}")
+                # Queue for the remote inbox
+                outbox.enqueue(node, inbox_url, like_data)
                 
             except Node.DoesNotExist:
                 print(f"From comment_like_views: Node does not exist for host: {host}")
             except Exception as e:
-                print(f"From comment_like_views: Failed to send comment like to inbox: {str(e)}")
+                print(f"From comment_like_views: Failed to queue comment like for inbox: {str(e)}")
             
             # If it's a local post, distribute the like to the post author's followers
             if is_local_post and new_like and post_author_id:
@@ -229,7 +219,7 @@ def send_comment_like_to_inbox(request):
                     print(traceback.format_exc())
         
         # Update like count
-        like_count = Like.objects.filter(object=existing_comment.id).count()
+        like_count = counters.like_count(existing_comment.id)
         
         # Return a standardized response
         return Response({
@@ -260,8 +250,7 @@ def get_comment_likes(request, author_id, post_serial, comment_fqid):
     """
     try:
         # Find the comment by its fully qualified ID
-        uuid_part = comment_fqid.split('/')[-1]
-        comment = Comment.objects.filter(id__endswith=uuid_part).first()
+        comment = resolver.resolve_comment(comment_fqid)
         
         if not comment:
             return Response({"error": "From comment_like_views: Comment not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -293,29 +282,12 @@ def like_comment(request, author_id, post_id, comment_fqid):
     print(f"like_comment called with author_id={author_id}, post_id={post_id}, comment_id={comment_fqid}")
     
     try:
-        # Try to match by UUID part only
-        uuid_part = comment_fqid.split('/')[-1] 
-        print(f"Looking for comment with UUID part: {uuid_part}")
-        
-        # Try direct lookup first
-        comment = None
-        try:
-            comment = Comment.objects.get(id__endswith=uuid_part)
-            print(f"Found comment directly: {comment.id}")
-        except Comment.DoesNotExist:
-            # Try more flexible lookup
-            comments = Comment.objects.filter(id__contains=uuid_part)
-            if comments.exists():
-                comment = comments.first()
-                print(f"Found comment with contains: {comment.id}")
-            else:
-                print(f"No comment found containing: {uuid_part}")
-                # Check all comment IDs to help debug
-                all_comments = Comment.objects.all()
-                print(f"All comment IDs in database:")
-                for c in all_comments:
-                    print(f"  - {c.id}")
-                return Response({"error": "Comment not found"}, status=status.HTTP_404_NOT_FOUND)
+        # Exact id, then the indexed serial; see resolver.py
+        comment = resolver.resolve_comment(comment_fqid)
+        if comment is None:
+            print(f"No comment found for: {comment_fqid}")
+            return Response({"error": "Comment not found"}, status=status.HTTP_404_NOT_FOUND)
+        print(f"Found comment: {comment.id}")
         
         # Get the current user's author profile
         liker = Author.objects.get(user=request.user)
@@ -344,7 +316,7 @@ def like_comment(request, author_id, post_id, comment_fqid):
             like_to_inbox(comment, new_like)
         
         # Update like count
-        like_count = Like.objects.filter(object=comment.id).count()
+        like_count = counters.like_count(comment.id)
         print(f"Updated like count: {like_count}")
         
         # Return a standardized response
@@ -398,20 +370,13 @@ def like_to_inbox(comment, like):
             "object": comment.id
         }
 
-        # Send the post to the recipient's inbox
-        response = requests.post(
-            inbox_url,
-            json=like_data,
-            auth=(post_node.auth_username, post_node.auth_password),
-            headers={"Content-Type": "application/json"},
-            timeout=5
-        )
-        response.raise_for_status()
-        print(f"Successfully sent like to {comment.author.id}")
+        # Queue the like for the comment author's inbox
+        outbox.enqueue(post_node, inbox_url, like_data)
+        print(f"Queued like for {comment.author.id}")
 
     except Node.DoesNotExist:
         print(f"Node does not exist for host: {comment.author.host}. May have been removed.")
         pass
     except Exception as e:
-        print(f"Failed to send like to {comment.author.id}: {str(e)}")
+        print(f"Failed to queue like for {comment.author.id}: {str(e)}")
         pass
@@ -4,6 +4,7 @@ from rest_framework.authentication import SessionAuthentication
 from rest_framework.response import Response
 from .models import Post, Author, Comment, Node
 from .serializers import CommentSerializer
+from .pagination import InvalidCursor, next_link, page_params, paginate, window
 from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
 from django.http import Http404
@@ -12,8 +13,13 @@ import uuid
 from datetime import datetime
 from .authentication import NodeBasicAuthentication
 from .distribution_utils import distribute_comments
+from . import outbox
+from . import resolver
 import traceback
 
+# Default page size for the comment list endpoints
+COMMENTS_LIST_SIZE = 50
+
 
 @api_view(['GET', 'POST'])
 @authentication_classes([NodeBasicAuthentication, SessionAuthentication])
@@ -38,8 +44,10 @@ def get_post_comments(request, author_id, post_serial):
 
         # Might also need to use post_fqid in the future, idk
         if request.method == 'GET':
-            # Get all comments for this post
-            comments = Comment.objects.filter(post=post_id)
+            # Get one page (?page=&size=) of comments for this post
+            page_number, size = page_params(request, COMMENTS_LIST_SIZE)
+            comments, count = window(
+                Comment.objects.filter(post=post_id).select_related('author').order_by('-published'), page_number, size)
             
             # Serialize the comments
             serializer = CommentSerializer(comments, many=True)
@@ -47,8 +55,9 @@ def get_post_comments(request, author_id, post_serial):
             # Return the comments object as specified in the API
             return Response({
                 "type": "comments",
-                "page": 1,
-                "size": len(comments),
+                "page": page_number,
+                "size": size,
+                "count": count,
                 "post": post_id,
                 "id": f"http://{request.get_host()}/social/api/authors/{author_id}/posts/{post_serial}/comments",
                 "comments": serializer.data
@@ -334,27 +343,18 @@ def comment_to_inbox(post, comment, author):
             "post": comment.post
         }
 
-        # Send the post to the recipient's inbox
+        # Queue the comment for the recipient's inbox
         print(f"INDOX URL: {inbox_url}")
         print("sent comment is:",comment_data)
         print(f"NODE AUTH INFO: {post_node.auth_username}   {post_node.auth_password}")
-        response = requests.post(
-            inbox_url,
-            json=comment_data,
-            auth=(post_node.auth_username, post_node.auth_password),
-            headers={"Content-Type": "application/json"},
-            timeout=5
-        )
-        print(response.status_code)
-        print(response.json())
-        response.raise_for_status()
-        print(f"Successfully sent comment to {post.author.id}")
+        outbox.enqueue(post_node, inbox_url, comment_data)
+        print(f"Queued comment for {post.author.id}")
 
     except Node.DoesNotExist:
         print(f"Node does not exist for host: {post.author.host}. May have been removed.")
         pass
     except Exception as e:
-        print(f"Failed to send comment to {post.author.id}: {str(e)}")
+        print(f"Failed to queue comment for {post.author.id}: {str(e)}")
         pass
 
 
@@ -367,8 +367,10 @@ def get_comments_by_post_fqid(request, post_fqid):
         # The post_fqid is the full URL of the post
         post = Post.objects.get(id=post_fqid)
         
-        # Get all comments for this post
-        comments = Comment.objects.filter(post=post_fqid)
+        # Get one page (?page=&size=) of comments for this post
+        page_number, size = page_params(request, COMMENTS_LIST_SIZE)
+        comments, count = window(
+            Comment.objects.filter(post=post_fqid).select_related('author').order_by('-published'), page_number, size)
         
         # Serialize the comments
         serializer = CommentSerializer(comments, many=True)
@@ -376,8 +378,9 @@ def get_comments_by_post_fqid(request, post_fqid):
         # Return the comments object
         return Response({
             "type": "comments",
-            "page": 1,
-            "size": len(comments),
+            "page": page_number,
+            "size": size,
+            "count": count,
             "post": post_fqid,
             "id": f"http://{request.get_host()}/social/api/posts/{post_fqid}/comments",
             "comments": serializer.data
@@ -391,12 +394,10 @@ def get_specific_comment(request, author_id, post_serial, remote_comment_fqid):
     Get a specific comment by its fully qualified ID
     """
     try:
-        # URL decode the comment ID if necessary
-        # from urllib.parse import unquote
-        # comment_id = unquote(remote_comment_fqid)
-        
-        # Get the comment by its ID
-        comment = Comment.objects.get(id=remote_comment_fqid)
+        # Get the comment by its ID, in any accepted form
+        comment = resolver.resolve_comment(remote_comment_fqid)
+        if comment is None:
+            raise Comment.DoesNotExist
         
         # Serialize the comment
         serializer = CommentSerializer(comment)
@@ -474,6 +475,22 @@ class CommentLikeView(APIView):
             return Response({"error": "Author not found"}, status=status.HTTP_404_NOT_FOUND)
         
 
+def author_comments_response(request, author):
+    """Returns one page (?cursor= or ?page=&size=) of the comments made by `author`."""
+    try:
+        comments, next_cursor = paginate(request, Comment.objects.filter(author=author).select_related('author'))
+    except InvalidCursor:
+        return Response({"error": "Invalid pagination parameters"}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = CommentSerializer(comments, many=True)
+    return Response({
+        "type": "comments",
+        "id": f"{author.id}/commented",
+        "next": next_link(request, next_cursor),
+        "comments": serializer.data
+    })
+
+
 @api_view(['GET', 'POST'])
 def get_author_comments(request, author_id):
     """
@@ -488,14 +505,7 @@ def get_author_comments(request, author_id):
         author = Author.objects.get(id=author_url)
         
         if request.method == 'GET':
-            # Get all comments by this author
-            comments = Comment.objects.filter(author=author)
-            
-            # Serialize the comments
-            serializer = CommentSerializer(comments, many=True)
-            
-            # Return the comments
-            return Response(serializer.data)
+            return author_comments_response(request, author)
             
         elif request.method == 'POST':
             # Check if the request data is a comment
@@ -537,14 +547,7 @@ def get_author_comments_by_fqid(request, author_fqid):
         # Find the author by FQID
         author = Author.objects.get(id=author_fqid)
         
-        # Get all comments by this author
-        comments = Comment.objects.filter(author=author)
-        
-        # Serialize the comments
-        serializer = CommentSerializer(comments, many=True)
-        
-        # Return the comments
-        return Response(serializer.data)
+        return author_comments_response(request, author)
         
     except Author.DoesNotExist:
         return Response({"error": "Author not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -558,39 +561,13 @@ def get_specific_comment_by_serial(request, author_id, comment_serial):
         # Print debug information
         print(f"Looking for comment: author_id={author_id}, comment_serial={comment_serial}")
         
-        # Try multiple formats to find the comment
-        possible_ids = [
-            f"http://{request.get_host()}/api/authors/{author_id}/commented/{comment_serial}",
-            f"http://localhost:8000/api/authors/{author_id}/commented/{comment_serial}"
-        ]
-        
-        # Try finding the comment by the full IDs
-        comment = None
-        for possible_id in possible_ids:
-            print(f"Trying ID: {possible_id}")
-            try:
-                comment = Comment.objects.get(id=possible_id)
-                print(f"Found comment with ID: {possible_id}")
-                break
-            except Comment.DoesNotExist:
-                continue
-        
-        # If still not found, try by just the UUID part
+        # Exact id on this host, then the indexed serial; see resolver.py
+        comment = resolver.resolve_comment(
+            f"http://{request.get_host()}/social/api/authors/{author_id}/commented/{comment_serial}"
+        )
         if not comment:
-            print(f"Trying to find by UUID part: {comment_serial}")
-            comments = Comment.objects.filter(id__endswith=comment_serial)
-            
-            if comments.exists():
-                comment = comments.first()
-                print(f"Found comment with ID ending with: {comment_serial}")
-            else:
-                # Print all comment IDs for debugging
-                all_comments = Comment.objects.all()
-                print("All comment IDs in database:")
-                for c in all_comments:
-                    print(f"  - {c.id}")
-                    
-                return Response({"error": "Comment not found"}, status=status.HTTP_404_NOT_FOUND)
+            print(f"Comment not found: {comment_serial}")
+            return Response({"error": "Comment not found"}, status=status.HTTP_404_NOT_FOUND)
         
         # Serialize and return the comment
         serializer = CommentSerializer(comment)
@@ -606,8 +583,10 @@ def get_comment_by_fqid(request, comment_fqid):
     Get a specific comment by its fully qualified ID
     """
     try:
-        # Find the comment by its FQID
-        comment = Comment.objects.get(id=comment_fqid)
+        # Find the comment by its FQID, in any accepted form
+        comment = resolver.resolve_comment(comment_fqid)
+        if comment is None:
+            raise Comment.DoesNotExist
         
         # Serialize and return the comment
         serializer = CommentSerializer(comment)
@@ -1,7 +1,33 @@
 import traceback
-import requests
 from django.conf import settings
 from .models import Author, Post, FollowRequest, Inbox, Like, Comment, Node, Follow
+from . import fqid
+from . import node_registry
+from . import outbox
+
+
+def plan_fan_out(recipient_ids):
+    """
+    Groups remote recipient author IDs by the Node that hosts them.
+    Returns {node: [inbox_url, ...]}, looking each host up once in the node
+    registry and skipping hosts with no enabled Node.
+    """
+    urls_by_host = {}
+    for recipient_id in recipient_ids:
+        parsed = fqid.parse(recipient_id)
+        if parsed is None or parsed.author_serial is None:
+            continue
+        urls_by_host.setdefault(parsed.api_root, []).append(fqid.inbox_url(recipient_id))
+
+    plan = {}
+    for host, inbox_urls in urls_by_host.items():
+        node = node_registry.by_host(host)
+        if not node or not node.enabled:
+            print(f"From distribution_utils: No enabled node for host {host}, skipping {len(inbox_urls)} recipients")
+            continue
+        plan[node] = inbox_urls
+    return plan
+
 
 def distribute_likes(like_obj, data, content_author_id):
     try:
@@ -16,9 +42,8 @@ def distribute_likes(like_obj, data, content_author_id):
         liker_id = liker['id']
         
         # Extract liker's host to skip followers from the same host
-        liker_host = None
-        if '//' in liker_id:
-            liker_host = liker_id.split('//')[1].split('/')[0]
+        liker_host = fqid.host_of(liker_id) or None
+        if liker_host:
             print(f"From distribution_utils: Liker host is: {liker_host}")
         
         # Get local and remote followers using the content author's properties
@@ -27,18 +52,17 @@ def distribute_likes(like_obj, data, content_author_id):
         
         print(f"From distribution_utils: Found {len(remote_follower_ids)} remote followers")
         
-        # Process remote followers
+        # Process remote followers; deliveries are collected and queued once
+        targets = []
         for follower_id in remote_follower_ids:
             try:
                 # Skip if this is the original liker
-                if liker_id == follower_id:
+                if fqid.canonical(liker_id) == fqid.canonical(follower_id):
                     print(f"From distribution_utils: Skipping original liker: {follower_id}")
                     continue
                 
                 # Extract follower's host
-                follower_host = None
-                if '//' in follower_id:
-                    follower_host = follower_id.split('//')[1].split('/')[0]
+                follower_host = fqid.host_of(follower_id) or None
                 
                 # Skip if follower is on the same host as the liker
                 if liker_host and follower_host and liker_host == follower_host:
@@ -48,42 +72,26 @@ def distribute_likes(like_obj, data, content_author_id):
                 print(f"From distribution_utils: Processing remote follower: {follower_id}")
                 
                 # Find the node for this follower
-                node = None
-                if follower_host:
-                    if follower_host[-1] != "/":
-                        node = Node.objects.filter(base_url__contains=(follower_host+"/")).first()
-                    else:
-                        node = Node.objects.filter(base_url__contains=follower_host).first()
+                node = node_registry.by_host(follower_host) if follower_host else None
                 
                 if not node:
                     print(f"From distribution_utils: No node found for remote follower: {follower_id}")
                     continue
                 
                 # Construct the inbox URL
-                inbox_url = f"{follower_id}/inbox"
-                if inbox_url.endswith('//inbox'):
-                    inbox_url = inbox_url.replace('//inbox', '/inbox')
+                inbox_url = fqid.inbox_url(follower_id)
                 
-                print(f"From distribution_utils: Sending like to remote follower: {follower_id} at {inbox_url}")
+                print(f"From distribution_utils: Adding remote follower: {follower_id} at {inbox_url}")
                 
-                # Send HTTP request to the follower's inbox
-                response = requests.post(
-                    inbox_url,
-                    json=data,
-                    auth=(node.auth_username, node.auth_password),
-                    headers={"Content-Type": "application/json"},
-                    timeout=5
-                )
-                
-                if response.status_code >= 400:
-                    print(f"From distribution_utils: Error sending like to {follower_id}'s inbox: {response.status_code}")
-                else:
-                    print(f"From distribution_utils: Successfully sent like to {follower_id}'s inbox")
+                targets.append((node, inbox_url))
         
             except Exception as e:
                 print(f"From distribution_utils: Error processing remote follower {follower_id}: {str(e)}")
                 traceback.print_exc()
                 continue
+
+        # Serialize the payload once and queue it for every remote follower
+        outbox.enqueue_many(targets, data)
                 
     except Exception as e:
         print(f"From distribution_utils: Exception in distribute_likes: {str(e)}")
@@ -106,14 +114,8 @@ def distribute_comments(comment_obj, data, content_author_id):
         print("From distribution_utils: Commenter Id is ", commenter_id)
         
         # Extract commenter's host to skip followers from the same host
-        commenter_host = None
-        if '//' in commenter_id:
-            commenter_host = commenter_id.split('//')[1].split('/')[0]
-            if commenter_host.endswith(':80'):
-                commenter_host = commenter_host[:-3]
-            # Remove port number if present
-            if ':' in commenter_host:
-                commenter_host = commenter_host.split(':')[0]
+        commenter_host = fqid.host_of(commenter_id) or None
+        if commenter_host:
             print(f"From distribution_utils: Commenter host is: {commenter_host}")
         
         # Get local and remote followers using the content author's properties
@@ -122,24 +124,18 @@ def distribute_comments(comment_obj, data, content_author_id):
         
         print(f"From distribution_utils: Found {len(remote_follower_ids)} remote followers")
         
-        # Process remote followers
+        # Process remote followers; deliveries are collected and queued once
+        targets = []
         for follower_id in remote_follower_ids:
             print("follower_id", follower_id)
             try:
                 # Skip if this is the original commenter
-                if commenter_id == follower_id:
+                if fqid.canonical(commenter_id) == fqid.canonical(follower_id):
                     print(f"From distribution_utils: Skipping original commenter: {follower_id}")
                     continue
                 
                 # Extract follower's host
-                follower_host = None
-                if '//' in follower_id:
-                    follower_host = follower_id.split('//')[1].split('/')[0]
-                    if follower_host.endswith(':80'):
-                        follower_host = follower_host[:-3]
-                    # Remove port number if present
-                    if ':' in follower_host:
-                        follower_host = follower_host.split(':')[0]
+                follower_host = fqid.host_of(follower_id) or None
                 
                 print(f"From distribution_utils: Follower host is: {follower_host}")
                 
@@ -153,38 +149,25 @@ def distribute_comments(comment_obj, data, content_author_id):
                 print(f"From distribution_utils: Processing remote follower: {follower_id}")
                 
                 # Find the node for this follower
-                node = None
-                if follower_host:
-                    node = Node.objects.filter(base_url__contains=follower_host).first()
+                node = node_registry.by_host(follower_host) if follower_host else None
                 
                 if not node:
                     print(f"No node found for remote follower: {follower_id}")
                     continue
                 
                 # Construct the inbox URL
-                inbox_url = f"{follower_id}/inbox"
-                if inbox_url.endswith('//inbox'):
-                    inbox_url = inbox_url.replace('//inbox', '/inbox')
-                
-                print(f"From distribution_utils: Sending comment to remote follower: {follower_id} at {inbox_url}")
+                inbox_url = fqid.inbox_url(follower_id)
                 
-                # Send HTTP request to the follower's inbox
-                response = requests.post(
-                    inbox_url,
-                    json=data,
-                    auth=(node.auth_username, node.auth_password),
-                    headers={"Content-Type": "application/json"},
-                    timeout=10
-                )
+                print(f"From distribution_utils: Adding remote follower: {follower_id} at {inbox_url}")
                 
-                if response.status_code >= 400:
-                    print(f"Error sending comment to {follower_id}'s inbox: {response.status_code}")
-                else:
-                    print(f"Successfully sent comment to {follower_id}'s inbox")
+                targets.append((node, inbox_url))
         
             except Exception as e:
                 print(f"Error processing remote follower {follower_id}: {str(e)}")
                 continue
+
+        # Serialize the payload once and queue it for every remote follower
+        outbox.enqueue_many(targets, data)
         
                 
     except Exception as e:
@@ -213,9 +196,8 @@ def distribute_comment_likes(like_obj, data, content_author_id):
         liker_id = liker['id']
         
         # Extract liker's host to skip followers from the same host
-        liker_host = None
-        if '//' in liker_id:
-            liker_host = liker_id.split('//')[1].split('/')[0]
+        liker_host = fqid.host_of(liker_id) or None
+        if liker_host:
             print(f"Liker host is: {liker_host}")
         
         # Get local and remote followers using the content author's properties
@@ -224,18 +206,17 @@ def distribute_comment_likes(like_obj, data, content_author_id):
         
         print(f"Found {len(remote_follower_ids)} remote followers")
         
-        # Process remote followers
+        # Process remote followers; deliveries are collected and queued once
+        targets = []
         for follower_id in remote_follower_ids:
             try:
                 # Skip if this is the original liker
-                if liker_id == follower_id:
+                if fqid.canonical(liker_id) == fqid.canonical(follower_id):
                     print(f"Skipping original liker: {follower_id}")
                     continue
                 
                 # Extract follower's host
-                follower_host = None
-                if '//' in follower_id:
-                    follower_host = follower_id.split('//')[1].split('/')[0]
+                follower_host = fqid.host_of(follower_id) or None
                 
                 # Skip if follower is on the same host as the liker
                 if liker_host and follower_host and liker_host == follower_host:
@@ -245,39 +226,26 @@ def distribute_comment_likes(like_obj, data, content_author_id):
                 print(f"Processing remote follower: {follower_id}")
                 
                 # Find the node for this follower
-                node = None
-                if follower_host:
-                    node = Node.objects.filter(base_url__contains=follower_host).first()
+                node = node_registry.by_host(follower_host) if follower_host else None
                 
                 if not node:
                     print(f"No node found for remote follower: {follower_id}")
                     continue
                 
                 # Construct the inbox URL
-                inbox_url = f"{follower_id}/inbox"
-                if inbox_url.endswith('//inbox'):
-                    inbox_url = inbox_url.replace('//inbox', '/inbox')
-                
-                print(f"Sending comment like to remote follower: {follower_id} at {inbox_url}")
+                inbox_url = fqid.inbox_url(follower_id)
                 
-                # Send HTTP request to the follower's inbox
-                response = requests.post(
-                    inbox_url,
-                    json=data,
-                    auth=(node.auth_username, node.auth_password),
-                    headers={"Content-Type": "application/json"},
-                    timeout=5
-                )
+                print(f"Adding remote follower: {follower_id} at {inbox_url}")
                 
-                if response.status_code >= 400:
-                    print(f"Error sending comment like to {follower_id}'s inbox: {response.status_code}")
-                else:
-                    print(f"Successfully sent comment like to {follower_id}'s inbox")
+                targets.append((node, inbox_url))
         
             except Exception as e:
                 print(f"Error processing remote follower {follower_id}: {str(e)}")
                 traceback.print_exc()
                 continue
+
+        # Serialize the payload once and queue it for every remote follower
+        outbox.enqueue_many(targets, data)
                 
     except Exception as e:
         print(f"Exception in distribute_comment_likes: {str(e)}")
@@ -0,0 +1,219 @@
+"""
+Shared HTTP client for node-to-node calls.
+
+Keeps one pooled keep-alive requests.Session per Node.base_url (authenticated
+with that node's credentials), applies the same timeout and retry policy to
+every call, and records per-node request metrics.
+
+Sessions and metrics are per process, so each gunicorn worker keeps its own.
+Every process copies its metrics to the shared cache from time to time
+(publish_metrics: after requests in web workers, after each batch in
+run_outbox), and shared_metrics() sums them for api/nodes/metrics/.
+"""
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+TIMEOUT = getattr(settings, "FEDERATION_TIMEOUT", (3.05, 10))
+POOL_SIZE = getattr(settings, "FEDERATION_POOL_SIZE", 10)
+RETRIES = getattr(settings, "FEDERATION_RETRIES", 2)
+
+JSON_HEADERS = {"Content-Type": "application/json", "Accept": "application/json"}
+
+# Nodes that accept batched inbox deliveries (see inbox_batch.py) name the
+# endpoint in this header on their inbox responses.
+BATCH_INBOX_HEADER = "X-Inbox-Batch"
+BATCH_TYPES = ("follow", "like", "comment", "post")
+MAX_BATCH_SIZE = getattr(settings, "FEDERATION_MAX_BATCH_SIZE", 100)
+
+METRICS_PUBLISH_SECONDS = getattr(settings, "FEDERATION_METRICS_PUBLISH_SECONDS", 10)
+# A process that stops publishing (it exited) drops out of the totals after this long
+METRICS_TTL = getattr(settings, "FEDERATION_METRICS_TTL", 24 * 60 * 60)
+METRICS_INDEX_KEY = "federation_metrics:processes"
+
+_lock = threading.Lock()
+_sessions = {}
+_metrics = defaultdict(lambda: {"requests": 0, "errors": 0, "total_ms": 0.0, "last_status": None, "last_at": 0.0})
+_dirty = False
+_published_at = 0.0
+
+
+def _retry_policy():
+    # Connection failures are retried for every method since nothing reached the
+    # peer. 502/503/504 are only retried for idempotent methods, so an inbox
+    # POST is never delivered twice by the client itself.
+    return Retry(
+        total=RETRIES,
+        connect=RETRIES,
+        read=0,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}),
+        raise_on_status=False,
+    )
+
+
+def _new_session(auth=None):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=_retry_policy())
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(JSON_HEADERS)
+    session.auth = auth
+    return session
+
+
+def session_for(node=None):
+    """
+    Returns the pooled Session for `node`, creating it on first use.
+    Passing None returns an unauthenticated shared session.
+    If the node's credentials changed since the session was created, the
+    cached auth is refreshed.
+    """
+    key = node.base_url if node else None
+    auth = (node.auth_username, node.auth_password) if node else None
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = _new_session(auth)
+        elif session.auth != auth:
+            session.auth = auth
+    return session
+
+
+def request(node, method, url, **kwargs):
+    """
+    Sends a request through the node's pooled session with the default timeout.
+    Exceptions from requests propagate to the caller, as with requests.request.
+    """
+    kwargs.setdefault("timeout", TIMEOUT)
+    key = node.base_url if node else "(no node)"
+    started = time.monotonic()
+    try:
+        response = session_for(node).request(method, url, **kwargs)
+    except requests.RequestException:
+        _record(key, started, None, error=True)
+        raise
+    _record(key, started, response.status_code, error=response.status_code >= 400)
+    return response
+
+
+def get(node, url, **kwargs):
+    return request(node, "GET", url, **kwargs)
+
+
+def post(node, url, **kwargs):
+    return request(node, "POST", url, **kwargs)
+
+
+def put(node, url, **kwargs):
+    return request(node, "PUT", url, **kwargs)
+
+
+def delete(node, url, **kwargs):
+    return request(node, "DELETE", url, **kwargs)
+
+
+def _record(key, started, status_code, error):
+    global _dirty
+    elapsed_ms = (time.monotonic() - started) * 1000
+    with _lock:
+        stats = _metrics[key]
+        stats["requests"] += 1
+        stats["errors"] += int(error)
+        stats["total_ms"] += elapsed_ms
+        stats["last_status"] = status_code
+        stats["last_at"] = time.time()
+        _dirty = True
+
+
+def _summary(stats):
+    return {
+        "requests": stats["requests"],
+        "errors": stats["errors"],
+        "avg_ms": round(stats["total_ms"] / stats["requests"], 1) if stats["requests"] else 0.0,
+        "last_status": stats["last_status"],
+    }
+
+
+def metrics():
+    """Returns a snapshot of this process's per-node counters: requests, errors, avg_ms, last_status."""
+    with _lock:
+        return {key: _summary(stats) for key, stats in _metrics.items()}
+
+
+def _process_key():
+    # Read on every call: gunicorn forks workers after this module is imported
+    return f"federation_metrics:{socket.gethostname()}:{os.getpid()}"
+
+
+def publish_metrics(force=False):
+    """
+    Copies this process's counters to the shared cache if they changed, at most
+    once every METRICS_PUBLISH_SECONDS unless `force`. The cache may be the
+    database, so call it from a request or the worker loop, never from the
+    delivery threads. Returns True if it wrote.
+    """
+    global _dirty, _published_at
+    with _lock:
+        if not force and (not _dirty or time.monotonic() - _published_at < METRICS_PUBLISH_SECONDS):
+            return False
+        snapshot = {key: dict(stats) for key, stats in _metrics.items()}
+        _dirty = False
+        _published_at = time.monotonic()
+    key = _process_key()
+    try:
+        cache.set(key, snapshot, METRICS_TTL)
+        processes = cache.get(METRICS_INDEX_KEY) or []
+        if key not in processes:
+            cache.set(METRICS_INDEX_KEY, processes + [key], None)
+    except Exception as e:
+        print(f"From federation: Could not publish metrics: {e}")
+        return False
+    return True
+
+
+def shared_metrics():
+    """
+    Returns per-node counters summed over every process that published them (web
+    workers and run_outbox), in the shape of metrics(). last_status is the most
+    recent one in any process.
+    """
+    publish_metrics(force=True)
+    processes = cache.get(METRICS_INDEX_KEY) or []
+    snapshots = cache.get_many(processes)
+    if len(snapshots) < len(processes):
+        # Expired entries belong to processes that exited
+        cache.set(METRICS_INDEX_KEY, [key for key in processes if key in snapshots], None)
+    totals = {}
+    for snapshot in snapshots.values():
+        for node_key, stats in snapshot.items():
+            total = totals.setdefault(node_key, {"requests": 0, "errors": 0, "total_ms": 0.0,
+                                                 "last_status": None, "last_at": 0.0})
+            total["requests"] += stats["requests"]
+            total["errors"] += stats["errors"]
+            total["total_ms"] += stats["total_ms"]
+            if stats["last_at"] >= total["last_at"]:
+                total["last_status"] = stats["last_status"]
+                total["last_at"] = stats["last_at"]
+    return {key: _summary(stats) for key, stats in totals.items()}
+
+
+def reset():
+    """Closes all pooled sessions and clears metrics (used by tests)."""
+    global _dirty, _published_at
+    with _lock:
+        _dirty = False
+        _published_at = 0.0
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _metrics.clear()
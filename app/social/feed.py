@@ -0,0 +1,61 @@
+"""
+Builds pages of posts for the stream and profile pages.
+
+Posts are fetched without their content column (see PostQuerySet.previews);
+media is loaded by the browser from the image and video endpoints. The page is
+sliced first, then comments and the viewer's likes for just those posts are
+loaded with one query each, so rendering a page costs the same number of queries
+however many posts the viewer can see. Like and comment counts are the
+denormalized columns maintained by counters.py.
+"""
+from collections import defaultdict
+
+from django.core.paginator import Paginator
+
+from .models import Comment, Like
+
+PAGE_SIZE = 10
+
+
+def get_feed_page(post_list, viewer, page_number, per_page=PAGE_SIZE):
+    """
+    Paginates `post_list` and decorates the posts on the requested page for `viewer`
+    (an Author, or None when anonymous). Returns the Page.
+    """
+    if hasattr(post_list, 'previews'):
+        post_list = post_list.previews()
+    if hasattr(post_list, 'select_related'):
+        post_list = post_list.select_related('author')
+    page = Paginator(post_list, per_page).get_page(page_number)
+    page.object_list = decorate_posts(page.object_list, viewer)
+    return page
+
+
+def decorate_posts(posts, viewer):
+    """
+    Sets the attributes _post_list.html renders on each post and its comments:
+      - post.comment_list, post.is_liked
+      - comment.is_liked
+    Returns the posts as a list.
+    """
+    posts = list(posts)
+    if not posts:
+        return posts
+
+    comments_by_post = defaultdict(list)
+    for comment in Comment.objects.filter(post__in=[post.id for post in posts]).select_related('author'):
+        comments_by_post[comment.post].append(comment)
+
+    object_ids = [post.id for post in posts]
+    object_ids += [comment.id for comments in comments_by_post.values() for comment in comments]
+
+    liked = set()
+    if viewer is not None:
+        liked = set(Like.objects.filter(author=viewer, object__in=object_ids).values_list('object', flat=True))
+
+    for post in posts:
+        post.comment_list = comments_by_post.get(post.id, [])
+        post.is_liked = post.id in liked
+        for comment in post.comment_list:
+            comment.is_liked = comment.id in liked
+    return posts
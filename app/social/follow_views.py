@@ -10,8 +10,7 @@ import requests
 from django.db import transaction
 import json
 from django.http import JsonResponse
-from .models import Follow, Author, FollowRequest, Inbox, Node
-from requests.auth import HTTPBasicAuth
+from .models import Follow, Author, FollowRequest, Node
 from .utils import get_base_url 
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
@@ -19,6 +18,12 @@ from rest_framework.authentication import BasicAuthentication, SessionAuthentica
 from django.db import transaction
 from urllib.parse import urljoin
 from .authentication import NodeBasicAuthentication
+from . import outbox
+from . import federation
+from . import inbox_service
+from . import node_registry
+from .friendships import friends_of
+from .pagination import InvalidCursor, next_link, paginate
 
 
 
@@ -40,8 +45,6 @@ def fetch_remote_authors_view(request):
         # Find the Node object that matches the requested node_url
         try:
             node = Node.objects.get(base_url=node_url)
-            username = node.auth_username
-            password = node.auth_password
         except Node.DoesNotExist:
             return JsonResponse({"error": f"Node with URL {node_url} not found"}, status=404)
         
@@ -53,12 +56,7 @@ def fetch_remote_authors_view(request):
 
         #print(f"AUTHOR WE ARE: {request.user.author.id}")
         
-        response = requests.get(
-            urljoin(node_url, "authors/"),
-            auth=HTTPBasicAuth(username, password),
-            headers={"Accept": "application/json"},
-            timeout=5
-        )
+        response = federation.get(node, urljoin(node_url, "authors/"))
         
         response.raise_for_status()
         authors_data = response.json()
@@ -174,29 +172,18 @@ def local_follow_finalize(request):
             }
         }
         
-        # Send follow request to remote inbox
+        # Send follow request to remote inbox. This one is sent inline rather than
+        # through the outbox because the local Follow is only created on success.
         inbox_url = f"{followee_id}/inbox/"
         
         print(f"INBOX: {inbox_url}")
         print(f"NODE USER: {remote_node.auth_username}")
         print(f"NODE PASS: {remote_node.auth_password}")
         
-        response = requests.post(
-            inbox_url,
-            json=follow_data,
-            auth=(remote_node.auth_username, remote_node.auth_password),
-            headers={"Content-Type": "application/json"},
-            timeout=10  # Set timeout to avoid hanging requests
-        )
+        response = federation.post(remote_node, inbox_url, json=follow_data)
         if response.status_code not in [200, 201, 202, 204]:
             inbox_url = f"{followee_id}/inbox"
-            response = requests.post(
-                inbox_url,
-                json=follow_data,
-                auth=(remote_node.auth_username, remote_node.auth_password),
-                headers={"Content-Type": "application/json"},
-                timeout=10  # Set timeout to avoid hanging requests
-            )
+            response = federation.post(remote_node, inbox_url, json=follow_data)
         
         
         
@@ -279,17 +266,8 @@ def send_follow_decision_to_inbox(request):
     }
     print("decision_data:", decision_data)
     print(f"INBOX URL: {inbox_url}")
-    response = requests.post(
-        inbox_url,
-        json = decision_data,
-        auth=(node.auth_username, node.auth_password),
-        headers={"Content-Type": "application/json"},
-        timeout=5
-    )
-    print(response.status_code)
-    print(response.json())
-    response.raise_for_status()
-    print(f"Successfully sent follow_decision to {follower_id}'s inbox")
+    outbox.enqueue(node, inbox_url, decision_data)
+    print(f"Queued follow_decision for {follower_id}'s inbox")
     return Response({"message": "Follow decision sent to inbox"}, status=200)
 
 @api_view(["POST"])
@@ -330,15 +308,8 @@ def send_unfollow_to_inbox(request):
     }
     print("Unfollow data:", unfollow_data)
     print(f"INBOX URL: {inbox_url}")
-    response = requests.post(
-        inbox_url,
-        json=unfollow_data,
-        auth=(node.auth_username, node.auth_password),
-        headers={"Content-Type": "application/json"},
-        timeout=5
-    )
-    response.raise_for_status()
-    print(f"Successfully sent unfollow to {followee_id}'s inbox")
+    outbox.enqueue(node, inbox_url, unfollow_data)
+    print(f"Queued unfollow for {followee_id}'s inbox")
     return Response({"message": "Unfollow sent to inbox"}, status=200)
 
 
@@ -350,20 +321,21 @@ class FollowersListView(APIView):
         author_id = unquote(author_id)
         expected_author_id = f"http://{request.get_host()}/social/api/authors/{author_id}"
         author = get_object_or_404(Author, id=expected_author_id)
-        followers = Follow.objects.filter(followee=author)
-        
-        followers_list = []
-        for follow in followers:
-            follower_id = follow.follower_id  # Follower ID
-            # For local authors:
-            try:
-                local_follower = Author.objects.get(id=follower_id)
-                serializer = AuthorSerializer(local_follower)
-                followers_list.append(serializer.data)
-            except Author.DoesNotExist:
-                    continue
+        # One page (?cursor= or ?page=&size=) of follows, in the order they were made
+        try:
+            follows, next_cursor = paginate(request, Follow.objects.filter(followee=author), ordering=('pk',))
+        except InvalidCursor:
+            return Response({"error": "Invalid pagination parameters"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Only local followers are listed; load them in one query
+        followers = Author.objects.in_bulk([follow.follower_id for follow in follows])
+        followers_list = [
+            AuthorSerializer(followers[follow.follower_id]).data
+            for follow in follows if follow.follower_id in followers
+        ]
 
-        return Response({"type": "followers", "items": followers_list}, status=status.HTTP_200_OK)
+        return Response({"type": "followers", "next": next_link(request, next_cursor), "items": followers_list},
+                        status=status.HTTP_200_OK)
 
 
 
@@ -404,10 +376,8 @@ class FollowersListView(APIView):
             Follow.objects.get_or_create(followee=author, follower_id=follower_id)
 
             #  DELETE from inbox (remove request after approval)
-            inbox = Inbox.objects.filter(author=author).first()
-            if inbox:
-                inbox.inbox_follows.remove(follow_request)
-                print(f" Removed follow request from inbox: {follower_id} -> {author_id}")
+            inbox_service.remove(author, follow_request)
+            print(f" Removed follow request from inbox: {follower_id} -> {author_id}")
 
         return Response({"message": "Follow request approved and removed from inbox"}, status=status.HTTP_200_OK)
 
@@ -494,7 +464,8 @@ def follow_view(request):
     print(f"[DEBUG] Authors on host '{self_host}': {[a.displayName for a in authors]}")
     print(request.get_host())
 
-    nodes = Node.objects.filter(enabled=True).exclude(base_url__contains=request.get_host())
+    own_host = node_registry.normalize_host(request.get_host())
+    nodes = [node for node in node_registry.enabled_nodes() if node_registry.normalize_host(node.base_url) != own_host]
 
     return render(request, 'social/follow.html', {
         'authors': authors,
@@ -611,8 +582,8 @@ def friends_view(request):
 
     print(f"Checking friends for: {my_author.displayName} ({my_author_id})")
 
-    # Use the `friends` property from the `Author` model
-    friends = my_author.friends.all()  # QuerySet of mutual followers
+    # Friends come from the materialized Friendship table
+    friends = friends_of(my_author)  # QuerySet of mutual followers
 
     print(f"Found {friends.count()} friends")
 
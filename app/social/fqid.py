@@ -0,0 +1,141 @@
+"""
+Parsing and canonical forms of fully qualified ids (FQIDs).
+
+Authors and their posts, comments and likes are identified across nodes by URLs:
+
+    http://node.com/social/api/authors/5
+    http://node.com/social/api/authors/5/posts/12
+    http://node.com/social/api/authors/5/commented/<uuid>
+
+Peers send the same ids percent-encoded, with a trailing slash, or with a
+differently cased scheme and host. parse() splits any of these into an FQID,
+and canonical() returns the single form stored in id columns, so lookups can
+use exact (indexed) equality. Parses are memoized: the federation paths see
+the same few thousand ids over and over.
+"""
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+
+NODE_IP = getattr(settings, "NODE_IP", None)
+CACHE_SIZE = getattr(settings, "FQID_CACHE_SIZE", 8192)
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+class FQID(namedtuple("FQID", "scheme host port author_serial kind serial path")):
+    """
+    A parsed id. `path` is the API root path before "authors/" (usually
+    "/social/api/"); author_serial, kind and serial are None when absent. kind
+    and serial are the last "<kind>/<serial>" pair after the author, e.g.
+    ("posts", "12"); a trailing single segment such as /inbox or /image is not
+    part of the id.
+    """
+
+    @property
+    def netloc(self):
+        return f"{self.host}:{self.port}" if self.port else self.host
+
+    @property
+    def base_url(self):
+        return f"{self.scheme}://{self.netloc}"
+
+    @property
+    def api_root(self):
+        return f"{self.base_url}{self.path}"
+
+    @property
+    def author_id(self):
+        if self.author_serial is None:
+            return None
+        return f"{self.api_root}authors/{self.author_serial}"
+
+    @property
+    def id(self):
+        if self.kind is None:
+            return self.author_id
+        return f"{self.author_id}/{self.kind}/{self.serial}"
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse(value):
+    """
+    Parses a URL or id into an FQID, or returns None if it is not an absolute
+    http(s) URL. Percent-encoding, surrounding whitespace, trailing slashes and
+    default ports are ignored; scheme and host are lowercased.
+    """
+    text = unquote(str(value or "")).strip()
+    try:
+        parts = urlsplit(text)
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+    if port == DEFAULT_PORTS[scheme]:
+        port = None
+
+    segments = [segment for segment in parts.path.split("/") if segment]
+    if "authors" not in segments:
+        path = "/" + "".join(f"{segment}/" for segment in segments)
+        return FQID(scheme, parts.hostname, port, None, None, None, path)
+
+    at = segments.index("authors")
+    path = "/" + "".join(f"{segment}/" for segment in segments[:at])
+    rest = segments[at + 1:]
+    author_serial = rest[0] if rest else None
+    # Drop an odd trailing segment (/inbox, /image) and keep the last kind/serial pair
+    pairs = rest[1:1 + (len(rest) - 1) // 2 * 2]
+    kind, serial = pairs[-2:] if pairs else (None, None)
+    return FQID(scheme, parts.hostname, port, author_serial, kind, serial, path)
+
+
+def canonical(value):
+    """
+    Returns the canonical form of an id: the parsed id for FQIDs, otherwise the
+    decoded value without surrounding whitespace or trailing slashes.
+    """
+    parsed = parse(value)
+    if parsed is not None and parsed.author_serial is not None:
+        return parsed.id
+    return unquote(str(value or "")).strip().rstrip("/")
+
+
+def author_id(value):
+    """Returns the canonical id of the author that owns `value` (or is `value`), or None."""
+    parsed = parse(value)
+    return parsed.author_id if parsed else None
+
+
+def author_serial(value):
+    """Returns the author serial of a full id, or `value` itself if it is already a bare serial."""
+    parsed = parse(value)
+    if parsed is None or parsed.author_serial is None:
+        return value
+    return parsed.author_serial
+
+
+def serial_of(value):
+    """Returns the last segment of an id's canonical form, e.g. the uuid of a comment id."""
+    return canonical(value).rsplit("/", 1)[-1]
+
+
+def host_of(value):
+    """Returns host[:port] of a URL, lowercased, or "" if it is not a URL."""
+    parsed = parse(value)
+    return parsed.netloc if parsed else ""
+
+
+def inbox_url(author):
+    """Returns the inbox URL of the author `author` (an author id or any id under it)."""
+    return f"{author_id(author) or canonical(author)}/inbox"
+
+
+def is_local(value):
+    """True if `value` is a URL on this node (NODE_IP as host or host:port)."""
+    parsed = parse(value)
+    if not NODE_IP or parsed is None:
+        return False
+    return NODE_IP.lower() in (parsed.host, parsed.netloc)
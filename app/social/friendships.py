@@ -0,0 +1,67 @@
+"""
+Friendship lookups backed by the materialized Friendship table.
+
+A friendship is a pair of mutual Follow rows. Instead of intersecting two Follow
+scans on every request, signals.py calls sync_pair() whenever a Follow is saved
+or deleted, and readers use the indexed edge table.
+"""
+from django.db import transaction
+
+from .models import Author, Follow, Friendship
+
+
+def _author_id(author):
+    return author.id if isinstance(author, Author) else author
+
+
+def are_friends(author, other):
+    """True if the two authors (Author objects or ids) follow each other."""
+    return Friendship.objects.filter(author_id=_author_id(author), friend_id=_author_id(other)).exists()
+
+
+def friends_of(author):
+    """Returns a QuerySet of the authors who are friends with `author`."""
+    return Author.objects.filter(friend_of__author_id=_author_id(author))
+
+
+def friend_ids(author):
+    """Returns the set of friend ids for `author`."""
+    return set(Friendship.objects.filter(author_id=_author_id(author)).values_list('friend_id', flat=True))
+
+
+def sync_pair(author_id, other_id):
+    """
+    Brings the Friendship edges between two authors in line with their Follow rows.
+    """
+    if author_id == other_id:
+        return
+    mutual = (
+        Follow.objects.filter(follower_id=author_id, followee_id=other_id).exists()
+        and Follow.objects.filter(follower_id=other_id, followee_id=author_id).exists()
+    )
+    if mutual:
+        Friendship.objects.bulk_create([
+            Friendship(author_id=author_id, friend_id=other_id),
+            Friendship(author_id=other_id, friend_id=author_id),
+        ], ignore_conflicts=True)
+    else:
+        Friendship.objects.filter(author_id=author_id, friend_id=other_id).delete()
+        Friendship.objects.filter(author_id=other_id, friend_id=author_id).delete()
+
+
+def rebuild():
+    """
+    Recomputes the whole Friendship table from Follow. Returns the number of edges.
+    Used to backfill existing data (see `manage.py rebuild_friendships`).
+    """
+    author_ids = set(Author.objects.values_list('id', flat=True))
+    follows = set(Follow.objects.filter(follower_id__in=author_ids).values_list('follower_id', 'followee_id'))
+    edges = [
+        Friendship(author_id=follower, friend_id=followee)
+        for follower, followee in follows
+        if follower != followee and (followee, follower) in follows
+    ]
+    with transaction.atomic():
+        Friendship.objects.all().delete()
+        Friendship.objects.bulk_create(edges)
+    return len(edges)
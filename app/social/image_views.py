@@ -2,14 +2,17 @@ from rest_framework.decorators import api_view, permission_classes
 from .models import Post, Author
 import requests
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import FileResponse, JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
+from django.utils.cache import patch_vary_headers
 from rest_framework.permissions import AllowAny
 import mimetypes
 from .models import Post
 from urllib.parse import unquote
 import base64
+from . import media_storage
+from . import thumbnails
 
 
 @api_view(['GET'])
@@ -22,7 +25,7 @@ def get_image_with_serial(request, author_serial, post_serial):
     post_fqid = f"{node_name}social/api/authors/{author_serial}/posts/{post_serial}"
     post = get_object_or_404(Post, id=post_fqid)
 
-    return serve_post_image(post)
+    return serve_post_image(request, post)
 
 
 @api_view(['GET'])
@@ -36,16 +39,18 @@ def get_image_with_fqid(request, post_fqid):
     post_fqid = unquote(post_fqid)
     post = get_object_or_404(Post, id=post_fqid)
 
-    return serve_post_image(post)
+    return serve_post_image(request, post)
 
 
-def serve_post_image(post):
+def serve_post_image(request, post):
     """
-    Helper function to serve an image from a Post object where content is stored as base64.
-    Returns the decoded binary image data.
+    Helper function to serve an image from a Post object, whether it is stored as
+    a media file or as legacy base64 content. Streams the binary image data with
+    ETag/Last-Modified validators and Range support; ?w=<width> streams a
+    resized variant instead.
     """
     # Check if the post has content
-    if not post.content:
+    if not media_storage.has_media(post):
         return JsonResponse({"error": "Image not found"}, status=404)
     
     # Check if the post's contentType is an image type
@@ -53,9 +58,6 @@ def serve_post_image(post):
         return JsonResponse({"error": "File is not a valid image"}, status=404)
     
     try:
-        # Decode the base64 content back to binary
-        image_data = base64.b64decode(post.content)
-        
         # Determine the MIME type from the contentType field
         if post.contentType == 'image/png;base64':
             mime_type = 'image/png'
@@ -65,11 +67,45 @@ def serve_post_image(post):
             # Default for application/base64
             mime_type = 'application/octet-stream'
         
-        # Create a response with the binary image data
-        response = HttpResponse(image_data, content_type=mime_type)
-        return response
+        # ?w= serves a downscaled (and, where accepted, WebP) variant; see thumbnails.py
+        width = thumbnails.snap_width(request.GET.get('w'))
+        if width and mime_type != 'application/octet-stream':
+            response = serve_variant(request, post, width)
+            if response is not None:
+                return response
+
+        # Stream the stored file (or decoded legacy base64 content)
+        return media_storage.media_response(request, post, mime_type)
     
     except base64.binascii.Error:
         return JsonResponse({"error": "Invalid base64 data"}, status=400)
     except Exception as e:
         return JsonResponse({"error": f"Error processing image: {str(e)}"}, status=500)
+
+
+def serve_variant(request, post, width):
+    """
+    Streams the post's image resized to `width`, rendering it into the variant
+    cache on first request. Returns None if no variant can be made, so the
+    caller falls back to the original.
+    """
+    found = thumbnails.variant(post, width, request.META.get('HTTP_ACCEPT', ''))
+    if found is None:
+        return None
+    path, etag, mime_type = found
+    # The cache file's mtime is its LRU clock, so validators follow the source media
+    last_modified = media_storage.media_last_modified(post)
+    response = media_storage.file_response(request, lambda: open(path, 'rb'), etag, last_modified, mime_type)
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_image_with_internal_id(request, internal_id):
+    '''
+    Returns a post's image as binary given its internal id (used by the HTML pages)
+    '''
+    post = get_object_or_404(Post, internal_id=internal_id)
+
+    return serve_post_image(request, post)
@@ -0,0 +1,348 @@
+"""
+Batched inbox delivery from peer nodes.
+
+A node with many activities for our authors can POST them to
+/social/api/inbox/batch in one request instead of one inbox POST each:
+
+    {"type": "batch", "items": [{"to": "<recipient author id>", "activity": {...}}, ...]}
+
+Follow, like, comment and post activities are accepted (federation.BATCH_TYPES);
+anything else still goes to the author's own inbox. All entries are validated
+first, the remote authors they reference are upserted in one statement, the
+new rows are written with bulk_create and the inbox items with one insert.
+The response holds one result per entry, in request order.
+"""
+import traceback
+
+from django.db import IntegrityError, transaction
+from django.db.models.signals import post_save
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import fqid
+from . import inbox_dedup
+from . import inbox_service
+from . import media_storage
+from . import node_registry
+from .distribution_utils import distribute_comment_likes, distribute_comments, distribute_likes
+from .federation import BATCH_TYPES
+from .models import Author, Comment, FollowRequest, Like, Node, Post
+
+AUTHOR_FIELDS = ["host", "displayName", "github", "profileImage", "page"]
+REQUIRED_FIELDS = {
+    "follow": ("actor",),
+    "like": ("id", "object", "author"),
+    "comment": ("id", "comment", "post", "author"),
+    "post": ("id", "author"),
+}
+
+
+def recipient_id(to):
+    """Accepts a recipient's author id or inbox URL and returns the author id."""
+    return fqid.author_id(to) or fqid.canonical(to)
+
+
+def _result(index, activity, status, error=""):
+    result = {"index": index, "status": status, "id": activity.get("id") if isinstance(activity, dict) else None}
+    if error:
+        result["error"] = error
+    return result
+
+
+def _check(entry):
+    """Returns (recipient id, item type, activity, author data) or raises ValueError."""
+    if not isinstance(entry, dict) or not isinstance(entry.get("activity"), dict):
+        raise ValueError("Each item needs a 'to' and an 'activity' object")
+    activity = entry["activity"]
+    kind = str(activity.get("type", "")).lower()
+    if kind not in BATCH_TYPES:
+        raise ValueError(f"Type {activity.get('type')!r} is not accepted in a batch; send it to the author's inbox")
+
+    actor = activity.get("actor" if kind == "follow" else "author")
+    missing = [field for field in REQUIRED_FIELDS[kind] if not activity.get(field)]
+    if not missing and not (isinstance(actor, dict) and actor.get("id")):
+        missing.append("actor.id" if kind == "follow" else "author.id")
+    if missing:
+        raise ValueError(f"Missing required {kind} fields: {', '.join(missing)}")
+    return recipient_id(entry.get("to")), kind, activity, actor
+
+
+def _author(data):
+    """Builds an unsaved Author from an activity's author or actor object."""
+    return Author(
+        id=fqid.canonical(data["id"]),
+        host=data.get("host") or "",
+        displayName=data.get("displayName") or "",
+        github=data.get("github") or "",
+        profileImage=data.get("profileImage") or "",
+        page=data.get("page") or "",
+    )
+
+
+def _published(activity):
+    return parse_datetime(str(activity.get("published") or "")) or timezone.now()
+
+
+def ingest(entries, sender=None):
+    """
+    Stores a batch of inbox deliveries from `sender` (the authenticated Node) and
+    returns one result per entry: {"index", "status", "id"} plus "error" when the
+    entry was rejected. Status is 201 for a new object, 200 for one we already
+    had, and 400/403/404 as the single-item inbox would answer. Entries already
+    delivered with the same body get their first status and "duplicate": true.
+    """
+    results = [None] * len(entries)
+    checked = []
+    for index, entry in enumerate(entries):
+        try:
+            checked.append((index, *_check(entry)))
+        except ValueError as e:
+            results[index] = _result(index, entry.get("activity") if isinstance(entry, dict) else None, 400, str(e))
+
+    # Retried entries are answered from their receipts and go no further
+    receipts = {}
+    for index, to, kind, activity, actor in checked:
+        key = inbox_dedup.delivery_key(sender, to, activity)
+        if key:
+            receipts[index] = (key, inbox_dedup.digest(activity))
+    previous = inbox_dedup.previous_statuses(dict(receipts.values()))
+    for index, to, kind, activity, actor in checked:
+        if index in receipts and receipts[index][0] in previous:
+            results[index] = dict(_result(index, activity, previous[receipts[index][0]]), duplicate=True)
+    checked = [entry for entry in checked if results[entry[0]] is None]
+    if not checked:
+        return results
+
+    # Recipients and commented-on posts are looked up once for the batch
+    recipients = Author.objects.in_bulk({to for _, to, _, _, _ in checked})
+    post_authors = dict(
+        Post.objects.filter(id__in={activity["post"] for _, _, kind, activity, _ in checked if kind == "comment"})
+        .values_list("id", "author_id")
+    )
+
+    accepted = []
+    for index, to, kind, activity, actor in checked:
+        if to not in recipients:
+            results[index] = _result(index, activity, 404, "Recipient not found")
+        elif node_registry.is_disabled(actor.get("host")):
+            results[index] = _result(index, activity, 403, "Disabled Node")
+        elif kind == "comment" and activity["post"] not in post_authors:
+            results[index] = _result(index, activity, 404, "Post not found")
+        else:
+            accepted.append((index, to, kind, activity, actor))
+
+    with transaction.atomic():
+        _register_nodes(accepted, recipients)
+        authors = {author.id: author for author in (_author(actor) for _, _, _, _, actor in accepted)}
+        Author.objects.bulk_create(authors.values(), update_conflicts=True, unique_fields=["id"],
+                                   update_fields=AUTHOR_FIELDS)
+
+        stored = {}
+        for kind, write in (("follow", _write_follows), ("like", _write_likes),
+                            ("comment", _write_comments), ("post", _write_posts)):
+            items = [(index, to, activity, authors[fqid.canonical(actor["id"])])
+                     for index, to, item_kind, activity, actor in accepted if item_kind == kind]
+            if items:
+                stored.update(write(items))
+
+        inbox_service.deliver_items(
+            (to, kind, stored[index][0]) for index, to, kind, _, _ in accepted if stored[index][1] != "duplicate"
+        )
+
+        created = []
+        for index, to, kind, activity, _ in accepted:
+            obj, state = stored[index]
+            results[index] = _result(index, activity, 201 if state == "created" else 200)
+            if state == "created":
+                created.append((kind, obj, activity))
+        _signal_created(created)
+
+    inbox_dedup.record({
+        receipts[index][0]: (receipts[index][1], results[index]["status"])
+        for index, _, _, _, _ in accepted if index in receipts
+    })
+    _after_create(created, post_authors)
+    return results
+
+
+# =============================================================================
+# Writers: each takes [(index, recipient id, activity, author)] and returns
+# {index: (object, "created" | "existing" | "duplicate")}. Duplicates are
+# objects we already had that the single-item inbox would not re-deliver.
+# =============================================================================
+
+def _write_follows(items):
+    existing = {
+        (follow_request.follower_id, follow_request.followee_id): follow_request
+        for follow_request in FollowRequest.objects.filter(
+            followee_id__in={to for _, to, _, _ in items}, follower_id__in={author.id for _, _, _, author in items}
+        )
+    }
+    new, stored = {}, {}
+    for index, to, activity, author in items:
+        key = (author.id, to)
+        if key in existing:
+            stored[index] = (existing[key], "existing")
+        elif key in new:
+            stored[index] = (new[key], "existing")
+        else:
+            new[key] = FollowRequest(follower_id=author.id, followee_id=to, summary=activity.get("summary", ""),
+                                     status="pending")
+            stored[index] = (new[key], "created")
+    FollowRequest.objects.bulk_create(new.values())
+    return stored
+
+
+def _register_nodes(follows, recipients):
+    """
+    A follow from a host other than the recipient's registers a Node for that
+    host, as the single-item inbox does.
+    """
+    hosts = set()
+    for _, to, kind, _, actor in follows:
+        host = actor.get("host")
+        if kind == "follow" and host and host.rstrip("/") != recipients[to].host.rstrip("/"):
+            hosts.add(host if host.endswith("/") else host + "/")
+    for host in sorted(hosts):
+        try:
+            with transaction.atomic():
+                node, created = Node.objects.get_or_create(base_url=host)
+        except IntegrityError as e:
+            print(f"From inbox_batch: Could not create a Node entry for host {host}: {e}")
+            continue
+        if created:
+            print(f"From inbox_batch: Created new Node entry for host: {host}")
+
+
+def _write_likes(items):
+    # A like is identified by (author, object), as in the single-item inbox
+    existing = {
+        (like.author_id, like.object): like
+        for like in Like.objects.filter(
+            author_id__in={author.id for _, _, _, author in items}, object__in={a["object"] for _, _, a, _ in items}
+        )
+    }
+    # A like id we already hold for another (author, object) is not inserted
+    # again; bulk_create(ignore_conflicts) would skip it without telling us
+    taken = Like.objects.in_bulk({a["id"] for _, _, a, _ in items})
+    new, new_ids, stored = {}, {}, {}
+    for index, to, activity, author in items:
+        key = (author.id, activity["object"])
+        if key in existing or key in new:
+            stored[index] = (existing.get(key) or new[key], "duplicate")
+        elif activity["id"] in taken or activity["id"] in new_ids:
+            stored[index] = (taken.get(activity["id"]) or new_ids[activity["id"]], "duplicate")
+        else:
+            new[key] = new_ids[activity["id"]] = Like(id=activity["id"], author=author, object=activity["object"],
+                                                       published=_published(activity))
+            stored[index] = (new[key], "created")
+    Like.objects.bulk_create(new.values())
+    return stored
+
+
+def _write_comments(items):
+    comments, objects = {}, {}
+    for index, to, activity, author in items:
+        if activity["id"] not in comments:
+            comments[activity["id"]] = Comment(
+                id=activity["id"],
+                serial=fqid.serial_of(activity["id"]),
+                comment=activity["comment"],
+                contentType=activity.get("contentType", "text/markdown"),
+                published=_published(activity),
+                author=author,
+                post=activity["post"],
+            )
+        objects[index] = comments[activity["id"]]
+
+    existing_ids = set(Comment.objects.filter(id__in=comments).values_list("id", flat=True))
+    Comment.objects.bulk_create(comments.values(), update_conflicts=True, unique_fields=["id"],
+                                update_fields=["comment", "contentType", "published", "author", "post", "serial"])
+    return _mark(objects, existing_ids)
+
+
+def _write_posts(items):
+    posts, post_ids = {}, {}
+    for index, to, activity, author in items:
+        if activity["id"] not in posts:
+            post = posts[activity["id"]] = Post(
+                id=activity["id"],
+                title=activity.get("title", ""),
+                description=activity.get("description", ""),
+                content=activity.get("content", ""),
+                contentType=activity.get("contentType", "text/plain"),
+                visibility=activity.get("visibility", "PUBLIC"),
+                author=author,
+                page=activity.get("page") or None,
+            )
+            # bulk_create skips Post.save, so move inline media out here
+            media_storage.externalize(post)
+        post_ids[index] = activity["id"]
+
+    existing_ids = set(Post.objects.filter(id__in=posts).values_list("id", flat=True))
+    Post.objects.bulk_create(posts.values(), update_conflicts=True, unique_fields=["id"],
+                             update_fields=["title", "description", "content", "media", "contentType", "visibility",
+                                            "author", "page"])
+    # Reload for internal_id, which is not returned for updated rows
+    saved = Post.objects.only("internal_id", "id").in_bulk(posts, field_name="id")
+    return _mark({index: saved[post_id] for index, post_id in post_ids.items()}, existing_ids)
+
+
+def _mark(objects, existing_ids):
+    """
+    Returns {index: (object, state)}: "created" for the first entry carrying an
+    object that did not exist before this batch, "existing" for the rest.
+    """
+    seen = set(existing_ids)
+    marked = {}
+    for index, obj in objects.items():
+        marked[index] = (obj, "existing" if obj.id in seen else "created")
+        seen.add(obj.id)
+    return marked
+
+
+# =============================================================================
+# After the write: signals and re-distribution, as the single-item inbox does
+# =============================================================================
+
+def _liked_content_author(like, post_authors):
+    """Returns (author id of the liked post or comment, is a comment like), or (None, False)."""
+    if "/posts/" in like.object:
+        return fqid.author_id(like.object), False
+    comment = Comment.objects.filter(id=like.object).only("post").first()
+    if comment is None:
+        return None, True
+    if comment.post not in post_authors:
+        post_authors[comment.post] = Post.objects.filter(id=comment.post).values_list("author_id", flat=True).first()
+    return post_authors[comment.post], True
+
+
+def _signal_created(created):
+    """
+    bulk_create does not send post_save, so the notification and counter
+    handlers in signals.py are run here for the new rows, inside the batch's
+    transaction.
+    """
+    models = {"follow": FollowRequest, "like": Like, "comment": Comment}
+    for kind, obj, activity in created:
+        if kind in models:
+            post_save.send(sender=models[kind], instance=obj, created=True, raw=False, using="default",
+                           update_fields=None)
+
+
+def _after_create(created, post_authors):
+    """Passes new likes and comments on local content on to the content author's followers."""
+    for kind, obj, activity in created:
+        try:
+            if kind == "like":
+                content_author_id, is_comment_like = _liked_content_author(obj, post_authors)
+                if content_author_id and fqid.is_local(content_author_id):
+                    if is_comment_like:
+                        distribute_comment_likes(obj, activity, content_author_id)
+                    else:
+                        distribute_likes(obj, activity, content_author_id)
+            elif kind == "comment" and fqid.is_local(post_authors[obj.post]):
+                distribute_comments(obj, activity, post_authors[obj.post])
+        except Exception as e:
+            print(f"From inbox_batch: Error distributing {kind} {obj.pk}: {str(e)}")
+            traceback.print_exc()
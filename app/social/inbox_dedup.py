@@ -0,0 +1,71 @@
+"""
+Dedup of retried inbox deliveries.
+
+Peers retry deliveries they could not confirm, so the same activity can reach
+an inbox more than once. Every handled delivery that carries an activity id
+leaves a DeliveryReceipt keyed on (sender, recipient, activity id) with a
+digest of the body. A repeat with the same body within the TTL is answered
+with the first status, without touching the domain tables or firing signals.
+A changed body under the same id (an edited post, an update or delete) is
+processed normally.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import DeliveryReceipt, Node
+
+TTL = timedelta(seconds=getattr(settings, "INBOX_DEDUP_TTL_SECONDS", 3 * 24 * 60 * 60))
+
+
+def sender_of(user):
+    """Names the sender of a request: the peer node, a local user, or anonymous."""
+    if isinstance(user, Node):
+        return user.base_url
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return "anonymous"
+
+
+def delivery_key(user, recipient_id, activity):
+    """Returns the dedup key for a delivery, or None for activities without an id."""
+    if not isinstance(activity, dict) or not activity.get("id"):
+        return None
+    raw = "\n".join((sender_of(user), recipient_id, str(activity["id"])))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def digest(activity):
+    body = json.dumps(activity, sort_keys=True, separators=(",", ":"), cls=DjangoJSONEncoder)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def previous_statuses(digests):
+    """
+    Takes {key: digest} and returns {key: status} for the deliveries that were
+    already handled with the same body within the TTL. One query.
+    """
+    if not digests:
+        return {}
+    receipts = DeliveryReceipt.objects.filter(key__in=digests, created_at__gte=timezone.now() - TTL)
+    return {receipt.key: receipt.status for receipt in receipts if receipt.digest == digests[receipt.key]}
+
+
+def record(receipts):
+    """Stores {key: (digest, status)} for handled deliveries with one upsert."""
+    now = timezone.now()
+    DeliveryReceipt.objects.bulk_create(
+        [DeliveryReceipt(key=key, digest=body_digest, status=status, created_at=now)
+         for key, (body_digest, status) in receipts.items()],
+        update_conflicts=True, unique_fields=["key"], update_fields=["digest", "status", "created_at"],
+    )
+
+
+def prune():
+    """Deletes expired receipts and returns how many were removed."""
+    deleted, _ = DeliveryReceipt.objects.filter(created_at__lt=timezone.now() - TTL).delete()
+    return deleted
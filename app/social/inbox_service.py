@@ -0,0 +1,260 @@
+"""
+In-process inbox queries shared by the inbox API and the HTML pages.
+
+Pages that only need follow requests or a badge count call these functions
+directly instead of making an HTTP request back to their own inbox endpoint.
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.contenttypes.prefetch import GenericPrefetch
+from django.db.models import Count, Max, prefetch_related_objects
+
+from . import media_storage
+from . import notification_counts
+from .models import Author, Comment, FollowRequest, InboxItem, Like, Post
+from .pagination import DEFAULT_PAGE_SIZE, InvalidCursor, decode_cursor, encode_cursor, keyset
+from .serializers import comments_page, likes_page
+
+
+def format_author(author):
+    """Returns the formatted author object."""
+    return {
+        "type": "author",
+        "id": author.id,
+        "host": author.host,
+        "displayName": author.displayName,
+        "github": author.github if author.github else "",
+        "profileImage": author.profileImage if author.profileImage else "",
+        "page": author.page if author.page else ""
+    }
+
+
+def format_like(like):
+    """Returns a formatted like for the inbox."""
+    return {
+        "type": "like",
+        "id": like.id,
+        "published": like.published.isoformat(),
+        "author": format_author(like.author),
+        "object": like.object,  # This is now a URLField (string)
+    }
+
+
+def format_comment(comment):
+    """Returns a formatted comment for the inbox."""
+    return {
+        "type": "comment",
+        "id": comment.id,
+        "author": format_author(comment.author),
+        "comment": comment.comment,
+        "contentType": comment.contentType,
+        "published": comment.published.isoformat()
+    }
+
+
+def format_post(post):
+    """
+    Returns the formatted post object with the first page of its comments and
+    likes, embedded the same way PostSerializer does.
+    """
+    return {
+        "type": "post",
+        "id": post.id,
+        "title": post.title,
+        "description": post.description,
+        "contentType": post.contentType,
+        "content": media_storage.inline_content(post),
+        "published": post.published.isoformat(),
+        "visibility": post.visibility,
+        "page": post.page if post.page else "",
+        "author": format_author(post.author),
+        "comments": comments_page(post),
+        "likes": likes_page(post)
+    }
+
+
+# =============================================================================
+# Writing: one InboxItem per delivered object
+# =============================================================================
+
+# Item type -> (model, related rows to load with it). The item type is also the
+# InboxItem.type value and the ?type= filter value.
+ITEM_MODELS = {
+    "follow": (FollowRequest, "followee"),
+    "post": (Post, "author"),
+    "like": (Like, "author"),
+    "comment": (Comment, "author"),
+}
+ITEM_TYPES = list(ITEM_MODELS)
+
+
+def _item(recipient_id, kind, obj):
+    return InboxItem(
+        recipient_id=recipient_id,
+        type=kind,
+        content_type=ContentType.objects.get_for_model(obj),
+        object_pk=str(obj.pk),
+    )
+
+
+def deliver(recipient, kind, obj):
+    """Adds `obj` to `recipient`'s inbox; delivering the same object twice is a no-op."""
+    deliver_many([recipient.id], kind, obj)
+
+
+def deliver_many(recipient_ids, kind, obj):
+    """Adds `obj` to each recipient's inbox with a single bulk insert."""
+    recipient_ids = list(recipient_ids)
+    InboxItem.objects.bulk_create([_item(recipient_id, kind, obj) for recipient_id in recipient_ids],
+                                  ignore_conflicts=True)
+    notification_counts.invalidate(*recipient_ids)
+
+
+def deliver_items(items):
+    """Bulk-inserts (recipient_id, item type, obj) triples in the given order."""
+    items = list(items)
+    InboxItem.objects.bulk_create([_item(*item) for item in items], ignore_conflicts=True)
+    notification_counts.invalidate(*{recipient_id for recipient_id, _, _ in items})
+
+
+def remove(recipient, obj):
+    """Removes `obj` from `recipient`'s inbox (the object itself is kept)."""
+    InboxItem.objects.filter(
+        recipient=recipient,
+        content_type=ContentType.objects.get_for_model(obj),
+        object_pk=str(obj.pk),
+    ).delete()
+
+
+# =============================================================================
+# Reading
+# =============================================================================
+
+def format_follow_request(follow_request, follower):
+    """Returns a follow request as an inbox "Follow" item."""
+    follower_data = format_author(follower)
+    followee_data = format_author(follow_request.followee)
+    return {
+        "type": "Follow",
+        "summary": f"{follower_data['displayName']} wants to follow {followee_data['displayName']}",
+        "actor": follower_data,
+        "object": followee_data
+    }
+
+
+def parse_types(value):
+    """
+    Parses a ?type= filter ("post,like") into a list of item types, or None for
+    all types. Raises ValueError for an unknown type.
+    """
+    if not value:
+        return None
+    types = [part.strip().lower() for part in value.split(',') if part.strip()]
+    unknown = set(types) - set(ITEM_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown inbox item type(s): {', '.join(sorted(unknown))}")
+    return types
+
+
+def _items(author, types=None):
+    items = InboxItem.objects.filter(recipient=author)
+    if types:
+        items = items.filter(type__in=types)
+    return items
+
+
+def _format_items(inbox_items):
+    """
+    Formats a page of InboxItems in order. Targets are loaded with one query per
+    type; items whose target was deleted, and follow requests from authors not
+    known locally, are skipped.
+    """
+    prefetch_related_objects(inbox_items, GenericPrefetch(
+        'target', [model.objects.select_related(related) for model, related in ITEM_MODELS.values()]))
+
+    typed_objects = [(item.type, item.target) for item in inbox_items if item.target is not None]
+    followers = Author.objects.in_bulk([obj.follower_id for kind, obj in typed_objects if kind == "follow"])
+    formatters = {"post": format_post, "like": format_like, "comment": format_comment}
+    formatted = []
+    for kind, obj in typed_objects:
+        if kind != "follow":
+            formatted.append(formatters[kind](obj))
+        elif obj.follower_id in followers:
+            formatted.append(format_follow_request(obj, followers[obj.follower_id]))
+        else:
+            print(f"From inbox_service: Skipping follow request from unknown author {obj.follower_id}")
+    return formatted
+
+
+def follow_request_items(author):
+    """Returns the follow requests in `author`'s inbox as inbox "Follow" items."""
+    return _format_items(list(_items(author, ["follow"]).order_by('-created_at', '-seq')))
+
+
+def inbox_page(author, cursor=None, size=DEFAULT_PAGE_SIZE, types=None):
+    """
+    Returns (items, next_cursor): the newest `size` items in `author`'s inbox that
+    come after `cursor`, optionally only of `types`, in delivery order.
+    Raises InvalidCursor for a cursor this inbox did not issue.
+    """
+    inbox_items, next_cursor = keyset(_items(author, types), cursor, size, ordering=('-created_at', '-seq'))
+    return _format_items(inbox_items), next_cursor
+
+
+# =============================================================================
+# Incremental reads by seq
+# =============================================================================
+
+def latest_since(author, seq=None):
+    """
+    Returns a since-cursor for "now": polling with it returns only later
+    deliveries. Pass `seq` when the newest seq is already known.
+    """
+    if seq is None:
+        seq = InboxItem.objects.filter(recipient=author).aggregate(seq=Max('seq'))['seq'] or 0
+    return encode_cursor({"seq": seq})
+
+
+def _since_seq(since):
+    data = decode_cursor(since)
+    if not isinstance(data, dict) or not isinstance(data.get("seq"), int):
+        raise InvalidCursor("Cursor does not match this list")
+    return data["seq"]
+
+
+def inbox_delta(author, since, size=DEFAULT_PAGE_SIZE, types=None):
+    """
+    Returns (items, since, has_more) for the items delivered to `author` after the
+    `since` cursor, oldest first. Pass the returned since back on the next poll;
+    has_more means another call would return more right away. Items removed from
+    the inbox in the meantime (e.g. an approved follow request) are not returned.
+    """
+    seq = _since_seq(since)
+    inbox_items = list(_items(author, types).filter(seq__gt=seq).order_by('seq')[:size + 1])
+    has_more = len(inbox_items) > size
+    inbox_items = inbox_items[:size]
+
+    next_since = encode_cursor({"seq": inbox_items[-1].seq if inbox_items else seq})
+    return _format_items(inbox_items), next_since, has_more
+
+
+def delta_counts(author, since, latest=None):
+    """
+    Returns ({item type: count}, since) for deliveries to `author` after the
+    `since` cursor, using one grouped query. Pass `latest` when the newest seq
+    is already known; a cursor that is already there needs no query at all.
+    """
+    seq = _since_seq(since)
+    if latest is None:
+        latest = InboxItem.objects.filter(recipient=author).aggregate(seq=Max('seq'))['seq'] or seq
+    if latest <= seq:
+        return {kind: 0 for kind in ITEM_TYPES}, encode_cursor({"seq": seq})
+    counts = dict(
+        InboxItem.objects.filter(recipient=author, seq__gt=seq, seq__lte=latest)
+        .values_list('type').annotate(count=Count('seq')).order_by()
+    )
+    return {kind: counts.get(kind, 0) for kind in ITEM_TYPES}, encode_cursor({"seq": max(seq, latest)})
+
+
+def pending_follow_request_count(author):
+    """Counts pending follow requests for `author` (uses the followee/status index)."""
+    return FollowRequest.objects.filter(followee=author, status='pending').count()
@@ -1,16 +1,26 @@
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from urllib.parse import unquote
 from django.db import transaction
 import requests
 import json
 from django.conf import settings
 from django.utils import timezone
-from .models import Author, Post, FollowRequest, Inbox, Like, Comment, Node, Follow
+from .models import Author, Post, FollowRequest, Like, Comment, Node, Follow
 from .authentication import NodeBasicAuthentication
+from . import federation
+from . import fqid
+from . import inbox_batch
+from . import inbox_dedup
+from . import inbox_service
+from . import node_registry
+from . import resolver
+from .federation import BATCH_INBOX_HEADER, MAX_BATCH_SIZE
+from .pagination import next_link, page_params
 from rest_framework.authentication import SessionAuthentication, BasicAuthentication
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
@@ -23,14 +33,9 @@ NODE_IP = getattr(settings, "NODE_IP", None)
 
 def is_author_in_our_node(author_id):
     """
-    Check if an author belongs to our node by simply checking if the author ID contains our local IP.
+    Check if an author belongs to our node, i.e. the host of the author ID is our NODE_IP.
     """
-    try:
-        # Simply check if the NODE_IP is present in the author_id
-        return NODE_IP in author_id
-    except Exception as e:
-        print(f"From inbox_views: Error checking if author is in our node: {str(e)}")
-        return False
+    return fqid.is_local(author_id)
 
 def follow_inbox_view(request):
     """Fetches the inbox and filters only follow requests."""
@@ -42,23 +47,8 @@ def follow_inbox_view(request):
     my_author_id = my_author.id
     print(f"From inbox_views:  Logged-in Author ID: {my_author_id}")  # Debugging: See Author ID in logs
 
-    # Construct the API URL for retrieving inbox data
-    inbox_url = f"{my_author_id}/inbox"
-
-    try:
-        response = requests.get(inbox_url, headers={"Content-Type": "application/json"})
-        response.raise_for_status()  # Ensure non-200 responses raise an error
-        inbox_data = response.json()
-
-        # Extract only "follow" requests that are still pending
-        follow_requests = [
-            item for item in inbox_data.get("items", [])
-            if item.get("type", "").lower() == "follow"
-        ]
-
-    except requests.exceptions.RequestException as e:  # Correct exception handling
-        print(f"From inbox_views: Error fetching inbox data: {e}")
-        follow_requests = []
+    # Read follow requests straight from the database rather than calling our own inbox API
+    follow_requests = inbox_service.follow_request_items(my_author)
 
     return render(request, "social/followInbox.html", {
         "my_author_id": my_author_id,
@@ -73,57 +63,47 @@ class InboxView(APIView):
     permission_classes = [AllowAny]
     authentication_classes = [NodeBasicAuthentication, BasicAuthentication]
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Tell peers where to send batched deliveries (see InboxBatchView)
+        response[BATCH_INBOX_HEADER] = request.build_absolute_uri(reverse("social:api_inbox_batch"))
+        return super().finalize_response(request, response, *args, **kwargs)
+
     def get(self, request, author_id):
         """
-        Fetches all items (posts, likes, comments, follow requests) in the inbox.
+        Fetches a page of items (posts, likes, comments, follow requests) in the inbox.
+        ?type=post,like limits the item types and ?size= the page length.
+        Without ?since= the newest items come first and ?cursor= pages back in time.
+        With ?since= only items delivered after that cursor are returned, oldest
+        first; every response carries the `since` to send on the next poll.
         """
         author_id = unquote(author_id)
         expected_author_id = f"http://{request.get_host()}/social/api/authors/{author_id}"
 
         print(f"From inbox_views: Fetching inbox for: {expected_author_id}")
 
-        # Get the author's inbox
         author = get_object_or_404(Author, id=expected_author_id)
-        inbox = Inbox.objects.filter(author=author).first()
-
-        if not inbox:
-            return Response({"type": "inbox", "items": []}, status=status.HTTP_200_OK)
-
-        inbox_items = []
-
-        # Process follow requests
-        for fr in inbox.inbox_follows.all():
-            follower_data = self.format_author(get_object_or_404(Author, id=fr.follower_id))
-            followee_data = self.format_author(fr.followee)
-
-            if follower_data and followee_data:
-                inbox_items.append({
-                    "type": "Follow",
-                    "summary": f"{follower_data['displayName']} wants to follow {followee_data['displayName']}",
-                    "actor": follower_data,
-                    "object": followee_data
-                })
-
-        # Process posts
-        for post in inbox.inbox_posts.all():
-            inbox_items.append(self.format_post(post, author_id))
-
-        # Process likes using `format_likes()`
-        # Process each like individually
-        for like in inbox.inbox_likes.all():
-            inbox_items.append(self.format_like(like))
-
+        _, size = page_params(request)
+        since = request.query_params.get('since')
+        try:
+            types = inbox_service.parse_types(request.query_params.get('type'))
+            if since:
+                inbox_items, since, has_more = inbox_service.inbox_delta(author, since, size, types)
+                return Response({"type": "inbox", "since": since, "has_more": has_more, "items": inbox_items},
+                                status=status.HTTP_200_OK)
 
-        # Process comments using `format_comments()`
-        for comment in inbox.inbox_comments.all():
-            inbox_items.append(self.format_comments(comment))
+            # Taken before reading so nothing delivered meanwhile is missed by the next poll
+            since = inbox_service.latest_since(author)
+            inbox_items, next_cursor = inbox_service.inbox_page(author, request.query_params.get('cursor'), size, types)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({"type": "inbox", "items": inbox_items}, status=status.HTTP_200_OK)
+        return Response({"type": "inbox", "since": since, "next": next_link(request, next_cursor), "items": inbox_items},
+                        status=status.HTTP_200_OK)
 
     def get_author_details(self, author_url):
         """Fetches author details from an API."""
         try:
-            response = requests.get(author_url, headers={"Content-Type": "application/json"})
+            response = federation.get(None, author_url)
             response.raise_for_status()
             author_data = response.json()
 
@@ -140,62 +120,6 @@ class InboxView(APIView):
             print(f"From inbox_views:  Error fetching author details for {author_url}: {e}")
             return None
 
-    def format_author(self,author):
-        """Returns the formatted author object."""
-        return {
-            "type": "author",
-            "id": author.id,
-            "host": author.host,
-            "displayName": author.displayName,
-            "github": author.github if author.github else "",
-            "profileImage": author.profileImage if author.profileImage else "",
-            "page": author.page if author.page else ""
-        }
-
-    def format_like(self, like):
-        """Returns formatted likes for the inbox."""
-        return {
-            "type": "like",
-            "id": like.id,
-            "published": like.published.isoformat(),
-            "author": self.format_author(like.author),
-            "object": like.object,  # This is now a URLField (string)
-        }
-
-
-    def format_comments(self, comments):
-        """Format comments for a post"""
-        comments_list = []
-        
-        # Handle if we're passed a single post instead of comments
-        if isinstance(comments, Post):
-            # Get comments for this post
-            comments = comments.comments.all()
-        # Handle if we're passed a single comment
-        elif isinstance(comments, Comment):
-            # Create a single-item list with this comment
-            return {
-                "type": "comment",
-                "id": comments.id,
-                "author": self.format_author(comments.author),
-                "comment": comments.comment,
-                "contentType": comments.contentType,
-                "published": comments.published.isoformat()
-            }
-        
-        # Now format each comment (for collections)
-        for comment in comments:
-            comments_list.append({
-                "type": "comment",
-                "id": comment.id,
-                "author": self.format_author(comment.author),
-                "comment": comment.comment,
-                "contentType": comment.contentType,
-                "published": comment.published.isoformat()
-            })
-        
-        return comments_list
-        
     def format_comment_likes(self, comment):
         """Returns formatted likes for a comment."""
         return {
@@ -204,54 +128,19 @@ class InboxView(APIView):
             "page": f"http://{self.request.get_host()}/social/api/authors/{comment.author.id}/commented/{comment.id}/likes",
             "page_number": 1,  # Pagination metadata
             "size": 50,  # Default page size
-            "count": Like.objects.filter(object=comment.id).count(),  # Count total likes for this comment
+            "count": comment.like_count,  # Denormalized count, see counters.py
             "src": [
                 {
                     "type": "like",
                     "id": like.id,
                     "published": like.published.isoformat(),
-                    "author": self.format_author(like.author),  # Format author details
+                    "author": inbox_service.format_author(like.author),  # Format author details
                     "object": comment.id  # The comment being liked
                 }
                 for like in Like.objects.filter(object=comment.id).order_by("-published")[:5]  # Limit to 5 likes
             ]
         }
 
-    def format_post(self, post, author_id):
-        """Returns the formatted post object in the correct structure."""
-        return {
-            "type": "post",
-            "id": post.id,
-            "title": post.title,
-            "description": post.description,
-            "contentType": post.contentType,
-            "content": post.content,
-            "published": post.published.isoformat(),
-            "visibility": post.visibility,
-            "page": post.page if post.page else "",
-            "author": self.format_author(post.author),  # Post author
-            "comments": self.format_comments(post.comments),  #  comments
-            "likes": self.format_likes(post)  # likes
-        }
-        
-    def format_likes(self, post):
-        """Returns formatted likes for a post."""
-        likes_list = []
-        # Get likes for this post
-        post_likes = Like.objects.filter(object=post.id)
-        
-        for like in post_likes:
-            likes_list.append({
-                "type": "like",
-                "id": like.id,
-                "published": like.published.isoformat(),
-                "author": self.format_author(like.author),
-                "object": like.object,
-            })
-    
-        return likes_list
-
-
     @method_decorator(csrf_exempt, name='dispatch')
     def delete(self, request, author_id):
         print("inbox received delete to delete post")
@@ -266,6 +155,26 @@ class InboxView(APIView):
 
     @method_decorator(csrf_exempt, name='dispatch')
     def post(self, request, author_id):
+        """
+        Stores an incoming item once. A retried delivery of an activity we already
+        handled (same sender, recipient, id and body) gets the first answer back
+        without being stored again; see inbox_dedup.py.
+        """
+        recipient_id = f"http://{request.get_host()}/social/api/authors/{unquote(author_id)}"
+        key = inbox_dedup.delivery_key(request.user, recipient_id, request.data)
+        if key:
+            body_digest = inbox_dedup.digest(request.data)
+            previous = inbox_dedup.previous_statuses({key: body_digest}).get(key)
+            if previous is not None:
+                print(f"From inbox_views: Duplicate delivery of {request.data.get('id')} answered from receipt")
+                return Response({"message": "Already received", "duplicate": True}, status=previous)
+
+        response = self.receive(request, author_id)
+        if key and 200 <= response.status_code < 300:
+            inbox_dedup.record({key: (body_digest, response.status_code)})
+        return response
+
+    def receive(self, request, author_id):
         """Stores any incoming request (posts, likes, comments, follows) in the inbox."""
 
         author_id = unquote(author_id)
@@ -273,7 +182,6 @@ class InboxView(APIView):
 
         print(f"Receiving new inbox item for: {expected_author_id}")
         author = get_object_or_404(Author, id=expected_author_id)
-        inbox, created = Inbox.objects.get_or_create(author=author)
 
         data = request.data
         item_type = data.get("type").lower()
@@ -293,9 +201,7 @@ class InboxView(APIView):
             follower_id = actor_data.get('id')
             
             if follower_id:
-                # Remove trailing slash if present
-                if follower_id.endswith('/'):
-                    follower_id = follower_id[:-1]
+                follower_id = fqid.canonical(follower_id)
                     
                 # Remove the follow relationship if it exists
                 try:
@@ -321,10 +227,8 @@ class InboxView(APIView):
 
         if item_type == "follow":
             actor_data = data.get("actor", {})
-            follower_id = actor_data.get("id")
+            follower_id = fqid.canonical(actor_data.get("id"))
             follower_host = actor_data.get("host")
-            if follower_id.endswith('/'):
-                follower_id = follower_id[:-1]  # Remove the last character
             if actor_data.get("profileImage") == None:
                 actor_data["profileImage"] = ""
             if not follower_id:
@@ -355,7 +259,7 @@ class InboxView(APIView):
                 follower_id=follower_id,
                 defaults={"summary": data.get("summary", ""), "status": "pending"}
             )
-            inbox.inbox_follows.add(follow_request)
+            inbox_service.deliver(author, "follow", follow_request)
 
 
         elif item_type == "like":
@@ -370,9 +274,7 @@ class InboxView(APIView):
             if not (like_id and like_object and like_author_id):
                 return Response({"error": "Missing required like fields"}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Check if like_author_id ends with '/' and remove it if it does
-            if like_author_id.endswith('/'):
-                like_author_id = like_author_id[:-1]  # Remove the last character
+            like_author_id = fqid.canonical(like_author_id)
             
             if like_author_data.get('profileImage') == None:
                 like_author_data['profileImage'] = ""
@@ -392,14 +294,9 @@ class InboxView(APIView):
                 }
             )
 
-            # Debug existing likes
-            existing_likes = Like.objects.filter(author=author_instance, object=like_object)
-            print(f"DEBUG: Found {existing_likes.count()} existing likes with the same author and object")
-            for idx, existing_like in enumerate(existing_likes):
-                print(f"DEBUG: Existing like #{idx+1} - ID: {existing_like.id}, Object: {existing_like.object}, Published: {existing_like.published}")
-
-            # Try getting the first existing like
-            like_obj = existing_likes.first()
+            # Retries of the same activity are answered by the receipt check in post();
+            # this catches the same like re-sent under a new id
+            like_obj = Like.objects.filter(author=author_instance, object=like_object).first()
             
             if not like_obj:
                 print("DEBUG: No existing like found, creating a new one")
@@ -409,15 +306,8 @@ class InboxView(APIView):
                     published=like_published
                 )
                 print(f"DEBUG: From inbox_views: Created new like with ID: {like_obj.id}")
-                inbox.inbox_likes.add(like_obj)
+                inbox_service.deliver(author, "like", like_obj)
                 print(f"[INFO] Stored Like from {like_author_id} on {like_object}")
-                
-                # After creating, verify if it's now findable
-                verify_like = Like.objects.filter(author=author_instance, object=like_object).first()
-                if verify_like:
-                    print(f"DEBUG: Verification - Like found after creation with ID: {verify_like.id}")
-                else:
-                    print("DEBUG: Verification - Like still not found after creation!")
             else:
                 print(f"DEBUG: Existing like found with ID: {like_obj.id}")
                 print("From inbox_views: Like already exists")
@@ -432,8 +322,7 @@ class InboxView(APIView):
                 
                 if '/posts/' in like_object:
                     # For post likes
-                    parts = like_object.split('/posts/')
-                    content_author_id = parts[0]  # This gives us the full author URL
+                    content_author_id = fqid.author_id(like_object)
                     print(f"From inbox_views: Identified as post like for author: {content_author_id}")
                     
                 elif '/comments/' in like_object or '/commented/' in like_object:
@@ -446,15 +335,8 @@ class InboxView(APIView):
                         comment_id = like_object
                     
                     try:
-                        # Try to find the comment
-                        comment = None
-                        # First try exact match
-                        try:
-                            comment = Comment.objects.get(id=comment_id)
-                        except Comment.DoesNotExist:
-                            # Try to match by the UUID part at the end
-                            uuid_part = comment_id.split('/')[-1]
-                            comment = Comment.objects.filter(id__endswith=uuid_part).first()
+                        # Exact id, then the indexed serial; see resolver.py
+                        comment = resolver.resolve_comment(comment_id)
                         
                         if comment:
                             # Get the post associated with the comment
@@ -462,8 +344,7 @@ class InboxView(APIView):
                             
                             # Extract the post author ID from the post ID
                             if '/posts/' in post_id:
-                                parts = post_id.split('/posts/')
-                                content_author_id = parts[0]  # The author of the post
+                                content_author_id = fqid.author_id(post_id)
                                 print(f"From inbox_views: Identified as comment like for post by author: {content_author_id}")
                             else:
                                 print(f"From inbox_views: Unusual post ID format: {post_id}")
@@ -504,8 +385,7 @@ class InboxView(APIView):
             comment_published = data.get("published", timezone.now().isoformat())
             comment_content_type = data.get("contentType", "text/markdown")
 
-            if comment_author_id.endswith('/'):
-                comment_author_id = comment_author_id[:-1]  # Remove the last character
+            comment_author_id = fqid.canonical(comment_author_id)
             
             if comment_author_data.get("profileImage") == None:
                 comment_author_data["profileImage"] = ""
@@ -545,7 +425,7 @@ class InboxView(APIView):
                 }
             )
 
-            inbox.inbox_comments.add(comment)
+            inbox_service.deliver(author, "comment", comment)
             print(f"[INFO]From inbox_views:  Stored comment by {author_instance.displayName} on post {comment_post_id}")
 
             try:
@@ -617,7 +497,7 @@ class InboxView(APIView):
             )
             
 
-            inbox.inbox_posts.add(post)
+            inbox_service.deliver(author, "post", post)
             print(f"[INFO] From inbox_views: Stored post '{post_title}' from {post_author_id}")
 
 
@@ -625,7 +505,6 @@ class InboxView(APIView):
         else:
             return Response({"error": "Invalid type"}, status=status.HTTP_400_BAD_REQUEST)
 
-        inbox.save()
         print(f" Stored {item_type} in inbox.")
         return Response({"message": f"{item_type} received and stored"}, status=status.HTTP_201_CREATED)
     
@@ -642,14 +521,9 @@ class InboxView(APIView):
             # For Post, Comment, and Like objects, check the author's host
             author_data = data.get("author", {})
 
-        author_host = author_data.get("host")
-        disabled_nodes = Node.objects.filter(enabled=False)
-        # Check if actor_host matches any disabled node's base_url
-        for node in disabled_nodes:
-            if author_host == node.base_url:
-                print('Object is from a disabled node, rejecting')
-                return True
-            
+        if node_registry.is_disabled(author_data.get("host")):
+            print('Object is from a disabled node, rejecting')
+            return True
         return False
 
 
@@ -683,7 +557,7 @@ class InboxView(APIView):
                     follow_request.save()
 
                     # Remove from Inbox but keep in FollowRequest
-                    Inbox.objects.filter(inbox_follows=follow_request).delete()
+                    inbox_service.remove(author, follow_request)
 
                     print(f" Denied follow request and removed from inbox: {foreign_author_fqid}")
                     return Response({"message": "Follow request denied and removed from inbox"}, status=status.HTTP_200_OK)
@@ -695,4 +569,26 @@ class InboxView(APIView):
 
 
 def inbox_view(request):
-    return render(request, "social/inbox.html")
\ No newline at end of file
+    return render(request, "social/inbox.html")
+
+
+class InboxBatchView(APIView):
+    """
+    Accepts many inbox deliveries from a peer node in one request, either as a
+    list of {"to", "activity"} entries or as {"type": "batch", "items": [...]}.
+    Responds with one result per entry (see inbox_batch.py).
+    """
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [NodeBasicAuthentication]
+
+    def post(self, request):
+        items = request.data.get("items") if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list):
+            return Response({"error": "Expected a list of inbox items"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > MAX_BATCH_SIZE:
+            return Response({"error": f"At most {MAX_BATCH_SIZE} items per batch"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = inbox_batch.ingest(items, request.user)
+        stored = sum(1 for result in results if result["status"] < 300)
+        print(f"From inbox_views: Stored {stored} of {len(items)} batched inbox items from {request.user}")
+        return Response({"type": "batch", "results": results}, status=status.HTTP_200_OK)
@@ -2,8 +2,14 @@ from rest_framework import status
 from rest_framework.decorators import api_view, authentication_classes
 from rest_framework.response import Response
 from .models import Author, Like, Post, Node
-from .serializers import LikeSerializer
+from .serializers import LikeSerializer, LIKES_PAGE_SIZE, likes_page
+from .pagination import InvalidCursor, next_link, page_params, paginate
 from .authentication import NodeBasicAuthentication
+from . import counters
+from . import fqid
+from . import node_registry
+from . import outbox
+from . import federation
 import requests
 import uuid
 from datetime import datetime
@@ -20,8 +26,11 @@ def get_liked_by_author(request, author_id):
         author_url = f"http://{request.get_host()}/social/api/authors/{author_id}"
         author = Author.objects.get(id=author_url)
         
-        # Get all likes by this author
-        likes = Like.objects.filter(author=author)
+        # Get one page (?cursor= or ?page=&size=) of likes by this author
+        try:
+            likes, next_cursor = paginate(request, Like.objects.filter(author=author).select_related('author'))
+        except InvalidCursor:
+            return Response({"error": "Invalid pagination parameters"}, status=status.HTTP_400_BAD_REQUEST)
         
         # Serialize the likes
         serializer = LikeSerializer(likes, many=True)
@@ -29,6 +38,7 @@ def get_liked_by_author(request, author_id):
         # Return the likes object
         return Response({
             "type": "liked",
+            "next": next_link(request, next_cursor),
             "items": serializer.data
         })
     except Author.DoesNotExist:
@@ -85,20 +95,15 @@ def send_like_to_inbox(request):
         except Post.DoesNotExist:
             # Create a placeholder post entry for the remote post
             # Extract author info from the post ID or from the provided author_fqid
-            if '/authors/' in post_fqid and '/posts/' in post_fqid:
-                parts = post_fqid.split('/authors/')
-                host = parts[0]
-                remainder = parts[1]
-                author_id_part = remainder.split('/posts/')[0]
-                post_id_part = remainder.split('/posts/')[1]
-                
+            parsed_post = fqid.parse(post_fqid)
+            if parsed_post is not None and parsed_post.kind == "posts":
                 # Get or create a placeholder for the remote author
                 remote_author, _ = Author.objects.get_or_create(
-                    id=f"{host}/authors/{author_id_part}",
+                    id=parsed_post.author_id,
                     defaults={
-                        'host': host,
+                        'host': parsed_post.api_root,
                         'displayName': 'Remote Author',
-                        'page': f"{host}/authors/{author_id_part}"
+                        'page': parsed_post.author_id
                     }
                 )
                 
@@ -150,15 +155,14 @@ def send_like_to_inbox(request):
 
                 else:
                     # Extract host and author ID from the post ID
-                    post_parts = post.id.split('/authors/')
-                    host = post_parts[0] 
-                    remaining = post_parts[1]
-                    remote_author_id = remaining.split('/posts/')[0]
+                    parsed_post = fqid.parse(post.id)
+                    host = parsed_post.api_root
+                    remote_author_id = parsed_post.author_serial
                 
                 # Get the foreign node information
                 print(f"HOST SPLIT IN LIKE VIEWS {host.split('//')[1]}")
 
-                node = Node.objects.get(base_url__contains=host.split('//')[1])
+                node = node_registry.get_by_host(host)
                 
                 # Construct inbox URL
                 inbox_url = f"{node.base_url}authors/{remote_author_id}/inbox"
@@ -185,26 +189,16 @@ def send_like_to_inbox(request):
                 print(f"INBOX URL: {inbox_url}")
 
                 
-                # Send to inbox
-                print(f"sending like with auth {node.auth_username} {node.auth_password}")
-                response = requests.post(
-                    inbox_url,
-                    json=like_data,
-                    auth=(node.auth_username, node.auth_password),
-                    headers={"Content-Type": "application/json"},
-                    timeout=5
-                )
-                
-                if response.status_code >= 400:
-                    print(f"Error sending like to inbox: {response.status_code} - {response.text}")
+                # Queue for the remote inbox
+                outbox.enqueue(node, inbox_url, like_data)
                 
             except Node.DoesNotExist:
                 print(f"Node does not exist for host: {host}")
             except Exception as e:
-                print(f"Failed to send like to inbox: {str(e)}")
+                print(f"Failed to queue like for inbox: {str(e)}")
         
         # Update like count
-        like_count = Like.objects.filter(object=post.id).count()
+        like_count = counters.like_count(post.id)
         
         # Return a standardized response
         return Response({
@@ -237,21 +231,31 @@ def get_liked_by_author_fqid(request, author_fqid):
         # Find the author by FQID
         author = Author.objects.get(id=author_fqid)
         
-        # Get all likes by this author
-        likes = Like.objects.filter(author=author)
+        # Get one page (?cursor= or ?page=&size=) of likes by this author
+        likes_query = Like.objects.filter(author=author)
+        try:
+            likes, next_cursor = paginate(request, likes_query.select_related('author'))
+        except InvalidCursor:
+            return Response({"error": "Invalid pagination parameters"}, status=status.HTTP_400_BAD_REQUEST)
+        page_number, size = page_params(request)
         
         # Serialize the likes
         serializer = LikeSerializer(likes, many=True)
         
         # Return the likes object
-        return Response({
+        response_data = {
             "type": "likes",
             "page": author.page,
             "id": author.id,
-            "page_number": 1,
-            "count": len(likes),
-            "src": serializer.data
-        })
+        }
+        if not request.query_params.get('cursor'):
+            # A page number and total only mean something in ?page=&size= mode
+            response_data["page_number"] = page_number
+            response_data["count"] = likes_query.count()
+        response_data["size"] = size
+        response_data["next"] = next_link(request, next_cursor)
+        response_data["src"] = serializer.data
+        return Response(response_data)
     except Author.DoesNotExist:
         return Response({"error": "Author not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -284,22 +288,9 @@ def get_post_likes(request, author_id, post_id):
         # Find the post by its ID
         post = Post.objects.get(id=post_url)
         
-        # Get all likes for this post
-        likes = Like.objects.filter(object=post_url).order_by("published")
-        
-        # Serialize the likes
-        like_serializer = LikeSerializer(likes, many=True)
-        
-        # Return the likes object as specified in the API
-        return Response({
-            "type": "likes",
-            "id": f"{post_url}/likes",
-            "page": f"{post.page}/likes" if post.page else None,
-            "page_number": 1,
-            "size": 50,
-            "count": likes.count(),
-            "src": like_serializer.data
-        })
+        # Return one page of likes (?page=&size=) as specified in the API
+        page_number, size = page_params(request, LIKES_PAGE_SIZE)
+        return Response(likes_page(post, page_number, size))
     except Post.DoesNotExist:
         return Response({"error": "Post not found"}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
@@ -315,22 +306,9 @@ def get_post_likes_by_fqid(request, post_fqid):
         # Find the post by its ID
         post = Post.objects.get(id=post_fqid)
         
-        # Get all likes for this post
-        likes = Like.objects.filter(object=post_fqid).order_by("published")
-        
-        # Serialize the likes
-        like_serializer = LikeSerializer(likes, many=True)
-        
-        # Return the likes object as specified in the API
-        return Response({
-            "type": "likes",
-            "id": f"{post_fqid}/likes",
-            "page": f"{post.page}/likes" if post.page else None,
-            "page_number": 1,
-            "size": 50,
-            "count": likes.count(),
-            "src": like_serializer.data
-        })
+        # Return one page of likes (?page=&size=) as specified in the API
+        page_number, size = page_params(request, LIKES_PAGE_SIZE)
+        return Response(likes_page(post, page_number, size))
     except Post.DoesNotExist:
         return Response({"error": "Post not found"}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
@@ -352,12 +330,7 @@ def get_liked_by_post_fqid(request, post_fqid):
         print(liked_url )
 
         # Send the post to the recipient's inbox
-        response = requests.get(
-            liked_url,
-            auth=(node.auth_username, node.auth_password),
-            headers={"Accept": "application/json"},
-            timeout=5
-        )
+        response = federation.get(node, liked_url)
         response.raise_for_status()
         likes = response.json()
         for like in likes['src']:
@@ -0,0 +1,139 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from social.models import Author, Comment, Like, Notification, Post
+
+BENCH_HOST = "http://benchmark.invalid"
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds likes and comments, then times the URL-keyed lookups with the Like, "
+        "Comment and Notification indexes dropped and again with them in place. "
+        "Writes to the configured database; run it against a scratch copy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--likes", type=int, default=1_000_000)
+        parser.add_argument("--comments", type=int, default=200_000)
+        parser.add_argument("--posts", type=int, default=10_000)
+        parser.add_argument("--repeat", type=int, default=200, help="Runs per query.")
+        parser.add_argument("--keep", action="store_true", help="Keep the seeded rows afterwards.")
+
+    def handle(self, *args, **options):
+        author = self.seed(options["posts"], options["comments"], options["likes"])
+        try:
+            queries = self.sample_queries(author)
+            models = [Like, Comment, Notification]
+
+            self.drop_indexes(models)
+            try:
+                before = self.time_queries(queries, options["repeat"])
+            finally:
+                self.create_indexes(models)
+            after = self.time_queries(queries, options["repeat"])
+
+            self.stdout.write(f"{'query':<40}{'before ms':>12}{'after ms':>12}")
+            for name in queries:
+                self.stdout.write(f"{name:<40}{before[name]:>12.3f}{after[name]:>12.3f}")
+        finally:
+            if not options["keep"]:
+                self.cleanup(author)
+
+    def seed(self, post_count, comment_count, like_count, batch_size=10_000):
+        self.stdout.write(f"Seeding {post_count} posts, {comment_count} comments, {like_count} likes...")
+        author = Author.objects.create(
+            id=f"{BENCH_HOST}/social/api/authors/{uuid.uuid4()}",
+            host=f"{BENCH_HOST}/social/api/",
+            displayName="Benchmark",
+        )
+        # Likes are unique per (author, object), so spread them over a pool of likers.
+        likers_needed = like_count // max(1, post_count + comment_count) + 1
+        likers = Author.objects.bulk_create([
+            Author(id=f"{author.id}-liker-{i}", host=author.host, displayName=f"Liker {i}")
+            for i in range(likers_needed)
+        ])
+
+        post_ids = [f"{author.id}/posts/{i}" for i in range(post_count)]
+        for start in range(0, post_count, batch_size):
+            Post.objects.bulk_create([
+                Post(id=post_id, title="bench", description="", contentType="text/plain",
+                     content="", author=author, visibility="PUBLIC")
+                for post_id in post_ids[start:start + batch_size]
+            ])
+
+        comment_ids = [f"{author.id}/commented/{i}" for i in range(comment_count)]
+        for start in range(0, comment_count, batch_size):
+            Comment.objects.bulk_create([
+                Comment(id=comment_id, serial=str(i), author=author, comment="bench",
+                        post=post_ids[i % post_count])
+                for i, comment_id in enumerate(comment_ids[start:start + batch_size], start)
+            ])
+
+        targets = post_ids + comment_ids
+        for start in range(0, like_count, batch_size):
+            Like.objects.bulk_create([
+                Like(id=f"{author.id}/liked/{i}", author=likers[i // len(targets)], object=targets[i % len(targets)])
+                for i in range(start, min(start + batch_size, like_count))
+            ])
+
+        Notification.objects.bulk_create([
+            Notification(recipient=author, sender_id=likers[0].id, sender_name="Liker 0",
+                         notification_type="like_post", content_object_id=post_id, content_object_page=post_id)
+            for post_id in post_ids
+        ], batch_size=batch_size)
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        return author
+
+    def sample_queries(self, author):
+        post_id = f"{author.id}/posts/0"
+        liker = Like.objects.filter(object=post_id).values_list("author_id", flat=True).first()
+        return {
+            "like count for a post": lambda: Like.objects.filter(object=post_id).count(),
+            "has author liked post": lambda: Like.objects.filter(object=post_id, author_id=liker).exists(),
+            "comments on a post": lambda: list(Comment.objects.filter(post=post_id)[:5]),
+            "filtered() page with like counts": lambda: list(Post.objects.filtered(
+                filter_type="author", authors=[author], visibilities=["PUBLIC"])[:10]),
+            "notifications for an object": lambda: Notification.objects.filter(content_object_id=post_id).exists(),
+            "unread like notifications": lambda: Notification.objects.filter(
+                recipient=author, notification_type="like_post", is_read=False).count(),
+        }
+
+    def time_queries(self, queries, repeat):
+        results = {}
+        for name, query in queries.items():
+            query()  # warm up
+            started = time.perf_counter()
+            for _ in range(repeat):
+                query()
+            results[name] = (time.perf_counter() - started) * 1000 / repeat
+        return results
+
+    def drop_indexes(self, models):
+        with connection.schema_editor() as editor:
+            for model in models:
+                for index in model._meta.indexes:
+                    editor.remove_index(model, index)
+
+    def create_indexes(self, models):
+        with connection.schema_editor() as editor:
+            for model in models:
+                for index in model._meta.indexes:
+                    editor.add_index(model, index)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def cleanup(self, author):
+        self.stdout.write("Removing seeded rows...")
+        with transaction.atomic():
+            bench_authors = Author.objects.filter(id__startswith=author.id)
+            Notification.objects.filter(recipient=author).delete()
+            Like.objects.filter(author__in=bench_authors).delete()
+            Comment.objects.filter(author=author).delete()
+            Post.objects.filter(author=author).delete()
+            bench_authors.delete()
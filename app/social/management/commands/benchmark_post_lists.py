@@ -0,0 +1,81 @@
+import base64
+import os
+import tracemalloc
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from social.models import Author, Post
+from social.serializers import PostSerializer
+
+BENCH_HOST = "http://benchmark.invalid"
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds an author with inline base64 video posts and reports the peak Python "
+        "memory of listing them with full content versus Post.objects.previews(). "
+        "Writes to the configured database; run it against a scratch copy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=50)
+        parser.add_argument("--size-kb", type=int, default=2048, help="Decoded size of each video.")
+        parser.add_argument("--keep", action="store_true", help="Keep the seeded rows afterwards.")
+
+    def handle(self, *args, **options):
+        author = self.seed(options["posts"], options["size_kb"])
+        try:
+            request = RequestFactory().get("/social/api/posts/", HTTP_HOST="localhost")
+            # Fresh querysets per run so no case reads another's result cache
+            full = lambda: Post.objects.filter(author=author)
+            previews = lambda: Post.objects.filter(author=author).previews()
+            cases = {
+                "model rows": (lambda: list(full()), lambda: list(previews())),
+                "values() rows": (
+                    lambda: list(full().values("title", "content", "contentType")),
+                    lambda: list(previews().values("title", "content_preview", "contentType")),
+                ),
+                "serialized list": (
+                    lambda: PostSerializer(full(), many=True, context={"request": request}).data,
+                    lambda: PostSerializer(previews(), many=True, context={"request": request, "preview": True}).data,
+                ),
+            }
+
+            self.stdout.write(f"{'listing':<24}{'full MiB':>12}{'preview MiB':>14}")
+            for name, (before, after) in cases.items():
+                self.stdout.write(f"{name:<24}{self.peak_mib(before):>12.2f}{self.peak_mib(after):>14.2f}")
+        finally:
+            if not options["keep"]:
+                self.cleanup(author)
+
+    def seed(self, post_count, size_kb):
+        self.stdout.write(f"Seeding {post_count} video posts of {size_kb} KiB...")
+        author = Author.objects.create(
+            id=f"{BENCH_HOST}/social/api/authors/{uuid.uuid4()}",
+            host=f"{BENCH_HOST}/social/api/",
+            displayName="Benchmark",
+        )
+        # bulk_create skips Post.save, so the rows keep their content inline like
+        # posts stored before media moved to disk
+        content = base64.b64encode(os.urandom(size_kb * 1024)).decode()
+        Post.objects.bulk_create([
+            Post(id=f"{author.id}/posts/{i}", title=f"video {i}", description="", contentType="video/mp4;base64",
+                 content=content, author=author, visibility="PUBLIC")
+            for i in range(post_count)
+        ], batch_size=10)
+        return author
+
+    def peak_mib(self, listing):
+        tracemalloc.start()
+        try:
+            listing()
+            return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        finally:
+            tracemalloc.stop()
+
+    def cleanup(self, author):
+        self.stdout.write("Removing seeded rows...")
+        Post.objects.filter(author=author).delete()
+        author.delete()
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from social.fqid import serial_of
+from social.models import Comment
+
+
+class Command(BaseCommand):
+    help = "Fills Comment.serial, the indexed last segment of each comment id, for comments saved before it existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=500, help="Rows updated per query.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the rows that would be filled.")
+
+    def handle(self, *args, **options):
+        pending = Comment.objects.filter(serial='').only('id', 'serial')
+        if options["dry_run"]:
+            self.stdout.write(f"{pending.count()} comments would be filled")
+            return
+
+        comments = []
+        for comment in pending.iterator(chunk_size=options["batch"]):
+            comment.serial = serial_of(comment.id)
+            comments.append(comment)
+        Comment.objects.bulk_update(comments, ['serial'], batch_size=options["batch"])
+        self.stdout.write(self.style.SUCCESS(f"Filled the serial of {len(comments)} comments"))
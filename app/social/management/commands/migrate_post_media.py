@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from social import media_storage
+from social.models import Post
+
+
+class Command(BaseCommand):
+    help = "Moves inline base64 image/video content out of Post.content into media files."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=20, help="Rows loaded per query (media rows are large).")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the rows that would move.")
+
+    def handle(self, *args, **options):
+        pending = (
+            Post.objects.filter(
+                Q(contentType__startswith='image/') | Q(contentType__startswith='video/') | Q(contentType='application/base64'),
+                media='',
+            )
+            .exclude(content='')
+            .only('internal_id', 'contentType', 'content', 'media')
+        )
+        if options["dry_run"]:
+            self.stdout.write(f"{pending.count()} posts would be moved")
+            return
+
+        moved = skipped = 0
+        for post in pending.iterator(chunk_size=options["batch"]):
+            if media_storage.externalize(post):
+                post.save(update_fields=['content', 'media'])
+                moved += 1
+            else:
+                skipped += 1
+                self.stdout.write(f"Skipped post {post.internal_id}: content is not valid base64")
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} posts to media storage ({skipped} skipped)"))
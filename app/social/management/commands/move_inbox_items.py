@@ -0,0 +1,50 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from social import notification_counts
+from social.models import Inbox, InboxItem
+
+# Legacy Inbox relation -> (item type, related field on its through table, timestamp field)
+LEGACY_RELATIONS = {
+    "inbox_follows": ("follow", "followrequest", "timestamp"),
+    "inbox_posts": ("post", "post", "published"),
+    "inbox_likes": ("like", "like", "published"),
+    "inbox_comments": ("comment", "comment", "published"),
+}
+
+
+class Command(BaseCommand):
+    help = "Moves items from the legacy Inbox many-to-many tables into InboxItem and empties them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=500, help="Rows inserted per query.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the rows that would move.")
+
+    def handle(self, *args, **options):
+        items = []
+        for relation, (kind, field, timestamp) in LEGACY_RELATIONS.items():
+            through = getattr(Inbox, relation).through
+            rows = through.objects.select_related("inbox", field)
+            if options["dry_run"]:
+                self.stdout.write(f"{rows.count()} {kind} items would be moved")
+                continue
+
+            content_type = ContentType.objects.get_for_model(getattr(Inbox, relation).field.related_model)
+            items += [
+                InboxItem(recipient_id=row.inbox.author_id, type=kind, content_type=content_type,
+                          object_pk=str(getattr(row, f"{field}_id")), created_at=getattr(getattr(row, field), timestamp))
+                for row in rows.iterator(chunk_size=options["batch"])
+            ]
+        if options["dry_run"]:
+            return
+
+        # Insert oldest first so seq follows the original delivery order
+        items.sort(key=lambda item: item.created_at)
+        with transaction.atomic():
+            InboxItem.objects.bulk_create(items, batch_size=options["batch"], ignore_conflicts=True)
+            for relation in LEGACY_RELATIONS:
+                getattr(Inbox, relation).through.objects.all().delete()
+            Inbox.objects.all().delete()
+        notification_counts.invalidate(*{item.recipient_id for item in items})
+        self.stdout.write(self.style.SUCCESS(f"Moved {len(items)} inbox items to InboxItem"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from social import friendships
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the Friendship table from Follow rows (backfill after upgrading, or repair)."
+
+    def handle(self, *args, **options):
+        count = friendships.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} friendship edges"))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from social.models import Comment, Like, Post
+
+
+def _count(queryset, field):
+    """Correlated COUNT(*) of `queryset` rows whose `field` matches the outer row's id."""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('id')}).order_by().values(field).annotate(n=Count('pk')).values('n')
+    ), 0)
+
+
+# (model, counter column, live count)
+COUNTERS = [
+    (Post, 'like_count', lambda: _count(Like.objects, 'object')),
+    (Post, 'comment_count', lambda: _count(Comment.objects, 'post')),
+    (Comment, 'like_count', lambda: _count(Like.objects, 'object')),
+]
+
+
+class Command(BaseCommand):
+    help = "Recomputes the denormalized like and comment counts on Post and Comment where they have drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only count the rows that have drifted.")
+
+    def handle(self, *args, **options):
+        for model, column, live in COUNTERS:
+            drifted = model.objects.exclude(**{column: live()})
+            label = f"{model.__name__}.{column}"
+            if options["dry_run"]:
+                self.stdout.write(f"{drifted.count()} rows of {label} have drifted")
+                continue
+            # One UPDATE ... SET column = (subquery) over the drifted rows only
+            fixed = drifted.update(**{column: live()})
+            self.stdout.write(self.style.SUCCESS(f"Repaired {fixed} rows of {label}"))
@@ -0,0 +1,73 @@
+import time
+import traceback
+
+from django.core.management.base import BaseCommand
+
+from social import federation, inbox_dedup, outbox, thumbnails, video_probe
+
+PRUNE_INTERVAL_SECONDS = 60 * 60
+EVICT_INTERVAL_SECONDS = 10 * 60
+
+
+class Command(BaseCommand):
+    help = "Delivers queued inbox items (OutboxItem rows) to remote nodes and probes new video posts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Process a single batch and exit.")
+        parser.add_argument("--interval", type=float, default=2.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--batch", type=int, default=50, help="Maximum items claimed per batch.")
+        parser.add_argument("--workers", type=int, default=8, help="Nodes delivered to concurrently.")
+        parser.add_argument("--per-node", type=int, default=outbox.PER_NODE_CONCURRENCY,
+                            help="Maximum in-flight deliveries to a single node.")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Outbox worker started")
+        next_prune = 0
+        next_evict = 0
+        while True:
+            # The worker is the node's only long-running job, so it also expires
+            # old inbox delivery receipts
+            if time.monotonic() >= next_prune:
+                pruned = inbox_dedup.prune()
+                if pruned:
+                    self.stdout.write(f"Pruned {pruned} inbox delivery receipts")
+                next_prune = time.monotonic() + PRUNE_INTERVAL_SECONDS
+            # Web processes only count the thumbnails they write themselves; this
+            # pass trims the cache under MEDIA_ROOT, so the worker must mount the
+            # same media volume as the web service (see compose.yml)
+            if time.monotonic() >= next_evict:
+                freed = thumbnails.evict()
+                if freed:
+                    self.stdout.write(f"Evicted {freed} bytes of thumbnails")
+                next_evict = time.monotonic() + EVICT_INTERVAL_SECONDS
+            counts = outbox.run_once(
+                limit=options["batch"],
+                max_workers=options["workers"],
+                per_node=options["per_node"],
+            )
+            # api/nodes/metrics/ is served by the web workers, which read this
+            # worker's counters from the shared cache
+            federation.publish_metrics()
+            if counts["claimed"]:
+                self.stdout.write(
+                    f"claimed={counts['claimed']} delivered={counts['delivered']} "
+                    f"retried={counts['retried']} dead={counts['dead']}"
+                )
+                for base_url, stats in counts["hosts"].items():
+                    self.stdout.write(
+                        f"  {base_url}: sent={stats['sent']} failed={stats['failed']} "
+                        f"avg={stats['avg_ms']}ms max={stats['max_ms']}ms"
+                    )
+            # Duration, dimensions, codec and poster frame of new video posts. A
+            # failure here must not stop federation delivery.
+            try:
+                probed = video_probe.run_once()
+            except Exception:
+                traceback.print_exc()
+                probed = 0
+            if probed:
+                self.stdout.write(f"Probed {probed} video posts")
+            if options["once"]:
+                return
+            if not counts["claimed"] and not probed:
+                time.sleep(options["interval"])
@@ -1,7 +1,22 @@
 from django.db import models
-from django.db.models import Count, Q, Subquery, OuterRef
+from django.db.models import Q
+from django.db.models.functions import Substr
 
-class PostManager(models.Manager):
+# Characters of post.content fetched for list and feed pages
+PREVIEW_LENGTH = 500
+
+
+class PostQuerySet(models.QuerySet):
+    def previews(self, length=PREVIEW_LENGTH):
+        """
+        Leaves the content column out of the SELECT and annotates each post with
+        content_preview, its first `length` characters. Media posts can carry
+        megabytes of base64 in content, which list pages never render.
+        """
+        return self.defer('content').annotate(content_preview=Substr('content', 1, length))
+
+
+class PostManager(models.Manager.from_queryset(PostQuerySet)):
     def filtered(self, filter_type='all', authors=None, content_types=None, visibilities=None):
         """
         Returns a QuerySet of posts filtered by:
@@ -11,19 +26,8 @@ class PostManager(models.Manager):
           - visibilities: list of visibilities (e.g. 'PUBLIC', 'FRIENDS', etc.)
         If visibilities is not provided, only PUBLIC posts are returned
         """
-        from .models import Like  # Import here to avoid circular import
-
-        # Subquery to count likes for each post
-        likes_subquery = Like.objects.filter(
-            object=OuterRef('id')
-        ).values('object').annotate(
-            like_count=Count('id')
-        ).values('like_count')
-
-        # Start with base queryset and annotate with like count
-        qs = super().get_queryset().annotate(
-            like_count=Subquery(likes_subquery, output_field=models.IntegerField())
-        )
+        # Like counts are the denormalized Post.like_count column (see counters.py)
+        qs = super().get_queryset()
 
         # Filter by content types if provided
         if content_types and isinstance(content_types, list) and all(isinstance(item, str) for item in content_types):
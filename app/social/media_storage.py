@@ -0,0 +1,247 @@
+"""
+Content-addressed storage for post images and videos.
+
+Uploaded media is written once under MEDIA_ROOT as posts/<sha256[:2]>/<sha256><ext>
+and Post.media holds that name; Post.content stays empty. The base64 form that
+federation peers expect inline is only built when a payload is serialized.
+Posts created before this (or received with inline base64) keep working from
+Post.content until `manage.py migrate_post_media` moves them out.
+"""
+import base64
+import binascii
+import hashlib
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+CHUNK_SIZE = 64 * 1024
+
+EXTENSIONS = {
+    'image/png;base64': '.png',
+    'image/jpeg;base64': '.jpg',
+    'video/mp4;base64': '.mp4',
+    'video/webm;base64': '.webm',
+    'application/base64': '.bin',
+}
+
+
+def is_media_type(content_type):
+    return bool(content_type) and (
+        content_type.startswith('image/') or content_type.startswith('video/') or content_type == 'application/base64'
+    )
+
+
+def _name_for(digest, content_type):
+    return f"posts/{digest[:2]}/{digest}{EXTENSIONS.get(content_type, '.bin')}"
+
+
+def store_file(upload, content_type):
+    """
+    Stores an uploaded file (anything with .chunks(), e.g. an UploadedFile) and
+    returns its storage name. Uploads received by uploads.MediaUploadHandler
+    carry the sha256 computed while streaming; anything else is hashed in
+    chunks rather than read into memory. Identical files share one stored copy,
+    and a temporary upload file is moved into place rather than copied.
+    """
+    digest = getattr(upload, 'sha256', None)
+    if digest is None:
+        hasher = hashlib.sha256()
+        for chunk in upload.chunks():
+            hasher.update(chunk)
+        digest = hasher.hexdigest()
+    name = _name_for(digest, content_type)
+    if not default_storage.exists(name):
+        upload.seek(0)
+        name = default_storage.save(name, upload)
+    return name
+
+
+def store_bytes(data, content_type):
+    """Stores raw bytes and returns the storage name."""
+    name = _name_for(hashlib.sha256(data).hexdigest(), content_type)
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(data))
+    return name
+
+
+def attach_upload(post, upload):
+    """Stores `upload` as the post's media and clears any inline content."""
+    post.media.name = store_file(upload, post.contentType)
+    post.content = ""
+    # A new file is probed again for its metadata and poster (video_probe.py)
+    post.video_probed = False
+
+
+def externalize(post):
+    """
+    Moves inline base64 media in post.content into storage. Returns True if the
+    post changed. Content that is not valid base64 is left alone.
+    """
+    if post.media or not post.content or not is_media_type(post.contentType):
+        return False
+    try:
+        data = base64.b64decode(post.content, validate=True)
+    except (binascii.Error, ValueError):
+        return False
+    post.media.name = store_bytes(data, post.contentType)
+    post.content = ""
+    post.video_probed = False
+    return True
+
+
+def has_media(post):
+    return bool(post.media) or bool(post.content)
+
+
+def open_media(post):
+    """
+    Returns a binary file object for the post's media. Raises binascii.Error for
+    legacy rows whose inline content is not valid base64.
+    """
+    if post.media:
+        return default_storage.open(post.media.name, 'rb')
+    return io.BytesIO(base64.b64decode(post.content))
+
+
+def media_url(post, request=None):
+    """
+    Returns the URL that serves the post's media: the video endpoint for video
+    posts, the image endpoint otherwise. Absolute when `request` is given.
+    """
+    if post.contentType.startswith('video/'):
+        url = reverse('social:test_video', args=[post.internal_id])
+    else:
+        url = reverse('social:post_image', args=[post.internal_id])
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def inline_content(post):
+    """
+    Returns post.content as federation peers expect it: base64 for media stored
+    on disk, otherwise the stored content unchanged.
+    """
+    if not post.media:
+        return post.content
+    with default_storage.open(post.media.name, 'rb') as media_file:
+        return base64.b64encode(media_file.read()).decode('utf-8')
+
+
+# =============================================================================
+# Serving media over HTTP: conditional requests, byte ranges, chunked bodies.
+# =============================================================================
+
+def media_etag(post):
+    """Stored files are named by their sha256, so the name doubles as a strong ETag."""
+    if post.media:
+        return f'"{os.path.splitext(os.path.basename(post.media.name))[0]}"'
+    return f'"{hashlib.sha256(post.content.encode()).hexdigest()}"'
+
+
+def media_last_modified(post):
+    if post.media:
+        try:
+            return default_storage.get_modified_time(post.media.name)
+        except (NotImplementedError, OSError):
+            pass
+    return post.published
+
+
+def parse_range(header, size):
+    """
+    Parses a single "bytes=start-end" Range header against a body of `size` bytes.
+    Returns (start, end) inclusive, None when the header should be ignored
+    (malformed, other units, or multiple ranges), or False when unsatisfiable.
+    """
+    units, _, spec = header.partition('=')
+    if units.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    start_text, _, end_text = spec.strip().partition('-')
+    try:
+        if start_text == '':
+            suffix = int(end_text)
+            if suffix <= 0:
+                return False
+            start, end = max(0, size - suffix), size - 1
+        else:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return False
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def _stream(media_file, start, length):
+    try:
+        media_file.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = media_file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        media_file.close()
+
+
+def media_response(request, post, mime_type):
+    """
+    Returns the post's media as a streamed response. Honours If-None-Match and
+    If-Modified-Since (304), and a single Range (206) so browsers can seek in
+    videos. The body is read in CHUNK_SIZE pieces, so memory per request stays
+    bounded for media stored on disk.
+    """
+    return file_response(request, lambda: open_media(post), media_etag(post), media_last_modified(post), mime_type)
+
+
+def file_response(request, opener, etag, last_modified, mime_type):
+    """
+    The body of media_response for any stored file: `opener` returns the binary
+    file object, and is only called when the response needs a body.
+    """
+    last_modified = int(last_modified.timestamp())
+    validators = {"ETag": etag, "Last-Modified": http_date(last_modified), "Accept-Ranges": "bytes",
+                  "Cache-Control": "private, no-cache"}
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        for header, value in validators.items():
+            not_modified[header] = value
+        return not_modified
+
+    media_file = opener()
+    media_file.seek(0, os.SEEK_END)
+    size = media_file.tell()
+
+    start, end, status = 0, size - 1, 200
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and (not if_range or if_range == etag):
+        byte_range = parse_range(range_header, size)
+        if byte_range is False:
+            media_file.close()
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+        if byte_range:
+            start, end = byte_range
+            status = 206
+
+    length = max(0, end - start + 1)
+    response = StreamingHttpResponse(_stream(media_file, start, length), status=status, content_type=mime_type)
+    response["Content-Length"] = str(length)
+    if status == 206:
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    for header, value in validators.items():
+        response[header] = value
+    return response
@@ -1,8 +1,9 @@
-import re
 import io
 from django.http import HttpResponse, HttpResponseForbidden
 import base64
 
+from . import screening
+
 class SecurityMiddleware:
     """
     Middleware to provide additional security against malicious requests.
@@ -22,9 +23,10 @@ class SecurityMiddleware:
         'multipart/form-data',
     ]
     
-    # Common video signature bytes
+    # Common video signature bytes, looked for in the first 16 bytes (see uploads.py).
+    # MP4 starts with an "ftyp" box whose 4-byte size varies by encoder (0x18, 0x1C, 0x20, ...).
     VIDEO_SIGNATURES = {
-        'mp4': [b'\x00\x00\x00\x18\x66\x74\x79\x70', b'\x00\x00\x00\x20\x66\x74\x79\x70'],
+        'mp4': [b'\x66\x74\x79\x70'],
         'webm': [b'\x1A\x45\xDF\xA3']
     }
     
@@ -55,17 +57,21 @@ class SecurityMiddleware:
             
             # If not allowed content type, check for malicious patterns
             if not is_allowed_content:
-                all_patterns = self._get_security_patterns()
-                
-                # Check POST data
+                # Check POST data, one pass of the compiled rules per value (see screening.py)
                 for key, value in request.POST.items():
                     if isinstance(value, str):
-                        for pattern in all_patterns:
-                            if re.search(pattern, value, re.IGNORECASE):
-                                return HttpResponseForbidden("Malicious content detected")
+                        rule = screening.scan(value)
+                        if rule:
+                            print(f"From middleware: Field {key!r} matched screening rule {rule}")
+                            return HttpResponseForbidden("Malicious content detected")
             
             # Special handling for file uploads - always check these
-            for key, file in request.FILES.items():
+            files = request.FILES
+            # Videos whose header failed the signature check while streaming (see uploads.py)
+            rejected_uploads = getattr(request, 'rejected_uploads', None)
+            if rejected_uploads:
+                return HttpResponseForbidden(next(iter(rejected_uploads.values())))
+            for key, file in files.items():
                 # Check filename for malicious content
                 if hasattr(file, 'name'):
                     filename = file.name.lower()
@@ -86,24 +92,6 @@ class SecurityMiddleware:
                                 
                         if not valid_ext:
                             return HttpResponseForbidden(f"Invalid video file extension. Allowed: {', '.join(allowed_extensions['video'])}")
-                            
-                        # Basic content check for videos - first 16 bytes should be enough
-                        if hasattr(file, 'read') and hasattr(file, 'seek'):
-                            file_header = file.read(16)
-                            file.seek(0)  # Reset file pointer
-                            
-                            valid_video = False
-                            for format_type, signatures in self.VIDEO_SIGNATURES.items():
-                                for sig in signatures:
-                                    # Check if signature is in the header (not necessarily at the start)
-                                    if sig in file_header:
-                                        valid_video = True
-                                        break
-                                        
-                            valid_video = True
-                            
-                            if not valid_video:
-                                return HttpResponseForbidden("Invalid video format or corrupted file")
                     
                     # Specialized handling for base64 content
                     if key == 'content' and 'base64' in request.POST.get('contentType', ''):
@@ -117,35 +105,3 @@ class SecurityMiddleware:
                             return HttpResponseForbidden("Invalid base64 content")
         
         return self.get_response(request)
-    
-    def _get_security_patterns(self):
-        sql_injection_patterns = [
-            r'(\%27)|(\')|(\-\-)|(\%23)|(#)',
-            r'((\%3D)|(=))[^\n]*((\%27)|(\')|(\-\-)|(\%3B)|(;))',
-            r'/\w*((\%27)|(\'))((\%6F)|o|(\%4F))((\%72)|r|(\%52))',
-            r'((\%27)|(\'))union',
-            r'exec(\s|\+)+(s|x)p\w+',
-        ]
-        
-        xss_patterns = [
-            r'<script.*?>.*?</script>',
-            r'javascript:',
-            r'onerror=',
-            r'onload=',
-            r'eval\(',
-            r'document\.cookie',
-            r'document\.write',
-            r'<iframe.*?>.*?</iframe>',
-        ]
-        
-        command_injection_patterns = [
-            r'[;&|`]',
-            r'\$\(.*?\)',
-            r'\$\{.*?\}',
-            r'`.*?`',
-            r'\|.*?\|',
-            r'&&.*?&&',
-            r';.*?;',
-        ]
-        
-        return sql_injection_patterns + xss_patterns + command_injection_patterns
\ No newline at end of file
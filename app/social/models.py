@@ -1,10 +1,14 @@
-from django.db import models
+from django.db import models, transaction
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth.models import User
 from social.managers import PostManager
+from social.fqid import serial_of
 from django.utils import timezone
 from urllib.parse import urlparse
 import uuid
 import os
+import json
 
 BLANK_PIC_URL = "https://i.imgur.com/7MUSXf9.png"
 
@@ -13,6 +17,18 @@ def get_base_url(full_url):
     parsed_url = urlparse(full_url)
     return f"{parsed_url.scheme}://{parsed_url.netloc}"  # Keeps protocol + domain/IP
 
+def without_counters(instance, kwargs, counters):
+    """
+    Leaves the counter columns out of a full save of an existing row, so a stale
+    in-memory instance cannot overwrite counts that counters.py changed since.
+    """
+    if not instance._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+        deferred = instance.get_deferred_fields()
+        kwargs['update_fields'] = [
+            field.name for field in instance._meta.concrete_fields
+            if not field.primary_key and field.name not in counters and field.attname not in deferred
+        ]
+
 # =============================================================================
 # Node
 # =============================================================================
@@ -23,6 +39,7 @@ class Node(models.Model):
     auth_username = models.CharField(max_length=100, unique=True) # TODO: Figure this out
     auth_password = models.CharField(max_length=100) # TODO: Figure this out
     enabled = models.BooleanField(default=True)  # Controls whether this node can communicate
+    batch_inbox_url = models.URLField(blank=True)  # Peer's batch inbox endpoint, learned from its responses
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -53,13 +70,9 @@ class Author(models.Model):
     def friends(self):
         """
         Returns a QuerySet of all authors who are mutual followers.
+        Reads the Friendship table, which Follow signals keep up to date.
         """
-        followees = Follow.objects.filter(follower_id=self.id).values_list('followee', flat=True)
-        followers = Follow.objects.filter(followee=self).values_list('follower_id', flat=True)
-
-        # Mutual followers = people who follow this user & are followed back
-        mutual_followers = Author.objects.filter(id__in=followees).filter(id__in=followers)
-        return mutual_followers
+        return Author.objects.filter(friend_of__author=self)
     
     @property
     def remote_followers(self):
@@ -138,11 +151,22 @@ class Post(models.Model):
     description = models.CharField(max_length=255)
     contentType = models.CharField(max_length=50, choices=CONTENT_TYPE_CHOICES)
     content = models.TextField()
+    media = models.FileField(upload_to='posts/', max_length=255, blank=True)  # image/video bytes, see media_storage.py
     author = models.ForeignKey(Author, on_delete=models.CASCADE)
     published = models.DateTimeField(auto_now_add=True)
     visibility = models.CharField(max_length=50, choices=CONTENT_VISIBILITY_CHOICES)
     
     internal_id = models.AutoField(primary_key=True, editable=False)
+    like_count = models.PositiveIntegerField(default=0, editable=False)  # maintained by counters.py
+    comment_count = models.PositiveIntegerField(default=0, editable=False)  # maintained by counters.py
+
+    # Video posts: container metadata and poster frame, filled in by the run_outbox worker (see video_probe.py)
+    video_probed = models.BooleanField(default=False, db_index=True, editable=False)
+    video_duration = models.FloatField(null=True, blank=True, editable=False)  # seconds
+    video_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    video_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    video_codec = models.CharField(max_length=32, blank=True, editable=False)
+    poster = models.FileField(upload_to='posts/', max_length=255, blank=True, editable=False)
 
     @property
     def comments(self):
@@ -161,7 +185,15 @@ class Post(models.Model):
         """
         Returns the number of likes for this post.
         """
-        return self.likes.count()
+        return self.like_count
+
+    @property
+    def video_duration_label(self):
+        """The video's duration as m:ss, or "" before it has been probed."""
+        if self.video_duration is None:
+            return ""
+        minutes, seconds = divmod(int(round(self.video_duration)), 60)
+        return f"{minutes}:{seconds:02d}"
     
 
     class Meta:
@@ -174,6 +206,13 @@ class Post(models.Model):
     def save(self, *args, **kwargs):
         is_new = self._state.adding
 
+        # Keep image/video bytes out of the database (covers API and inbox writes)
+        from .media_storage import externalize
+        if 'content' not in self.get_deferred_fields() and externalize(self) and kwargs.get('update_fields'):
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'content', 'media', 'video_probed'}
+
+        without_counters(self, kwargs, ('like_count', 'comment_count'))
+
         # Only auto-generate ID if it's not provided (i.e., local post)
         if is_new and not self.id:
             super().save(*args, **kwargs)  # Save first so internal_id is assigned
@@ -201,6 +240,8 @@ class Comment(models.Model):
     type = models.CharField(max_length=10, default="comment")
     id = models.URLField(primary_key=True)
     internal_id = models.UUIDField(default=uuid.uuid4, editable=False)  # Remove unique=True for now
+    serial = models.CharField(max_length=255, blank=True, db_index=True, editable=False)  # last segment of id, see resolver.py
+    like_count = models.PositiveIntegerField(default=0, editable=False)  # maintained by counters.py
     author = models.ForeignKey('Author', on_delete=models.CASCADE, related_name='comments')
     comment = models.TextField()  
     contentType = models.CharField(max_length=50, default="text/markdown")
@@ -222,17 +263,25 @@ class Comment(models.Model):
 
             # Construct the unique comment ID
             self.id = f"{base_url}/social/api/authors/{author_id_part}/commented/{self.internal_id}"     
-        super().save(*args, **kwargs)
+        self.serial = serial_of(self.id)
+        if kwargs.get('update_fields'):
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'serial'}
+        without_counters(self, kwargs, ('like_count',))
+        # The post_save counter update (signals.py) commits with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
     
     class Meta:
         ordering = ['-published']
+        indexes = [
+            models.Index(fields=['post', '-published']),  # comments on a post, newest first
+        ]
     
     def __str__(self):
         return f"Comment by {self.author.displayName} on {self.published.strftime('%Y-%m-%d')}"
 
     def get_likes_count(self):
-        from .models import Like
-        return Like.objects.filter(object=self.id).count()
+        return self.like_count
 # =============================================================================
 # Follow: Represents a relationship between two authors (follower and followee).
 # =============================================================================
@@ -256,6 +305,9 @@ class FollowRequest(models.Model):
 
     class Meta:
         unique_together = ("follower_id", "followee")  # Prevent duplicate follow requests
+        indexes = [
+            models.Index(fields=['followee', 'status']),  # pending follow request counts
+        ]
 
     def __str__(self):
         return f"{self.follower_id} -> {self.followee.displayName} ({self.status})"
@@ -275,6 +327,25 @@ class Follow(models.Model):
     def __str__(self):
         return f"{self.follower_id} follows {self.followee.displayName}"
 
+
+# =============================================================================
+# Friendship: Materialized mutual-follow edge, maintained from Follow signals.
+# =============================================================================
+
+class Friendship(models.Model):
+    """
+    One row per direction of a friendship (A -> B and B -> A), kept in sync with
+    Follow by the handlers in signals.py. See social/friendships.py.
+    """
+    author = models.ForeignKey('Author', on_delete=models.CASCADE, related_name='friendships')
+    friend = models.ForeignKey('Author', on_delete=models.CASCADE, related_name='friend_of')
+
+    class Meta:
+        unique_together = ("author", "friend")
+
+    def __str__(self):
+        return f"{self.author_id} <-> {self.friend_id}"
+
 class Comments(models.Model):
     type = models.CharField(max_length=50)
 
@@ -299,10 +370,15 @@ class Like(models.Model):
             # Construct the unique like ID
             self.id = f"{base_url}/social/api/authors/{author_id_part}/liked/{like_id}"
 
-        super().save(*args, **kwargs)
+        # The post_save counter update (signals.py) commits with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
     
     class Meta:
         ordering = ['-published']
+        indexes = [
+            models.Index(fields=['object', 'author']),  # like counts and "has this author liked it"
+        ]
         unique_together = ('author', 'object')  # Prevent duplicate likes
 
 class Likes(models.Model):
@@ -317,6 +393,8 @@ class Posts(models.Model):
     src = models.ForeignKey(Post, on_delete=models.CASCADE)
 
 class Inbox(models.Model):
+    # Legacy: inbox items now live in InboxItem. These relations are no longer
+    # written and are emptied by `manage.py move_inbox_items`.
     author = models.ForeignKey('Author', on_delete=models.CASCADE)
     type = models.CharField(max_length=30, default='inbox')
     inbox_posts = models.ManyToManyField(Post,blank = True)
@@ -347,6 +425,121 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['content_object_id']),
+            models.Index(fields=['recipient', 'notification_type', 'is_read']),  # unread badge counts
+        ]
     
     def __str__(self):
-        return f"{self.sender_name} {self.get_notification_type_display()} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
\ No newline at end of file
+        return f"{self.sender_name} {self.get_notification_type_display()} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+
+# =============================================================================
+# OutboxEvent / OutboxItem: Queued inbox deliveries to remote nodes.
+# =============================================================================
+
+class OutboxEvent(models.Model):
+    """
+    The serialized JSON body of one outbound activity. It is stored once and
+    shared by every OutboxItem (recipient) it is fanned out to.
+    """
+    type = models.CharField(max_length=30)
+    body = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.type} ({self.created_at:%Y-%m-%d %H:%M})"
+
+
+# =============================================================================
+# InboxItem: one row per item delivered to an author's inbox.
+# =============================================================================
+
+class InboxItem(models.Model):
+    """
+    The inbox store: a typed row per delivered post, like, comment or follow
+    request, pointing at its target through a generic foreign key. Pages are read
+    in delivery order with one query (see inbox_service.py). seq only grows, so
+    `GET .../inbox?since=<cursor>` can return just the items delivered after the
+    client's last poll.
+    """
+    TYPE_CHOICES = [
+        ('post', 'Post'),
+        ('like', 'Like'),
+        ('comment', 'Comment'),
+        ('follow', 'Follow request'),
+    ]
+
+    seq = models.BigAutoField(primary_key=True)
+    recipient = models.ForeignKey(Author, on_delete=models.CASCADE, related_name='inbox_items')
+    type = models.CharField(max_length=10, choices=TYPE_CHOICES)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_pk = models.CharField(max_length=255)  # pk of the Post / Like / Comment / FollowRequest
+    target = GenericForeignKey('content_type', 'object_pk')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('recipient', 'content_type', 'object_pk')
+        indexes = [
+            models.Index(fields=['recipient', 'created_at', 'type']),  # inbox pages, newest first
+            models.Index(fields=['recipient', 'seq']),  # ?since= deltas
+            models.Index(fields=['recipient', 'type', 'seq']),
+        ]
+
+    def __str__(self):
+        return f"#{self.seq} {self.type} -> {self.recipient_id}"
+
+
+class OutboxItem(models.Model):
+    """
+    One outbound inbox request, stored so the web request can return before the
+    remote node answers. Rows are drained by `python manage.py run_outbox`.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('delivering', 'Delivering'),
+        ('delivered', 'Delivered'),
+        ('dead', 'Dead'),
+    ]
+
+    event = models.ForeignKey(OutboxEvent, on_delete=models.CASCADE, related_name='items')
+    node = models.ForeignKey(Node, on_delete=models.CASCADE, related_name='outbox_items')
+    inbox_url = models.URLField(max_length=500)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['next_attempt_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    @property
+    def payload(self):
+        return json.loads(self.event.body)
+
+    def __str__(self):
+        return f"{self.event.type} -> {self.inbox_url} ({self.status})"
+
+
+# =============================================================================
+# DeliveryReceipt: inbox deliveries already handled, for dedup of retries.
+# =============================================================================
+
+class DeliveryReceipt(models.Model):
+    """
+    One row per handled inbox delivery that carried an activity id, keyed on a
+    hash of (sender, recipient, activity id). A retry with the same body is
+    answered from here instead of being stored again (see inbox_dedup.py).
+    Rows older than INBOX_DEDUP_TTL_SECONDS are ignored and pruned.
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    digest = models.CharField(max_length=64)  # sha256 of the activity body
+    status = models.PositiveSmallIntegerField()  # HTTP status the delivery was answered with
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.key[:12]} ({self.status})"
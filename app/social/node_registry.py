@@ -0,0 +1,136 @@
+"""
+In-process registry of Node rows for the federation hot paths.
+
+Node authentication, disabled-node checks and fan-out routing look nodes up on
+every federated request. The registry keeps every Node in memory, indexed by
+auth_username and by normalized host, so those lookups are dictionary hits.
+
+Each gunicorn worker (and the outbox worker) holds its own copy. Saving or
+deleting a Node (signals.py) stores a new version token under VERSION_KEY in
+the shared cache. A process compares its token at most every
+CHECK_SECONDS and reloads when it changed, and reloads after MAX_AGE_SECONDS
+regardless in case the cache was cleared.
+"""
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Node
+
+VERSION_KEY = "social:node_registry:version"
+CHECK_SECONDS = getattr(settings, "NODE_REGISTRY_CHECK_SECONDS", 5)
+MAX_AGE_SECONDS = getattr(settings, "NODE_REGISTRY_MAX_AGE_SECONDS", 300)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+_lock = threading.Lock()
+_registry = {"version": None, "loaded_at": 0.0, "checked_at": 0.0}
+
+
+def normalize_host(value):
+    """
+    Returns the lowercase host[:port] of a URL or bare host, e.g.
+    "http://Node.com:8000/social/api/" and "node.com:8000" both give "node.com:8000".
+    The scheme's default port is dropped: "http://node.com:80/" gives "node.com".
+    """
+    value = (value or "").strip().lower()
+    if "//" not in value:
+        value = "//" + value
+    parts = urlsplit(value)
+    try:
+        port = parts.port
+    except ValueError:
+        return parts.netloc
+    if port is not None and port == DEFAULT_PORTS.get(parts.scheme):
+        return parts.hostname
+    return parts.netloc
+
+
+def _build(version):
+    by_username, by_base_url, by_netloc = {}, {}, {}
+    # Lowest pk first, so a host shared by several rows resolves like .first() did
+    for node in Node.objects.order_by("pk"):
+        by_username[node.auth_username] = node
+        by_base_url[node.base_url] = node
+        by_netloc.setdefault(normalize_host(node.base_url), node)
+    now = time.monotonic()
+    return {
+        "version": version, "loaded_at": now, "checked_at": now,
+        "by_username": by_username, "by_base_url": by_base_url, "by_netloc": by_netloc,
+    }
+
+
+def _current():
+    global _registry
+    registry = _registry
+    now = time.monotonic()
+    if registry["version"] is not None and now - registry["checked_at"] < CHECK_SECONDS:
+        return registry
+
+    try:
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+            version = cache.get(VERSION_KEY)
+    except Exception as e:
+        # Without the cache, fall back to reloading every MAX_AGE_SECONDS
+        print(f"From node_registry: Cannot read registry version: {e}")
+        version = registry["version"] or "uncached"
+    with _lock:
+        if _registry["version"] != version or now - _registry["loaded_at"] >= MAX_AGE_SECONDS:
+            _registry = _build(version)
+        else:
+            _registry["checked_at"] = now
+        return _registry
+
+
+def invalidate():
+    """Makes every process reload on its next lookup; this one reloads right away."""
+    global _registry
+    try:
+        cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+    except Exception as e:
+        # e.g. the cache table is created after the post_migrate Node setup
+        print(f"From node_registry: Cannot publish registry version: {e}")
+    with _lock:
+        _registry = {"version": None, "loaded_at": 0.0, "checked_at": 0.0}
+
+
+def by_username(username):
+    """Returns the Node with this auth_username, or None."""
+    return _current()["by_username"].get(username)
+
+
+def by_host(value):
+    """
+    Returns the Node serving a URL or host, or None. An exact base_url match wins,
+    then the same host:port. Another port on the same host is another service, so
+    it never matches.
+    """
+    registry = _current()
+    if value in registry["by_base_url"]:
+        return registry["by_base_url"][value]
+    return registry["by_netloc"].get(normalize_host(value))
+
+
+def get_by_host(value):
+    """Like by_host, but raises Node.DoesNotExist when no node matches."""
+    node = by_host(value)
+    if node is None:
+        raise Node.DoesNotExist(f"No node for host {value!r}")
+    return node
+
+
+def is_disabled(host):
+    """True if `host` belongs to a node that has been disabled."""
+    node = by_host(host) if host else None
+    return node is not None and not node.enabled
+
+
+def enabled_nodes():
+    """Returns the enabled nodes, lowest pk first."""
+    return [node for node in _current()["by_username"].values() if node.enabled]
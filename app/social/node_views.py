@@ -4,6 +4,7 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
 from .authentication import NodeBasicAuthentication
+from . import federation
 from .models import Node
 from .serializers import NodeSerializer
 from rest_framework.permissions import IsAuthenticated  # adjust permission as needed
@@ -43,4 +44,18 @@ class NodeRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
         if serializer.is_valid():
             node = serializer.save()
             return Response(NodeSerializer(node).data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class NodeMetricsAPIView(generics.GenericAPIView):
+    """
+    GET: Per-node counters for outbound federation calls (request count, error
+    count, average latency in ms, last status code), summed over the web
+    workers and the run_outbox worker. Other processes publish their counters
+    every FEDERATION_METRICS_PUBLISH_SECONDS, so their latest calls may be missing.
+    """
+    authentication_classes = [NodeBasicAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        return Response(federation.shared_metrics())
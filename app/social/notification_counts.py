@@ -0,0 +1,68 @@
+"""
+Unread notification counts for the navbar badge.
+
+Every open page polls get_notification_count. Each poll used to run three
+COUNT queries (unread likes, unread comments, pending follow requests) plus a
+MAX over the inbox for the `since` cursor, and the notification pages repeated
+the counts. A recipient's counts are now one cache entry:
+
+    {"like_count", "comment_count", "follow_count", "seq"}    (seq: newest InboxItem)
+
+so a poll is a single key lookup. The entry is dropped whenever an input
+changes and rebuilt by the next read:
+
+    - Notification and FollowRequest saves and deletes: the receivers in signals.py
+    - notifications marked read with queryset updates, which send no signals:
+      the notification views call invalidate()
+    - inbox deliveries and removals: inbox_service's writers
+
+Invalidation also runs again when the surrounding transaction commits, so a
+read racing an uncommitted write cannot leave stale counts cached.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .models import FollowRequest, InboxItem, Notification
+
+CACHE_TIMEOUT = getattr(settings, "NOTIFICATION_COUNTS_TIMEOUT", 60 * 60)
+
+LIKE_TYPES = ('like_post', 'like_comment')
+
+
+def _key(author_id):
+    return f"notification_counts:{author_id}"
+
+
+def invalidate(*author_ids):
+    """Drops the cached counts of the given authors (by primary key)."""
+    keys = [_key(author_id) for author_id in author_ids if author_id]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def compute(author):
+    """Counts from the database: one grouped query per table."""
+    unread = dict(
+        Notification.objects.filter(recipient=author, is_read=False)
+        .values_list('notification_type').annotate(count=Count('id')).order_by()
+    )
+    return {
+        "like_count": sum(unread.get(kind, 0) for kind in LIKE_TYPES),
+        "comment_count": unread.get('comment', 0),
+        "follow_count": FollowRequest.objects.filter(followee=author, status='pending').count(),
+        "seq": InboxItem.objects.filter(recipient=author).aggregate(seq=Max('seq'))['seq'] or 0,
+    }
+
+
+def get(author):
+    """Returns `author`'s counts, from the cache when present."""
+    key = _key(author.pk)
+    counts = cache.get(key)
+    if counts is None:
+        counts = compute(author)
+        cache.set(key, counts, CACHE_TIMEOUT)
+    return counts
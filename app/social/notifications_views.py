@@ -2,9 +2,12 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
-import requests
+from django.utils.cache import get_conditional_response
+import hashlib
 
 from .models import Author, Notification
+from . import inbox_service
+from . import notification_counts
 
 @login_required
 def notifications_home(request):
@@ -16,36 +19,11 @@ def notifications_home(request):
         
     author = request.user.author
     
-    # Get counts for different notification types
-    like_count = Notification.objects.filter(
-        recipient=author, 
-        notification_type__in=['like_post', 'like_comment'],
-        is_read=False
-    ).count()
-    
-    comment_count = Notification.objects.filter(
-        recipient=author, 
-        notification_type='comment',
-        is_read=False
-    ).count()
-    
-    # Get follow request count
-    my_author_id = author.id
-    inbox_url = f"{my_author_id}/inbox"
-    
-    try:
-        response = requests.get(inbox_url, headers={"Content-Type": "application/json"})
-        response.raise_for_status()
-        inbox_data = response.json()
-        
-        # Extract only "follow" requests
-        follow_requests = [
-            item for item in inbox_data.get("items", [])
-            if item.get("type", "").lower() == "follow"
-        ]
-        follow_count = len(follow_requests)
-    except requests.exceptions.RequestException:
-        follow_count = 0
+    # Get counts for different notification types (cached, see notification_counts.py)
+    counts = notification_counts.get(author)
+    like_count = counts['like_count']
+    comment_count = counts['comment_count']
+    follow_count = counts['follow_count']
     
     context = {
         'my_author_id': author.id,
@@ -76,23 +54,18 @@ def notifications_likes(request):
     ).order_by('-created_at')
     
     # Get counts for badges
-    comment_count = Notification.objects.filter(
-        recipient=author, notification_type='comment', is_read=False
-    ).count()
-    
-    # You can get your follow request count from your existing system
-    from .models import FollowRequest
-    follow_count = FollowRequest.objects.filter(followee=author, status='pending').count()
+    counts = notification_counts.get(author)
     
     # Mark notifications as read
-    notifications.filter(is_read=False).update(is_read=True)
+    if notifications.filter(is_read=False).update(is_read=True):
+        notification_counts.invalidate(author.pk)
     
     context = {
         'my_author_id': author.id,
         'notifications': notifications,
         'like_count': 0,  # Reset since we're viewing them
-        'comment_count': comment_count,
-        'follow_count': follow_count,
+        'comment_count': counts['comment_count'],
+        'follow_count': counts['follow_count'],
         'active_tab': 'likes'
     }
     
@@ -115,23 +88,18 @@ def notifications_comments(request):
     ).order_by('-created_at')
     
     # Get counts for badges
-    like_count = Notification.objects.filter(
-        recipient=author, notification_type__in=['like_post', 'like_comment'], is_read=False
-    ).count()
-    
-    # You can get your follow request count from your existing system
-    from .models import FollowRequest
-    follow_count = FollowRequest.objects.filter(followee=author, status='pending').count()
+    counts = notification_counts.get(author)
     
     # Mark notifications as read
-    notifications.filter(is_read=False).update(is_read=True)
+    if notifications.filter(is_read=False).update(is_read=True):
+        notification_counts.invalidate(author.pk)
     
     context = {
         'my_author_id': author.id,
         'notifications': notifications,
-        'like_count': like_count,
+        'like_count': counts['like_count'],
         'comment_count': 0,  # Reset since we're viewing them
-        'follow_count': follow_count,
+        'follow_count': counts['follow_count'],
         'active_tab': 'comments'
     }
     
@@ -148,8 +116,9 @@ def mark_notification_read(request, notification_id):
     author = request.user.author
     notification = get_object_or_404(Notification, id=notification_id, recipient=author)
     
+    # The post_save receiver drops the cached badge counts
     notification.is_read = True
-    notification.save()
+    notification.save(update_fields=['is_read'])
     
     # Return to the previous page
     next_url = request.GET.get('next', 'social:notifications_home')
@@ -164,7 +133,8 @@ def mark_all_notifications_read(request):
         return redirect('social:register')
         
     author = request.user.author
-    Notification.objects.filter(recipient=author, is_read=False).update(is_read=True)
+    if Notification.objects.filter(recipient=author, is_read=False).update(is_read=True):
+        notification_counts.invalidate(author.pk)
     
     # Return to notifications home
     return redirect('social:notifications_home')
@@ -172,39 +142,44 @@ def mark_all_notifications_read(request):
 @login_required
 def get_notification_count(request):
     """
-    endpoint to get unread notification counts for badges
+    endpoint to get unread notification counts for badges. The counts are one
+    cache lookup (see notification_counts.py); the response carries an ETag,
+    so a poll whose counts have not changed gets a 304 without a body.
     """
     if request.method == 'GET':
         if not hasattr(request.user, 'author'):
             return JsonResponse({'error': 'User has no author profile'}, status=400)
             
         author = request.user.author
-        
-        # Count notifications by type
-        like_count = Notification.objects.filter(
-            recipient=author, 
-            notification_type__in=['like_post', 'like_comment'],
-            is_read=False
-        ).count()
-        
-        comment_count = Notification.objects.filter(
-            recipient=author, 
-            notification_type='comment',
-            is_read=False
-        ).count()
-        
-        # You can get your follow request count from your existing system
-        from .models import FollowRequest
-        follow_count = FollowRequest.objects.filter(followee=author, status='pending').count()
+        counts = notification_counts.get(author)
         
         # Total count for the main badge
-        total_count = like_count + comment_count + follow_count
+        total_count = counts['like_count'] + counts['comment_count'] + counts['follow_count']
+        
+        # Pollers send back `since` to also get the number of items that reached
+        # the inbox in the meantime, instead of refetching the inbox. The cached
+        # newest seq answers a poll with nothing new without a query.
+        since = request.GET.get('since')
+        try:
+            if since:
+                new_items, since = inbox_service.delta_counts(author, since, latest=counts['seq'])
+            else:
+                new_items, since = None, inbox_service.latest_since(author, seq=counts['seq'])
+        except ValueError:
+            return JsonResponse({'error': 'Invalid since cursor'}, status=400)
         
-        return JsonResponse({
+        response = JsonResponse({
             'total_count': total_count,
-            'like_count': like_count,
-            'comment_count': comment_count,
-            'follow_count': follow_count
+            'like_count': counts['like_count'],
+            'comment_count': counts['comment_count'],
+            'follow_count': counts['follow_count'],
+            'new_items': new_items,
+            'since': since
         })
+        etag = f'"{hashlib.md5(response.content).hexdigest()}"'
+        response['ETag'] = etag
+        # Browsers revalidate every poll, sending the ETag back as If-None-Match
+        response['Cache-Control'] = 'private, no-cache'
+        return get_conditional_response(request, etag=etag, response=response)
     
-    return JsonResponse({'error': 'Method not allowed'}, status=405)
\ No newline at end of file
+    return JsonResponse({'error': 'Method not allowed'}, status=405)
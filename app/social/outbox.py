@@ -0,0 +1,299 @@
+import json
+import time
+import traceback
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import federation
+from .federation import BATCH_INBOX_HEADER, BATCH_TYPES, MAX_BATCH_SIZE
+from .models import OutboxEvent, OutboxItem
+
+MAX_ATTEMPTS = getattr(settings, "OUTBOX_MAX_ATTEMPTS", 8)
+BACKOFF_SECONDS = getattr(settings, "OUTBOX_BACKOFF_SECONDS", 30)
+MAX_BACKOFF_SECONDS = getattr(settings, "OUTBOX_MAX_BACKOFF_SECONDS", 6 * 60 * 60)
+PER_NODE_CONCURRENCY = getattr(settings, "OUTBOX_PER_NODE_CONCURRENCY", 4)
+REQUEST_TIMEOUT = getattr(settings, "OUTBOX_REQUEST_TIMEOUT", 10)
+
+# How long a claimed row stays invisible to other workers before it is retried.
+# Covers a worker that dies between claiming and recording the result.
+CLAIM_LEASE_SECONDS = REQUEST_TIMEOUT * 4
+
+# Post distributions are retried on failure as a plain 'post', then as a PUT (or
+# DELETE), as the inline sender did before the outbox existed
+FALLBACK_TYPES = ('post', 'update', 'delete')
+
+def enqueue(node, inbox_url, payload):
+    """
+    Queues a payload for delivery to a single remote inbox and returns the OutboxItem.
+    Nothing is sent here; the run_outbox worker picks the row up.
+    """
+    return enqueue_many([(node, inbox_url)], payload)[0]
+
+
+def enqueue_many(targets, payload):
+    """
+    Queues one payload for many (node, inbox_url) targets. The payload is
+    serialized once into an OutboxEvent and every recipient row points at it,
+    so a post fanned out to 500 followers stores and encodes its body once.
+    """
+    if not targets:
+        return []
+    event = OutboxEvent.objects.create(
+        type=payload.get("type", ""),
+        body=json.dumps(payload, cls=DjangoJSONEncoder),
+    )
+    items = OutboxItem.objects.bulk_create([
+        OutboxItem(event=event, node=node, inbox_url=inbox_url)
+        for node, inbox_url in targets
+    ])
+    print(f"From outbox: Queued {event.type} for {len(items)} inbox(es)")
+    return items
+
+
+def backoff_delay(attempts):
+    """Returns the delay before retry number `attempts` (exponential, capped)."""
+    return timedelta(seconds=min(BACKOFF_SECONDS * (2 ** (attempts - 1)), MAX_BACKOFF_SECONDS))
+
+
+def same_origin(url, base_url):
+    """True if `url` has the scheme and host (with port) of `base_url`."""
+    parsed, base = urlsplit(url), urlsplit(base_url)
+    return bool(parsed.netloc) and (parsed.scheme.lower(), parsed.netloc.lower()) == (base.scheme.lower(), base.netloc.lower())
+
+
+def is_batched(item):
+    """True if the item goes out in a batch request to its node's batch inbox."""
+    node = item.node
+    return (bool(node.batch_inbox_url) and same_origin(node.batch_inbox_url, node.base_url)
+            and item.event.type.lower() in BATCH_TYPES)
+
+
+def claim_batch(limit=50, per_node=PER_NODE_CONCURRENCY):
+    """
+    Marks due rows as delivering and returns them: up to `limit` requests' worth,
+    and at most `per_node` requests for any single node so one slow peer cannot
+    fill the batch. Items sent to a batch inbox share a request, so up to
+    MAX_BATCH_SIZE of them count as one.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = (
+            OutboxItem.objects.select_for_update(skip_locked=True)
+            .select_related('node', 'event')
+            .filter(Q(status='pending') | Q(status='delivering'), next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:limit * 4]
+        )
+
+        per_node_taken = defaultdict(int)
+        claimed = []
+        requests_taken = 0
+        for item in due:
+            if per_node_taken[item.node_id] >= per_node:
+                continue
+            cost = 1 / MAX_BATCH_SIZE if is_batched(item) else 1
+            per_node_taken[item.node_id] += cost
+            requests_taken += cost
+            claimed.append(item)
+            if requests_taken >= limit:
+                break
+
+        OutboxItem.objects.filter(pk__in=[item.pk for item in claimed]).update(
+            status='delivering',
+            next_attempt_at=now + timedelta(seconds=CLAIM_LEASE_SECONDS),
+        )
+    return claimed
+
+
+def deliver(item):
+    """
+    Sends one OutboxItem over the node's pooled federation session.
+    Returns (ok, error_message).
+
+    The pre-serialized event body is sent as-is. Not every node accepts a post
+    on the first try (updates and deletes use custom 'type' values), so on
+    failure a post, update or delete is re-sent as a plain 'post' and then as a
+    PUT or DELETE.
+    """
+    if not item.node.enabled:
+        return False, "Node is disabled"
+
+    event = item.event
+    try:
+        node = item.node
+        response = federation.post(node, item.inbox_url, data=event.body, timeout=REQUEST_TIMEOUT)
+        if not response.ok and event.type in FALLBACK_TYPES:
+            fallback_body = json.dumps(dict(json.loads(event.body), type='post'))
+            response = federation.post(node, item.inbox_url, data=fallback_body, timeout=REQUEST_TIMEOUT)
+            if not response.ok:
+                method = 'DELETE' if event.type == 'delete' else 'PUT'
+                response = federation.request(node, method, item.inbox_url, data=fallback_body, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException as e:
+        return False, str(e)
+
+    # Remembered by run_once so later deliveries to this node can be batched.
+    # Batches carry our credentials for the node, so only a URL on the node's
+    # own origin is accepted.
+    advertised = response.headers.get(BATCH_INBOX_HEADER, "")
+    if advertised and not same_origin(advertised, item.node.base_url):
+        print(f"From outbox: Ignoring batch inbox {advertised!r} advertised by {item.node.base_url}")
+        advertised = ""
+    item.advertised_batch_url = advertised
+    if not response.ok:
+        return False, f"HTTP {response.status_code}: {response.text[:500]}"
+    return True, ""
+
+
+def deliver_batch(node, items):
+    """
+    Sends items for one node in a single POST to its batch inbox and returns an
+    (ok, error_message) pair per item. The event bodies are already JSON and are
+    spliced into the request as-is. If the peer no longer has a batch inbox the
+    items are sent one by one instead.
+    """
+    body = '{"type":"batch","items":[' + ",".join(
+        f'{{"to":{json.dumps(item.inbox_url)},"activity":{item.event.body}}}' for item in items
+    ) + "]}"
+    try:
+        response = federation.post(node, node.batch_inbox_url, data=body, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException as e:
+        return [(False, str(e))] * len(items)
+
+    if response.status_code in (404, 405, 501):
+        print(f"From outbox: {node.base_url} has no batch inbox any more, sending {len(items)} items singly")
+        outcomes = [deliver(item) for item in items]
+        for item in items:
+            item.advertised_batch_url = ""
+        return outcomes
+    if not response.ok:
+        return [(False, f"HTTP {response.status_code}: {response.text[:500]}")] * len(items)
+
+    try:
+        results = {result["index"]: result for result in response.json()["results"]}
+    except (ValueError, KeyError, TypeError):
+        return [(False, "Malformed batch response")] * len(items)
+    outcomes = []
+    for index in range(len(items)):
+        result = results.get(index, {"status": None, "error": "Missing from batch response"})
+        if isinstance(result.get("status"), int) and 200 <= result["status"] < 300:
+            outcomes.append((True, ""))
+        else:
+            outcomes.append((False, f"HTTP {result.get('status')}: {result.get('error', '')}"))
+    return outcomes
+
+
+def record_result(item, ok, error=""):
+    """Marks an item delivered, schedules a retry, or dead-letters it."""
+    now = timezone.now()
+    item.attempts += 1
+    if ok:
+        item.status = 'delivered'
+        item.delivered_at = now
+        item.last_error = ""
+    elif item.attempts >= MAX_ATTEMPTS:
+        item.status = 'dead'
+        item.last_error = error
+        print(f"From outbox: Giving up on {item.inbox_url} after {item.attempts} attempts: {error}")
+    else:
+        item.status = 'pending'
+        item.next_attempt_at = now + backoff_delay(item.attempts)
+        item.last_error = error
+    item.save(update_fields=['attempts', 'status', 'delivered_at', 'next_attempt_at', 'last_error'])
+
+
+def deliver_to_node(node, items, per_node=PER_NODE_CONCURRENCY):
+    """
+    Sends every item for one node concurrently (at most `per_node` requests at a
+    time) over the node's pooled keep-alive session. Items the node accepts in
+    batches go out MAX_BATCH_SIZE per request. Returns a list of
+    (item, ok, error, seconds).
+    """
+    def send(item):
+        started = time.monotonic()
+        try:
+            ok, error = deliver(item)
+        except Exception as e:
+            traceback.print_exc()
+            ok, error = False, str(e)
+        return [(item, ok, error, time.monotonic() - started)]
+
+    def send_batch(batch):
+        started = time.monotonic()
+        try:
+            outcomes = deliver_batch(node, batch)
+        except Exception as e:
+            traceback.print_exc()
+            outcomes = [(False, str(e))] * len(batch)
+        seconds = time.monotonic() - started
+        return [(item, ok, error, seconds) for item, (ok, error) in zip(batch, outcomes)]
+
+    batched = [item for item in items if is_batched(item)]
+    single = [item for item in items if not is_batched(item)]
+    batches = [batched[i:i + MAX_BATCH_SIZE] for i in range(0, len(batched), MAX_BATCH_SIZE)]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(per_node, len(batches) + len(single)))) as pool:
+        futures = [pool.submit(send_batch, batch) for batch in batches] + [pool.submit(send, item) for item in single]
+        return [result for future in futures for result in future.result()]
+
+
+def run_once(limit=50, max_workers=8, per_node=PER_NODE_CONCURRENCY):
+    """
+    Claims one batch, fans it out per node and records the results.
+    Only the HTTP calls run on worker threads; all database writes stay on the
+    calling thread.
+
+    Returns a dict of counts plus a `hosts` entry mapping each node's base_url
+    to its sent/failed counts and average/max latency in milliseconds.
+    """
+    items = claim_batch(limit=limit, per_node=per_node)
+    counts = {"claimed": len(items), "delivered": 0, "retried": 0, "dead": 0, "hosts": {}}
+    if not items:
+        return counts
+
+    by_node = defaultdict(list)
+    for item in items:
+        by_node[item.node_id].append(item)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(by_node)))) as pool:
+        futures = [
+            pool.submit(deliver_to_node, node_items[0].node, node_items, per_node)
+            for node_items in by_node.values()
+        ]
+        results = [result for future in futures for result in future.result()]
+
+    latencies = defaultdict(list)
+    advertised = {}
+    for item, ok, error, seconds in results:
+        record_result(item, ok, error)
+        if hasattr(item, "advertised_batch_url"):
+            advertised[item.node] = item.advertised_batch_url
+        host = counts["hosts"].setdefault(item.node.base_url, {"sent": 0, "failed": 0})
+        latencies[item.node.base_url].append(seconds)
+        if ok:
+            counts["delivered"] += 1
+            host["sent"] += 1
+        else:
+            host["failed"] += 1
+            if item.status == 'dead':
+                counts["dead"] += 1
+            else:
+                counts["retried"] += 1
+
+    for node, batch_inbox_url in advertised.items():
+        if node.batch_inbox_url != batch_inbox_url:
+            print(f"From outbox: {node.base_url} batch inbox is now {batch_inbox_url or 'unsupported'}")
+            node.batch_inbox_url = batch_inbox_url
+            node.save(update_fields=['batch_inbox_url'])
+
+    for base_url, samples in latencies.items():
+        counts["hosts"][base_url]["avg_ms"] = round(1000 * sum(samples) / len(samples), 1)
+        counts["hosts"][base_url]["max_ms"] = round(1000 * max(samples), 1)
+    return counts
@@ -0,0 +1,167 @@
+"""
+Page helpers for the API's list endpoints and embedded collections.
+
+List endpoints page by keyset: rows are ordered on (published, pk) (or just pk
+for models without a timestamp) and each page starts after the last row of the
+previous one, passed back as an opaque ?cursor=. That costs the same on page
+one and page ten thousand. The spec's ?page=&size= still work as an OFFSET
+compatibility layer, and both modes return a cursor for the next page.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.db.models import Count, Q, Window
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+DEFAULT_ORDERING = ('-published', '-pk')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def page_params(request, default_size=DEFAULT_PAGE_SIZE, max_size=MAX_PAGE_SIZE):
+    """
+    Reads ?page= and ?size= from a DRF request. Missing or invalid values fall back
+    to page 1 and `default_size`; size is capped at `max_size`.
+    """
+    try:
+        page_number = max(1, int(request.query_params.get('page', 1)))
+    except (TypeError, ValueError):
+        page_number = 1
+    try:
+        size = min(max_size, max(1, int(request.query_params.get('size', default_size))))
+    except (TypeError, ValueError):
+        size = default_size
+    return page_number, size
+
+
+def window(queryset, page_number=1, size=50):
+    """
+    Returns (items, count) for one page of `queryset`. The total is annotated on
+    every row with a window aggregate, so the page and its count come back in a
+    single query; only a page past the end needs a separate count.
+    """
+    start = (page_number - 1) * size
+    items = list(queryset.annotate(total_count=Window(Count('pk')))[start:start + size])
+    if items:
+        return items, items[0].total_count
+    return items, (queryset.count() if page_number > 1 else 0)
+
+
+# =============================================================================
+# Keyset (cursor) pagination
+# =============================================================================
+
+def encode_cursor(data):
+    """Encodes JSON-serializable cursor data as an opaque, URL-safe token."""
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return json.loads(raw)
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+
+
+def cursor_values(obj, ordering):
+    """Returns the JSON-safe sort key of `obj` for `ordering`."""
+    values = []
+    for field in ordering:
+        value = getattr(obj, field.lstrip('-'))
+        values.append(value.isoformat() if isinstance(value, datetime) else value)
+    return values
+
+
+def after(queryset, ordering, values):
+    """Filters `queryset` to the rows that sort strictly after the key `values`."""
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidCursor("Cursor does not match this list")
+    model = queryset.model
+    names = [field.lstrip('-') for field in ordering]
+    try:
+        parsed = [
+            (model._meta.pk if name == 'pk' else model._meta.get_field(name)).to_python(value)
+            for name, value in zip(names, values)
+        ]
+    except Exception:
+        raise InvalidCursor("Cursor does not match this list")
+
+    condition = Q()
+    for i, field in enumerate(ordering):
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        equal = dict(zip(names[:i], parsed[:i]))
+        condition |= Q(**equal, **{f"{names[i]}__{lookup}": parsed[i]})
+    return queryset.filter(condition)
+
+
+def keyset(queryset, cursor=None, size=DEFAULT_PAGE_SIZE, ordering=DEFAULT_ORDERING):
+    """
+    Returns (items, next_cursor) for the page of `queryset` that follows `cursor`
+    (None for the first page). next_cursor is None on the last page.
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = after(queryset, ordering, decode_cursor(cursor))
+    items = list(queryset[:size + 1])
+    if len(items) > size:
+        return items[:size], encode_cursor(cursor_values(items[size - 1], ordering))
+    return items, None
+
+
+def paginate(request, queryset, ordering=DEFAULT_ORDERING, default_size=DEFAULT_PAGE_SIZE):
+    """
+    Pages `queryset` for a list endpoint and returns (items, next_cursor).
+    ?cursor= selects keyset paging; otherwise ?page= is honoured with OFFSET for
+    spec compatibility. ?size= is capped at MAX_PAGE_SIZE in both modes.
+    Raises InvalidCursor for a cursor this list did not issue.
+    """
+    page_number, size = page_params(request, default_size)
+    cursor = request.query_params.get('cursor')
+    if cursor or page_number == 1:
+        return keyset(queryset, cursor, size, ordering)
+
+    start = (page_number - 1) * size
+    items = list(queryset.order_by(*ordering)[start:start + size + 1])
+    if len(items) > size:
+        return items[:size], encode_cursor(cursor_values(items[size - 1], ordering))
+    return items, None
+
+
+def next_link(request, next_cursor):
+    """Returns the absolute URL of the next page, or None on the last page."""
+    if not next_cursor:
+        return None
+    params = request.query_params.copy()
+    params.pop('page', None)
+    params['cursor'] = next_cursor
+    return request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+
+class KeysetPagination(BasePagination):
+    """
+    DRF pagination class for generic list views. The response body stays a plain
+    list, as peers expect; the next page is advertised in a Link header.
+    """
+    ordering = DEFAULT_ORDERING
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            items, self.next_cursor = paginate(request, queryset, self.ordering)
+        except InvalidCursor:
+            raise ValidationError({"error": "Invalid pagination parameters"})
+        return items
+
+    def get_paginated_response(self, data):
+        link = next_link(self.request, self.next_cursor)
+        return Response(data, headers={'Link': f'<{link}>; rel="next"'} if link else None)
@@ -23,16 +23,36 @@ from io import BytesIO
 from PIL import Image
 from .models import Node
 from .utils import get_base_url
+from .distribution_utils import plan_fan_out
+from .feed import get_feed_page
+from .pagination import InvalidCursor, KeysetPagination, next_link, paginate
+from . import media_storage
+from .friendships import are_friends
 import requests
 from django.conf import settings
 import json
 from .authentication import NodeBasicAuthentication
+from . import outbox
+from . import fqid
 
 class PostListCreateAPIView(generics.ListCreateAPIView):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     permission_classes = [IsAuthenticated]
     authentication_classes = [NodeBasicAuthentication, SessionAuthentication]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        if self.request.method == 'GET':
+            return Post.objects.previews()
+        return super().get_queryset()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # Listing returns content previews; creating still echoes the full post
+        if self.request.method == 'GET':
+            context['preview'] = True
+        return context
 
     def perform_create(self, serializer):
         # Ensure the author is created or retrieved for the current user
@@ -119,7 +139,7 @@ def get_post_with_fqid(request, post_fqid):
         can_view = True
 
     elif post.visibility == 'FRIENDS':
-        if request.user.is_authenticated and request.user.author in post.author.friends:
+        if request.user.is_authenticated and are_friends(request.user.author, post.author):
             can_view = True
 
     elif post.visibility == 'UNLISTED':
@@ -150,15 +170,15 @@ def my_posts(request):
     sys.stdout.flush()  # Force immediate output
 
     # Pagination
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    posts = paginator.get_page(page_number)
+    posts = get_feed_page(post_list, user, request.GET.get('page'))
 
     return render(request, 'social/my_posts.html', {'posts': posts})
 
 def send_post_to_remote_followers(post, author, post_type='post'):
     """
     Sends a post to remote followers and friends of the author.
+    The post body is built once and queued once; each remote node then gets
+    one outbox row per recipient that points at the shared body.
     """
     # Get the author's host
     author_host = get_base_url(author.host) if author.host else "http://localhost:8000"
@@ -177,128 +197,39 @@ def send_post_to_remote_followers(post, author, post_type='post'):
     recipients = set(remote_followers + [friend.id for friend in friends])
     
     print(f"remote recipients: {recipients}")
-    
-    # Get all unique remote hosts from recipients
-    remote_hosts = set()
-    
-    for recipient_id in recipients:
-        try:
-            recipient_host = recipient_id.split('/authors/')[0]
-            remote_hosts.add(recipient_host)
-        except:
-            continue
-    
-    # For each remote host, get the node and send the post
-    for host in remote_hosts:
 
-        try:
-            # Get or create the node
-            
-            print(f"HOST before slash check IS: {f"{host}"}")
-            
-            #node, created = Node.objects.get_or_create(base_url=f"{host}/")
-            if not host[-1] == "/":
-                host += "/"
-            
-            print(f"HOST after slash check IS: {f"{host}"}")
-            node = Node.objects.get(base_url=f"{host}")
+    if not recipients:
+        return
+
+    # Format the post data once for every recipient
+    post_data = {
+        "type": post_type,
+        "id": post.id,
+        "title": post.title,
+        "description": post.description,
+        "contentType": post.contentType,
+        "content": media_storage.inline_content(post),  # peers expect media inline as base64
+        "published": post.published.isoformat(),
+        "visibility": post.visibility,
+        "page": post.page if post.page else "",
+        "author": {
+            "type": "author",
+            "id": author.id,
+            "host": author.host,
+            "displayName": author.displayName,
+            "github": author.github if author.github else "",
+            "profileImage": author.profileImage if author.profileImage else "",
+            "page": author.page if author.page else ""
+        }
+    }
 
-            if not node.enabled:
-                continue
-            
-            
-            # Format the post data
-            post_data = {
-                "type": post_type,
-                "id": post.id,
-                "title": post.title,
-                "description": post.description,
-                "contentType": post.contentType,
-                "content": post.content,
-                "published": post.published.isoformat(),
-                "visibility": post.visibility,
-                "page": post.page if post.page else "",
-                "author": {
-                    "type": "author",
-                    "id": author.id,
-                    "host": author.host,
-                    "displayName": author.displayName,
-                    "github": author.github if author.github else "",
-                    "profileImage": author.profileImage if author.profileImage else "",
-                    "page": author.page if author.page else ""
-                }
-            }
-            
-                
-            
-            print(f"POST DATA: {post_data}")
-            
-            # Send to each recipient's inbox
-            for recipient_id in recipients:
-                if recipient_id.startswith(host):
-                    try:
-                        # Extract the author ID from the full URL
-                        recipient_author_id = recipient_id.split('/authors/')[-1]
-                        inbox_url = f"{host}authors/{recipient_author_id}/inbox"
-                        
-                        print(f"{node.auth_username}, {node.auth_password}")
-                        print(f"sending post to inbox url: {inbox_url}")
-
-                        saved_post_type = post_data['type']
-                        
-                        # Send the post to the recipient's inbox
-                        # send POST req with custom 'type' fields: update or delete
-                        response = requests.post(
-                            inbox_url,
-                            json=post_data,
-                            auth=(node.auth_username, node.auth_password),
-                            headers={"Content-Type": "application/json"},
-                            timeout=5
-                        )
-                        if not response.ok:
-                            # send POST req with 'type':post if custom field wasn't expected
-                            post_data['type'] = 'post'
-                            response = requests.post(
-                            inbox_url,
-                            json=post_data,
-                            auth=(node.auth_username, node.auth_password),
-                            headers={"Content-Type": "application/json"},
-                            timeout=5
-                        )
-                        if not response.ok:
-                            # send PUT or DELETE req depending on what the 'type' field orginally was (to work with dottemod's group)
-                            if saved_post_type == 'delete':
-                                print("sending delete req")
-                                response = requests.delete(
-                                inbox_url,
-                                json=post_data,
-                                auth=(node.auth_username, node.auth_password),
-                                headers={"Content-Type": "application/json"},
-                                timeout=5
-                            )
-                            else:
-                                print("sending put req")
-                                response = requests.put(
-                                inbox_url,
-                                json=post_data,
-                                auth=(node.auth_username, node.auth_password),
-                                headers={"Content-Type": "application/json"},
-                                timeout=5
-                            )
-                                
-                        response.raise_for_status()
-                        print(response)
-                        
-                        print(f"Successfully sent post to {recipient_id}")
-                    except Exception as e:
-                        print(f"Failed to send post to {recipient_id}: {str(e)}")
-                        continue
-        except Node.DoesNotExist:
-            print(f"Node does not exist for host: {host}/. May have been removed.")
-            continue                
-        except Exception as e:
-            print(f"Error processing remote host {host}: {str(e)}")
-            continue
+    targets = []
+    for node, inbox_urls in plan_fan_out(recipients).items():
+        targets.extend((node, inbox_url) for inbox_url in inbox_urls)
+
+    # Queue the post for the outbox worker; update/delete fallbacks happen there
+    outbox.enqueue_many(targets, post_data)
+    print(f"Queued post {post.id} for {len(targets)} remote recipients")
 
 @login_required
 def create_post(request):
@@ -351,9 +282,8 @@ def create_post(request):
                     else:
                         post.contentType = 'application/base64'
                     
-                    # Convert image to base64
-                    image_data = base64.b64encode(image.read()).decode('utf-8')
-                    post.content = image_data
+                    # Store the image file; only a reference is kept on the post
+                    media_storage.attach_upload(post, image)
                 # Handle video upload
                 elif video_file and 'video/' in content_type:
                     print("Processing video upload")
@@ -381,13 +311,11 @@ def create_post(request):
                         return render(request, 'social/create_post.html', {'form': form})
 
                     try:
-                        # Convert video to base64
-                        print("Starting video conversion to base64...")
-                        video_data = base64.b64encode(video_file.read()).decode('utf-8')
-                        post.content = video_data
-                        print(f"Video encoded to base64, length: {len(video_data)}")
+                        # Store the video file; only a reference is kept on the post
+                        media_storage.attach_upload(post, video_file)
+                        print(f"Video stored as: {post.media.name}")
                     except Exception as e:
-                        print(f"Error encoding video: {str(e)}")
+                        print(f"Error storing video: {str(e)}")
                         import traceback
                         print(traceback.format_exc())
                         messages.error(request, f"Error processing video: {str(e)}")
@@ -456,9 +384,8 @@ def update_post(request, internal_id):
                 # Handle image upload if present
                 if 'image' in request.FILES:
                     image = request.FILES['image']
-                    # Convert image to base64
-                    image_data = base64.b64encode(image.read()).decode('utf-8')
-                    updated_post.content = image_data
+                    # Store the new image file and drop the old reference
+                    media_storage.attach_upload(updated_post, image)
                 
                 updated_post.save()
                 
@@ -492,7 +419,7 @@ def post_detail(request, internal_id):
         can_view = True
 
     elif post.visibility == 'FRIENDS':
-        if request.user.is_authenticated and request.user.author in post.author.friends:
+        if request.user.is_authenticated and are_friends(request.user.author, post.author):
             can_view = True
 
     elif post.visibility == 'UNLISTED':
@@ -506,10 +433,6 @@ def post_detail(request, internal_id):
         message = "You do not have permission to view this post."
         return render(request, 'social/restricted_post.html', {'message': message})
 
-    # Add like count for comments
-    for comment in post.comments.all():
-        comment.like_count = comment.get_likes_count()
-
     return render(request, 'social/post_detail.html', {'post': post, 'current_host': request.get_host() })
 
 @login_required
@@ -525,7 +448,7 @@ def remote_post_detail(request, post_fqid):
         can_view = True
 
     elif post.visibility == 'FRIENDS':
-        if request.user.is_authenticated and request.user.author in post.author.friends:
+        if request.user.is_authenticated and are_friends(request.user.author, post.author):
             can_view = True
 
     elif post.visibility == 'UNLISTED':
@@ -539,10 +462,6 @@ def remote_post_detail(request, post_fqid):
         message = "You do not have permission to view this post."
         return render(request, 'social/restricted_post.html', {'message': message})
 
-    # Add like count for comments
-    for comment in post.comments.all():
-        comment.like_count = comment.get_likes_count()
-
     return render(request, 'social/post_detail.html', {'post': post, 'current_host': request.get_host() })
 
 @api_view(['PUT'])
@@ -576,15 +495,19 @@ def api_get_author_and_all_post(request, id):
     except Author.DoesNotExist:
         return Response({'error': 'Author not found'}, status=status.HTTP_404_NOT_FOUND)
     
-    posts = Post.objects.filter(author=author)
+    try:
+        posts, next_cursor = paginate(request, Post.objects.filter(author=author).previews())
+    except InvalidCursor:
+        return Response({"error": "Invalid pagination parameters"}, status=status.HTTP_400_BAD_REQUEST)
 
-  
-    post_serializer = PostSerializer(posts, many=True, context={'request': request})
+    # List view: content is previewed, media is linked; full posts come from the detail endpoints
+    post_serializer = PostSerializer(posts, many=True, context={'request': request, 'preview': True})
 
     author_serializer = AuthorSerializer(author)
 
     return Response({
         'author': author_serializer.data,
+        'next': next_link(request, next_cursor),
         'posts': post_serializer.data
     })
 
@@ -593,10 +516,10 @@ def api_get_author_and_all_post(request, id):
 def get_author_and_post(request, author_id, internal_id):
     if (request.method == "GET"):
         try:
-            # Get the author by id
-            author = get_object_or_404(Author, id__endswith=f"/social/api/authors/{author_id}")
-            # Retrieve the post
-            post = get_object_or_404(Post, internal_id=internal_id, author=author)
+            # Retrieve the post, then check its stored author id: the URL's serial must be the author's
+            post = get_object_or_404(Post, internal_id=internal_id)
+            if fqid.author_serial(post.author_id) != str(author_id):
+                raise Http404("No Post matches the given query.")
 
         except Author.DoesNotExist:
             return Response({'error': 'Author not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -695,9 +618,8 @@ def create_video_post(request):
                         messages.error(request, "Video file is too large. Maximum size is 50MB.")
                         return render(request, 'social/create_video_post.html', {'form': form})
 
-                    # Convert video to base64
-                    video_data = base64.b64encode(video.read()).decode('utf-8')
-                    post.content = video_data
+                    # Store the video file; only a reference is kept on the post
+                    media_storage.attach_upload(post, video)
                 else:
                     messages.error(request, "Please upload a video file.")
                     return render(request, 'social/create_video_post.html', {'form': form})
@@ -0,0 +1,49 @@
+"""
+Resolves the id forms clients and peers send for posts and comments to rows.
+
+Views receive a bare serial ("12", a comment uuid), a full FQID, a
+percent-encoded FQID or any of these with a trailing slash. Each form is
+answered by an indexed lookup, never by scanning the table:
+
+    posts:    the unique Post.id, then the internal_id primary key for serials
+    comments: the Comment.id primary key, then the indexed Comment.serial
+
+Comment.serial holds the last segment of the comment's id; Comment.save keeps
+it current and the index_comment_serials command fills it for older rows.
+"""
+from . import fqid
+from .models import Comment, Post
+
+
+def resolve_post(value, author_serial=None):
+    """
+    Returns the Post for a post id in any accepted form, or None. A serial only
+    matches a local post (internal_id); when `author_serial` is given, or the
+    value is an FQID, that post must belong to the same author serial.
+    """
+    if not value:
+        return None
+    parsed = fqid.parse(value)
+    if parsed is not None and parsed.kind == "posts":
+        post = Post.objects.filter(id=parsed.id).first()
+        if post is not None:
+            return post
+        author_serial = author_serial or parsed.author_serial
+
+    serial = fqid.serial_of(value)
+    if not serial.isdigit():
+        return None
+    post = Post.objects.filter(internal_id=int(serial)).first()
+    if post is not None and author_serial and fqid.author_serial(post.author_id) != str(author_serial):
+        return None
+    return post
+
+
+def resolve_comment(value):
+    """Returns the Comment for a comment id in any accepted form, or None."""
+    if not value:
+        return None
+    comment = Comment.objects.filter(id=fqid.canonical(value)).first()
+    if comment is None:
+        comment = Comment.objects.filter(serial=fqid.serial_of(value)).first()
+    return comment
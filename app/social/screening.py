@@ -0,0 +1,89 @@
+"""
+Request-value screening rules for SecurityMiddleware.
+
+Every rule is compiled once, at import. A rule can only match text containing
+one of its trigger literals (a quote for the SQL quote rules, "<script" for
+the script tag rule, ...), so a value is screened in two steps:
+
+    1. one pass of substring checks for all trigger literals over the value
+    2. only the rules whose triggers were found are run, each precompiled
+
+Clean text, the usual case, never reaches a regex, so every value is scanned
+in full: the substring checks stay linear and cheap even for large fields. (A
+single alternation of all rules was measured at four times the cost of the old
+per-rule loop: CPython's re loses its literal prefix search on a wide
+alternation.)
+
+Each match is counted against its rule; hit_counts() returns the counters
+(e.g. for a debug view or a log line) and reset_hit_counts() clears them.
+`manage.py benchmark_screening` times the engine on 1 KB to 1 MB bodies.
+"""
+import re
+import threading
+from collections import Counter
+
+
+# (rule name, pattern, trigger literals: lowercase, one of them is in any match)
+RULES = [
+    # SQL injection
+    ("sql_quote_or_comment", r"(\%27)|(\')|(\-\-)|(\%23)|(#)", ("'", "--", "#", "%23", "%27")),
+    ("sql_assignment", r"((\%3D)|(=))[^\n]*((\%27)|(\')|(\-\-)|(\%3B)|(;))", ("=", "%3d")),
+    ("sql_or", r"/\w*((\%27)|(\'))((\%6F)|o|(\%4F))((\%72)|r|(\%52))", ("'", "%27")),
+    ("sql_union", r"((\%27)|(\'))union", ("'", "%27")),
+    ("sql_exec_procedure", r"exec(\s|\+)+(s|x)p\w+", ("exec",)),
+    # XSS
+    ("xss_script_tag", r"<script.*?>.*?</script>", ("<script",)),
+    ("xss_javascript_url", r"javascript:", ("javascript:",)),
+    ("xss_onerror", r"onerror=", ("onerror=",)),
+    ("xss_onload", r"onload=", ("onload=",)),
+    ("xss_eval", r"eval\(", ("eval(",)),
+    ("xss_document_cookie", r"document\.cookie", ("document.cookie",)),
+    ("xss_document_write", r"document\.write", ("document.write",)),
+    ("xss_iframe_tag", r"<iframe.*?>.*?</iframe>", ("<iframe",)),
+    # Command injection
+    ("cmd_metacharacter", r"[;&|`]", (";", "&", "|", "`")),
+    ("cmd_substitution", r"\$\(.*?\)", ("$(",)),
+    ("cmd_variable", r"\$\{.*?\}", ("${",)),
+    ("cmd_backticks", r"`.*?`", ("`",)),
+    ("cmd_pipes", r"\|.*?\|", ("|",)),
+    ("cmd_and_chain", r"&&.*?&&", ("&&",)),
+    ("cmd_semicolons", r";.*?;", (";",)),
+]
+
+_compiled = [(name, re.compile(pattern, re.IGNORECASE)) for name, pattern, _ in RULES]
+_rules_by_trigger = {}
+for _index, (_, _, _triggers) in enumerate(RULES):
+    for _trigger in _triggers:
+        _rules_by_trigger.setdefault(_trigger, []).append(_index)
+
+# Non-ASCII characters re.IGNORECASE matches to ASCII letters; folded before the trigger checks
+_FOLD = str.maketrans({"İ": "i", "ı": "i", "ſ": "s", "K": "k"})
+
+_lock = threading.Lock()
+_hits = Counter()
+
+
+def scan(value):
+    """Returns the name of the first rule (in RULES order) that matches `value`, or None."""
+    folded = value.translate(_FOLD).lower()
+    candidates = sorted({
+        index for trigger, indexes in _rules_by_trigger.items() if trigger in folded for index in indexes
+    })
+    for index in candidates:
+        name, pattern = _compiled[index]
+        if pattern.search(value):
+            with _lock:
+                _hits[name] += 1
+            return name
+    return None
+
+
+def hit_counts():
+    """Returns {rule name: matches since start or the last reset} for every rule."""
+    with _lock:
+        return {name: _hits[name] for name, _, _ in RULES}
+
+
+def reset_hit_counts():
+    with _lock:
+        _hits.clear()
@@ -1,7 +1,13 @@
 from rest_framework import serializers
 from .models import Post, Author, User, Comment, Like, Node
+from . import media_storage
 import re
 
+# Items embedded in a post's "comments" and "likes" objects; the rest are paged
+# from the object's id (e.g. <post id>/likes?page=2&size=50)
+COMMENTS_PAGE_SIZE = 5
+LIKES_PAGE_SIZE = 50
+
 class AuthorSerializer(serializers.ModelSerializer):
     # Need urlfield for these tests: posting, identity, reading, sharing
     #profileImage = serializers.URLField(required=False, allow_blank=True)   
@@ -50,6 +56,47 @@ class LikeSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'published', 'type']
 
 
+def _collection(kind, post, items, count, page_number, size):
+    collection = {
+        "type": kind,
+        "id": f"{post.id}/{kind}",
+        "page": f"{post.page}/{kind}" if post.page else None,
+        "page_number": page_number,
+        "size": size,
+        "count": count,
+        "src": items,
+    }
+    if page_number * size < count:
+        collection["next"] = f"{post.id}/{kind}?page={page_number + 1}&size={size}"
+    return collection
+
+
+def _page(queryset, page_number, size):
+    start = (page_number - 1) * size
+    return queryset[start:start + size]
+
+
+def comments_page(post, page_number=1, size=COMMENTS_PAGE_SIZE):
+    """
+    Returns one page of the post's comments, newest first, as a "comments" object.
+    The count is the post's denormalized comment_count (see counters.py).
+    """
+    comments = _page(Comment.objects.filter(post=post.id).select_related('author').order_by('-published'),
+                     page_number, size)
+    return _collection("comments", post, CommentSerializer(comments, many=True).data, post.comment_count,
+                       page_number, size)
+
+
+def likes_page(post, page_number=1, size=LIKES_PAGE_SIZE):
+    """
+    Returns one page of the post's likes, oldest first, as a "likes" object.
+    The count is the post's denormalized like_count (see counters.py).
+    """
+    likes = _page(Like.objects.filter(object=post.id).select_related('author').order_by('published'),
+                  page_number, size)
+    return _collection("likes", post, LikeSerializer(likes, many=True).data, post.like_count, page_number, size)
+
+
 class PostSerializer(serializers.ModelSerializer):
     # Make the author field read-only so it doesn't require input
     author = AuthorSerializer(read_only=True)
@@ -81,42 +128,33 @@ class PostSerializer(serializers.ModelSerializer):
         # Ensure 'author' is not updated by popping it from the data
         validated_data.pop('author', None)
         return super().update(instance, validated_data)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # List endpoints pass preview=True and a queryset from Post.objects.previews(),
+        # so content is deferred and must not be read field by field
+        if self.context.get('preview'):
+            fields.pop('content', None)
+        return fields
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if self.context.get('preview'):
+            if media_storage.is_media_type(instance.contentType):
+                data['content'] = media_storage.media_url(instance, self.context.get('request'))
+            else:
+                data['content'] = getattr(instance, 'content_preview', None) or ""
+        else:
+            # Media lives on disk; the API still returns it inline as base64
+            data['content'] = media_storage.inline_content(instance)
+        return data
     
     def get_comments(self, obj):
-        # Get all comments for this post
-        comments = Comment.objects.filter(post=obj.id)
-        
-        # Serialize the comments
-        comment_serializer = CommentSerializer(comments, many=True)
-        
-        # Return the comments in the required format
-        return {
-            "type": "comments",
-            "id": f"{obj.id}/comments",
-            "page": f"{obj.page}/comments" if obj.page else None,
-            "page_number": 1,
-            "size": 5,
-            "count": comments.count(),
-            "src": comment_serializer.data,
-        }
+        # First page only; the count is post.comment_count (see counters.py)
+        return comments_page(obj)
     
     def get_likes(self, obj):
-        # Get all likes for this post
-        likes = Like.objects.filter(object=obj.id)
-        
-        # Serialize the likes
-        like_serializer = LikeSerializer(likes, many=True)
-        
-        # Return the likes in the required format
-        return {
-            "type": "likes",
-            "id": f"{obj.id}/likes",
-            "page": f"{obj.page}/likes" if obj.page else None,
-            "page_number": 1,
-            "size": 50,
-            "count": likes.count(),
-            "src": like_serializer.data,
-        }
+        return likes_page(obj)
 
 class FollowRequestSerializer(serializers.Serializer):
     type = serializers.CharField()
@@ -1,50 +1,32 @@
 # signals.py - Create this file in your app directory
-from django.db.models.signals import post_save
+from django.core.signals import request_finished
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from urllib.parse import urlparse
 from django.conf import settings
 
-from .models import Like, Comment, FollowRequest, Post, Notification, Author
+from .models import Like, Comment, FollowRequest, Post, Notification, Author, Follow, Node
+from . import counters
+from . import federation
+from . import fqid
+from . import friendships
+from . import node_registry
+from . import notification_counts
 NODE_IP = getattr(settings, "NODE_IP", None)
 def check_origin(url):
     """
-    Check if an it belongs to our node by simply checking if the ID contains our local IP.
+    Check if a URL belongs to our node, i.e. its host is our NODE_IP.
     """
-    try:
-        # Simply check if the NODE_IP is present in the author_id
-        return NODE_IP in url
-    except Exception as e:
-        print(f"From inbox_views: Error checking if author is in our node: {str(e)}")
-        return False
+    return fqid.is_local(url)
 
 def get_author_from_url(url):
     """
-    Helper function to get Author instance from a URL string
+    Helper function to get the Author of a post from the post's URL
+    Example: http://localhost:8000/social/api/authors/1/posts/5
     """
-    from django.core.exceptions import ObjectDoesNotExist
-    
-    try:
-        # For posts, extract the author ID from the URL
-        # Example: http://localhost:8000/social/api/authors/1/posts/5
-        parts = url.split('/')
-        if 'authors' in parts and 'posts' in parts:
-            # Find the author index and extract the ID
-            author_idx = parts.index('authors')
-            if author_idx + 1 < len(parts):
-                author_id = parts[author_idx + 1]
-                
-                # Reconstruct the base author URL
-                base_url = urlparse(url)
-                author_url = f"{base_url.scheme}://{base_url.netloc}/social/api/authors/{author_id}"
-                
-                try:
-                    return Author.objects.get(id__startswith=author_url)
-                except ObjectDoesNotExist:
-                    return None
-    except (IndexError, ValueError):
+    parsed = fqid.parse(url)
+    if parsed is None or parsed.kind != "posts":
         return None
-    
-    return None
+    return Author.objects.filter(id=parsed.author_id).first()
 
 @receiver(post_save, sender=Like)
 def create_like_notification(sender, instance, created, **kwargs):
@@ -172,4 +154,57 @@ def create_follow_request_notification(sender, instance, created, **kwargs):
         notification_type='follow_request',
         content_object_id=instance.follower_id,
         content_preview=f"{sender_name} wants to follow you"
-    )
\ No newline at end of file
+    )
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def sync_friendship(sender, instance, **kwargs):
+    """
+    Keeps the Friendship table in step with Follow: adding the second half of a
+    mutual follow creates the friendship, removing either half drops it.
+    """
+    friendships.sync_pair(instance.follower_id, instance.followee_id)
+
+
+@receiver(post_save, sender=Node)
+@receiver(post_delete, sender=Node)
+def invalidate_node_registry(sender, instance, **kwargs):
+    """Node rows changed: every process reloads its node registry (see node_registry.py)."""
+    node_registry.invalidate()
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_save, sender=Comment)
+def count_added(sender, instance, created, **kwargs):
+    """New likes and comments bump the denormalized counts (see counters.py)."""
+    if not created:
+        return
+    if sender is Like:
+        counters.like_added(instance)
+    else:
+        counters.comment_added(instance)
+
+
+@receiver(post_delete, sender=Like)
+@receiver(post_delete, sender=Comment)
+def count_removed(sender, instance, **kwargs):
+    if sender is Like:
+        counters.like_removed(instance)
+    else:
+        counters.comment_removed(instance)
+
+
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+@receiver(post_save, sender=FollowRequest)
+@receiver(post_delete, sender=FollowRequest)
+def invalidate_notification_counts(sender, instance, **kwargs):
+    """The recipient's unread badge counts are rebuilt on the next poll (see notification_counts.py)."""
+    notification_counts.invalidate(instance.recipient_id if sender is Notification else instance.followee_id)
+
+
+@receiver(request_finished)
+def publish_federation_metrics(sender, **kwargs):
+    """This process's federation counters reach api/nodes/metrics/ through the shared cache (throttled)."""
+    federation.publish_metrics()
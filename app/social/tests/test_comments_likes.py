@@ -4,6 +4,10 @@ from django.contrib.auth.models import User
 from django.urls import reverse
 from rest_framework.test import APIClient
 from social.models import Author, Post, Comment, Like, Node
+from social import resolver
+from urllib.parse import quote
+from io import StringIO
+from django.core.management import call_command
 from django.conf import settings
 import base64
 
@@ -693,4 +697,99 @@ class CommentsLikesFunctionTests(TestCase):
             print(f"Total likes by this author: {likes_by_author.count()}")
             
         except Like.DoesNotExist:
-            self.fail(f"Like with FQID {like_fqid} not found in the database")
\ No newline at end of file
+            self.fail(f"Like with FQID {like_fqid} not found in the database")
+
+    def test_post_embeds_first_page_of_likes_and_comments(self):
+        """Embedded likes and comments are windowed and the rest are paged from the collection id"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from social.serializers import PostSerializer
+
+        likers = Author.objects.bulk_create([
+            Author(id=f"http://localhost:8000/social/api/authors/liker{i}", displayName=f"Liker {i}", host=settings.HOST)
+            for i in range(60)
+        ])
+        Like.objects.bulk_create([
+            Like(id=f"{liker.id}/liked/1", author=liker, object=self.post.id) for liker in likers
+        ])
+        call_command("reconcile_counters", stdout=StringIO())  # bulk_create skips the counter signals
+        for i in range(8):
+            Comment.objects.create(author=self.author2, comment=f"Comment {i}", post=self.post.id)
+
+        post = Post.objects.select_related('author').get(id=self.post.id)
+        with CaptureQueriesContext(connection) as queries:
+            data = PostSerializer(post).data
+        # One query each for comments and likes, no per-item author lookups or counts
+        self.assertEqual(len(queries), 2)
+
+        self.assertEqual(len(data["likes"]["src"]), 50)
+        self.assertEqual(data["likes"]["count"], 60)
+        self.assertEqual(data["likes"]["next"], f"{self.post.id}/likes?page=2&size=50")
+        self.assertEqual(len(data["comments"]["src"]), 5)
+        self.assertEqual(data["comments"]["count"], 8)
+        self.assertEqual(data["comments"]["src"][0]["comment"], "Comment 7")
+
+        url = reverse("social:get_post_likes", kwargs={"author_id": "1", "post_id": "1"})
+        response = self.client.get(url, {"page": 2, "size": 50})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["src"]), 10)
+        self.assertEqual(response.data["count"], 60)
+        self.assertNotIn("next", response.data)
+
+
+class ResolverTests(TestCase):
+    """Every accepted id form resolves through an indexed lookup."""
+
+    def setUp(self):
+        self.author = Author.objects.create(id="http://localhost:8000/social/api/authors/1", displayName="Lara Croft",
+                                            host="http://localhost:8000/social/api/")
+        self.post = Post.objects.create(author=self.author, title="Test Post", content="text", visibility="PUBLIC")
+        self.comment = Comment.objects.create(author=self.author, comment="Nice", post=self.post.id)
+
+    def test_comment_id_forms(self):
+        self.assertEqual(self.comment.serial, str(self.comment.internal_id))
+        for value in (self.comment.id, self.comment.id + "/", quote(self.comment.id, safe=""), self.comment.serial):
+            with self.assertNumQueries(2 if value == self.comment.serial else 1):
+                self.assertEqual(resolver.resolve_comment(value), self.comment)
+        self.assertIsNone(resolver.resolve_comment("http://localhost:8000/social/api/authors/1/commented/missing"))
+
+    def test_post_id_forms(self):
+        serial = str(self.post.internal_id)
+        self.assertEqual(resolver.resolve_post(self.post.id + "/"), self.post)
+        self.assertEqual(resolver.resolve_post(serial), self.post)
+        self.assertEqual(resolver.resolve_post(f"http://otherhost/social/api/authors/1/posts/{serial}"), self.post)
+        self.assertIsNone(resolver.resolve_post(f"http://localhost:8000/social/api/authors/2/posts/{serial}"))
+
+
+class CounterTests(TestCase):
+    """Like and comment counts are denormalized columns kept in step by counters.py."""
+
+    def setUp(self):
+        self.author = Author.objects.create(id="http://localhost:8000/social/api/authors/1", displayName="Lara Croft",
+                                            host="http://localhost:8000/social/api/")
+        self.post = Post.objects.create(author=self.author, title="Test Post", content="text", visibility="PUBLIC")
+
+    def test_counts_follow_likes_and_comments(self):
+        comment = Comment.objects.create(author=self.author, comment="Nice", post=self.post.id)
+        like = Like.objects.create(author=self.author, object=self.post.id)
+        Like.objects.create(author=self.author, object=comment.id)
+
+        # A stale in-memory post saved in full keeps the counts written since
+        self.post.title = "Edited"
+        self.post.save()
+        self.post.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count, comment.like_count), (1, 1, 1))
+
+        like.delete()
+        Comment.objects.filter(pk=comment.pk).delete()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (0, 0))
+
+    def test_reconcile_repairs_drift(self):
+        Like.objects.create(author=self.author, object=self.post.id)
+        Post.objects.filter(pk=self.post.pk).update(like_count=7, comment_count=3)
+
+        call_command("reconcile_counters", stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (1, 0))
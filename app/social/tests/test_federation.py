@@ -0,0 +1,123 @@
+from django.core.cache import cache
+from django.test import TestCase
+from social.models import Node
+from social import federation
+from social import fqid
+from unittest.mock import patch, MagicMock
+import requests
+
+"""
+Tests the shared node-to-node HTTP client: one pooled session per node with
+that node's credentials, a default timeout on every call, and per-node metrics.
+"""
+
+
+class FederationClientTests(TestCase):
+    def setUp(self):
+        federation.reset()
+        self.node = Node.objects.create(
+            name="RemoteNode",
+            base_url="http://remotenode.com/social/api/",
+            auth_username="remoteuser",
+            auth_password="remotepass",
+        )
+
+    def tearDown(self):
+        federation.reset()
+
+    def test_session_is_reused_per_node(self):
+        session = federation.session_for(self.node)
+
+        self.assertIs(federation.session_for(self.node), session)
+        self.assertIsNot(federation.session_for(None), session)
+        self.assertEqual(session.auth, ("remoteuser", "remotepass"))
+
+    def test_changed_credentials_refresh_cached_session(self):
+        session = federation.session_for(self.node)
+        self.node.auth_password = "newpass"
+        self.node.save()
+
+        self.assertIs(federation.session_for(self.node), session)
+        self.assertEqual(session.auth, ("remoteuser", "newpass"))
+
+    @patch("social.federation.requests.Session.request")
+    def test_default_timeout_and_metrics(self, mock_request):
+        response = MagicMock()
+        response.status_code = 200
+        mock_request.return_value = response
+
+        federation.get(self.node, f"{self.node.base_url}authors/")
+        federation.get(self.node, f"{self.node.base_url}authors/", timeout=1)
+
+        self.assertEqual(mock_request.call_args_list[0].kwargs["timeout"], federation.TIMEOUT)
+        self.assertEqual(mock_request.call_args_list[1].kwargs["timeout"], 1)
+        stats = federation.metrics()[self.node.base_url]
+        self.assertEqual(stats["requests"], 2)
+        self.assertEqual(stats["errors"], 0)
+        self.assertEqual(stats["last_status"], 200)
+
+    @patch("social.federation.requests.Session.request")
+    def test_network_errors_are_counted_and_raised(self, mock_request):
+        mock_request.side_effect = requests.ConnectionError("refused")
+
+        with self.assertRaises(requests.RequestException):
+            federation.post(self.node, f"{self.node.base_url}authors/1/inbox", json={})
+
+        stats = federation.metrics()[self.node.base_url]
+        self.assertEqual(stats["errors"], 1)
+        self.assertIsNone(stats["last_status"])
+
+    @patch("social.federation.requests.Session.request")
+    def test_shared_metrics_sum_published_processes(self, mock_request):
+        response = MagicMock()
+        response.status_code = 202
+        mock_request.return_value = response
+        federation.post(self.node, f"{self.node.base_url}authors/1/inbox", json={})
+
+        # What a run_outbox worker on another host would have published
+        worker_key = "federation_metrics:worker:1"
+        cache.set(worker_key, {self.node.base_url: {"requests": 3, "errors": 1, "total_ms": 300.0,
+                                                    "last_status": 500, "last_at": 1.0}})
+        cache.set(federation.METRICS_INDEX_KEY, [worker_key, "federation_metrics:exited:2"])
+
+        stats = federation.shared_metrics()[self.node.base_url]
+        self.assertEqual(stats["requests"], 4)
+        self.assertEqual(stats["errors"], 1)
+        self.assertEqual(stats["last_status"], 202)
+        self.assertNotIn("federation_metrics:exited:2", cache.get(federation.METRICS_INDEX_KEY))
+
+    @patch("social.federation.requests.Session.request")
+    def test_publish_metrics_is_throttled(self, mock_request):
+        response = MagicMock()
+        response.status_code = 200
+        mock_request.return_value = response
+
+        self.assertFalse(federation.publish_metrics())
+        federation.get(self.node, f"{self.node.base_url}authors/")
+        self.assertTrue(federation.publish_metrics())
+        federation.get(self.node, f"{self.node.base_url}authors/")
+        self.assertFalse(federation.publish_metrics())
+
+
+class FQIDTests(TestCase):
+    def test_equivalent_forms_share_a_canonical_id(self):
+        canonical_id = "http://node.com/social/api/authors/5/posts/12"
+        for value in (
+            canonical_id,
+            canonical_id + "/",
+            "HTTP://Node.COM:80/social/api/authors/5/posts/12",
+            "http%3A%2F%2Fnode.com%2Fsocial%2Fapi%2Fauthors%2F5%2Fposts%2F12",
+            canonical_id + "/image",
+        ):
+            self.assertEqual(fqid.canonical(value), canonical_id)
+
+    def test_parse_splits_author_and_object(self):
+        parsed = fqid.parse("https://node.com:8000/social/api/authors/5/commented/abc/")
+
+        self.assertEqual((parsed.scheme, parsed.host, parsed.port), ("https", "node.com", 8000))
+        self.assertEqual((parsed.author_serial, parsed.kind, parsed.serial), ("5", "commented", "abc"))
+        self.assertEqual(parsed.author_id, "https://node.com:8000/social/api/authors/5")
+        self.assertEqual(fqid.inbox_url(parsed.id), "https://node.com:8000/social/api/authors/5/inbox")
+        self.assertEqual(fqid.host_of(parsed.id), "node.com:8000")
+        self.assertIsNone(fqid.parse("not a url"))
+        self.assertEqual(fqid.author_serial("5"), "5")
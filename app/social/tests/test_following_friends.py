@@ -4,7 +4,8 @@ from django.contrib.auth.models import User
 from django.urls import reverse
 from rest_framework.test import APIClient
 from django.conf import settings
-from social.models import Author, Inbox, FollowRequest, Follow
+from social.models import Author, FollowRequest, Follow, Friendship
+from social import friendships
 from unittest.mock import patch, MagicMock
 
 """
@@ -48,8 +49,6 @@ class FollowersAPITests(TestCase):
         self.user2.author = self.author2
         self.user2.save()
         
-        # Create an empty Inbox for author1.
-        self.inbox = Inbox.objects.create(author=self.author1)
         
         # Initialize the DRF APIClient.
         self.client = APIClient()
@@ -189,3 +188,30 @@ class FollowersAPITests(TestCase):
 
         # Ensure the Follow relationship is removed
         self.assertEqual(Follow.objects.filter(followee=self.author1, follower_id=self.author2.id).count(), 0)
+
+    def test_mutual_follow_creates_friendship(self):
+        """
+        The Friendship table follows Follow: both halves make a friendship, removing one ends it.
+        """
+        Follow.objects.create(followee=self.author1, follower_id=self.author2.id)
+        self.assertFalse(friendships.are_friends(self.author1, self.author2))
+
+        Follow.objects.create(followee=self.author2, follower_id=self.author1.id)
+        self.assertTrue(friendships.are_friends(self.author1, self.author2))
+        self.assertTrue(friendships.are_friends(self.author2.id, self.author1.id))
+        self.assertEqual(list(friendships.friends_of(self.author1)), [self.author2])
+        self.assertEqual(list(self.author2.friends), [self.author1])
+
+        Follow.objects.filter(followee=self.author1, follower_id=self.author2.id).delete()
+        self.assertFalse(friendships.are_friends(self.author1, self.author2))
+        self.assertEqual(Friendship.objects.count(), 0)
+
+    def test_rebuild_friendships_backfills_edges(self):
+        Follow.objects.bulk_create([
+            Follow(followee=self.author1, follower_id=self.author2.id),
+            Follow(followee=self.author2, follower_id=self.author1.id),
+        ])  # bulk_create skips signals, like rows that predate the table
+        self.assertEqual(Friendship.objects.count(), 0)
+
+        self.assertEqual(friendships.rebuild(), 2)
+        self.assertEqual(friendships.friend_ids(self.author1), {self.author2.id})
@@ -1,11 +1,17 @@
 import base64
 import json
+from io import StringIO
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from django.urls import reverse
 from rest_framework.test import APIClient
 from django.conf import settings
-from social.models import Author, Inbox, FollowRequest, Post, Node
+from django.core.management import call_command
+from social import inbox_service
+from social.federation import BATCH_INBOX_HEADER
+from social.models import Author, FollowRequest, Inbox, Like, Node, Notification, Post
 from unittest.mock import patch, MagicMock
 
 """
@@ -42,9 +48,6 @@ class InboxPostTests(TestCase):
         self.author1.refresh_from_db()
         self.author2.refresh_from_db()
 
-        # Create an empty Inbox for author1.
-        self.inbox = Inbox.objects.create(author=self.author1)
-
         # Create a remote Node to simulate node-to-node requests.
         self.remote_node = Node.objects.create(
             name="TestNode",
@@ -98,11 +101,10 @@ class InboxPostTests(TestCase):
         self.assertEqual(response.status_code, 201)
         self.assertIn("received and stored", response.data.get("message", ""))
         
-        # Verify in the database that a FollowRequest was created and added to the Inbox.
-        inbox = Inbox.objects.get(author=self.author1)
-        follow_requests = inbox.inbox_follows.all()
+        # Verify in the database that a FollowRequest was created and added to the inbox.
+        follow_requests = self.author1.inbox_items.filter(type="follow")
         self.assertEqual(follow_requests.count(), 1)
-        follow_request = follow_requests.first()
+        follow_request = follow_requests.first().target
         self.assertEqual(follow_request.follower_id, self.author2.id)
         self.assertEqual(follow_request.status, "pending")
         self.assertEqual(
@@ -110,6 +112,32 @@ class InboxPostTests(TestCase):
             f"{self.author2.displayName} wants to follow {self.author1.displayName}"
         )
 
+    def test_retried_comment_is_answered_from_receipt(self):
+        """
+        A peer re-sending the same comment gets the first answer back; nothing is
+        written again and no second notification is created.
+        """
+        post = Post.objects.create(title="Test Post", description="", contentType="text/markdown",
+                                   content="content", author=self.author1, visibility="PUBLIC")
+        data = {
+            "type": "comment",
+            "id": "http://remotenode.com/social/api/authors/2/commented/7",
+            "post": post.id,
+            "comment": "First!",
+            "author": {"type": "author", "id": self.author2.id, "host": self.author2.host,
+                       "displayName": self.author2.displayName},
+        }
+        url = reverse("social:api_inbox", kwargs={"author_id": "1"})
+
+        first = self.client.post(url, data, format="json")
+        retry = self.client.post(url, data, format="json")
+        edited = self.client.post(url, dict(data, comment="First! (edited)"), format="json")
+
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertTrue(retry.data["duplicate"])
+        self.assertNotIn("duplicate", edited.data)
+        self.assertEqual(Notification.objects.filter(notification_type="comment").count(), 1)
+
     @patch("social.views.requests.get")
     def test_get_inbox_after_post(self, mock_get):
         """
@@ -145,8 +173,7 @@ class InboxPostTests(TestCase):
         self.assertEqual(post_response.status_code, 201)
         
         # Check the database to ensure the FollowRequest is created.
-        db_inbox = Inbox.objects.get(author=self.author1)
-        self.assertEqual(db_inbox.inbox_follows.count(), 1)
+        self.assertEqual(self.author1.inbox_items.filter(type="follow").count(), 1)
         
         # Patch the requests.get calls used to fetch author details.
         def dummy_get(url, headers):
@@ -238,11 +265,256 @@ class InboxPostTests(TestCase):
         self.assertEqual(response.status_code, 201)
         self.assertIn("received and stored", response.data.get("message", ""))
         
-        # Verify in the database that the comment was added to the Inbox
-        inbox = Inbox.objects.get(author=self.author1)
-        comments = inbox.inbox_comments.all()
+        # Verify in the database that the comment was added to the inbox
+        comments = self.author1.inbox_items.filter(type="comment")
         self.assertEqual(comments.count(), 1)
-        comment = comments.first()
+        comment = comments.first().target
         self.assertEqual(comment.comment, "This is a test comment on your post.")
         self.assertEqual(comment.post, post.id)
         self.assertEqual(comment.author.id, self.author2.id)
+
+
+class InboxPageTests(TestCase):
+    """
+    The follow inbox and notification pages read from the database directly and
+    never call the node's own inbox API over HTTP.
+    """
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="user1", password="password")
+        self.author1 = Author.objects.create(
+            user=self.user1,
+            id="http://localhost:8000/social/api/authors/1",
+            displayName="Lara Croft",
+            host="http://localhost:8000/social/api/",
+        )
+        self.author2 = Author.objects.create(
+            id="http://remotenode.com/social/api/authors/2",
+            displayName="Greg Johnson",
+            host="http://remotenode.com/social/api/",
+        )
+        follow_request = FollowRequest.objects.create(
+            follower_id=self.author2.id,
+            followee=self.author1,
+            summary="Greg Johnson wants to follow Lara Croft",
+        )
+        inbox_service.deliver(self.author1, "follow", follow_request)
+        self.client.login(username="user1", password="password")
+
+    @patch("social.federation.requests.Session.request")
+    def test_follow_inbox_page_makes_no_http_calls(self, mock_request):
+        response = self.client.get(reverse("social:web_inbox"))
+
+        self.assertEqual(response.status_code, 200)
+        mock_request.assert_not_called()
+        follow_requests = response.context["follow_requests"]
+        self.assertEqual(len(follow_requests), 1)
+        self.assertEqual(follow_requests[0]["actor"]["id"], self.author2.id)
+
+    @patch("social.federation.requests.Session.request")
+    def test_notifications_page_counts_follow_requests_locally(self, mock_request):
+        response = self.client.get(reverse("social:notifications_home"))
+
+        self.assertEqual(response.status_code, 200)
+        mock_request.assert_not_called()
+        self.assertEqual(response.context["follow_count"], 1)
+
+
+class InboxDeltaTests(TestCase):
+    """
+    Polling clients read only what was delivered since their last call, using the
+    `since` cursor over InboxItem.seq.
+    """
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="user1", password="password")
+        self.author1 = Author.objects.create(
+            user=self.user1,
+            id="http://localhost:8000/social/api/authors/1",
+            displayName="Lara Croft",
+            host="http://localhost:8000/social/api/",
+        )
+        follow_request = FollowRequest.objects.create(follower_id=self.author1.id, followee=self.author1)
+        inbox_service.deliver(self.author1, "follow", follow_request)
+        self.inbox_url = reverse("social:api_inbox", args=["1"])
+        self.client = APIClient()
+        self.client.defaults["HTTP_HOST"] = "localhost:8000"
+
+    def deliver_post_and_like(self):
+        post = Post.objects.create(title="New", description="", contentType="text/plain",
+                                   content="hi", author=self.author1, visibility="PUBLIC")
+        like = Like.objects.create(author=self.author1, object=post.id)
+        inbox_service.deliver(self.author1, "post", post)
+        inbox_service.deliver(self.author1, "like", like)
+        return post, like
+
+    def test_since_returns_only_new_items_in_delivery_order(self):
+        since = self.client.get(self.inbox_url).data["since"]
+        post, like = self.deliver_post_and_like()
+
+        response = self.client.get(self.inbox_url, {"since": since})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["id"] for item in response.data["items"]], [post.id, like.id])
+        self.assertFalse(response.data["has_more"])
+
+        response = self.client.get(self.inbox_url, {"since": response.data["since"]})
+        self.assertEqual(response.data["items"], [])
+
+    def test_since_with_type_filter_and_limit(self):
+        since = self.client.get(self.inbox_url).data["since"]
+        post, like = self.deliver_post_and_like()
+
+        response = self.client.get(self.inbox_url, {"since": since, "type": "like"})
+        self.assertEqual([item["id"] for item in response.data["items"]], [like.id])
+
+        response = self.client.get(self.inbox_url, {"since": since, "size": 1})
+        self.assertEqual([item["id"] for item in response.data["items"]], [post.id])
+        self.assertTrue(response.data["has_more"])
+
+        response = self.client.get(self.inbox_url, {"since": since, "type": "poke"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_notification_count_reports_new_items_since(self):
+        self.client.login(username="user1", password="password")
+        since = self.client.get(reverse("social:notification_count")).json()["since"]
+        self.deliver_post_and_like()
+
+        counts = self.client.get(reverse("social:notification_count"), {"since": since}).json()
+        self.assertEqual(counts["new_items"], {"follow": 0, "post": 1, "like": 1, "comment": 0})
+
+    def test_notification_count_is_cached_and_conditional(self):
+        self.client.login(username="user1", password="password")
+        count_url = reverse("social:notification_count")
+        first = self.client.get(count_url)
+        self.assertEqual(first.json()["follow_count"], 1)
+
+        # Unchanged counts: one cache lookup, no counting queries, and a 304
+        with CaptureQueriesContext(connection) as queries:
+            unchanged = self.client.get(count_url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(unchanged.status_code, 304)
+        self.assertFalse([q for q in queries.captured_queries
+                          if "social_notification" in q["sql"] or "social_inboxitem" in q["sql"]])
+
+        Notification.objects.create(recipient=self.author1, sender_id=self.author1.id, sender_name="Lara",
+                                    notification_type="like_post", content_object_id=self.author1.id,
+                                    content_object_page=self.author1.id)
+        changed = self.client.get(count_url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()["like_count"], 1)
+
+        self.client.get(reverse("social:mark_all_notifications_read"))
+        self.assertEqual(self.client.get(count_url).json()["like_count"], 0)
+
+
+class MoveInboxItemsTests(TestCase):
+    """
+    `manage.py move_inbox_items` copies the legacy Inbox many-to-many rows into
+    InboxItem in delivery order and empties the old tables.
+    """
+    def test_moves_legacy_rows_in_time_order(self):
+        author = Author.objects.create(
+            id="http://localhost:8000/social/api/authors/1",
+            displayName="Lara Croft",
+            host="http://localhost:8000/social/api/",
+        )
+        post = Post.objects.create(title="Old", description="", contentType="text/plain",
+                                   content="hi", author=author, visibility="PUBLIC")
+        like = Like.objects.create(author=author, object=post.id)
+        inbox = Inbox.objects.create(author=author)
+        inbox.inbox_likes.add(like)
+        inbox.inbox_posts.add(post)
+
+        call_command("move_inbox_items", stdout=StringIO())
+
+        items = list(author.inbox_items.order_by("seq"))
+        self.assertEqual([(item.type, item.target) for item in items], [("post", post), ("like", like)])
+        self.assertEqual(items[0].created_at, post.published)
+        self.assertFalse(Inbox.objects.exists())
+
+
+class InboxBatchTests(TestCase):
+    """
+    Peers can deliver many inbox items in one request to the batch inbox and get
+    a result per item back.
+    """
+    def setUp(self):
+        self.author1 = Author.objects.create(
+            id="http://localhost:8000/social/api/authors/1",
+            displayName="Lara Croft",
+            host="http://localhost:8000/social/api/",
+        )
+        self.post = Post.objects.create(title="Mine", description="", contentType="text/plain",
+                                        content="hi", author=self.author1, visibility="PUBLIC")
+        Node.objects.create(name="TestNode", base_url="http://remotenode.com/", auth_username="testnodeuser",
+                            auth_password="testnodepass")
+        self.client = APIClient()
+        self.client.defaults["HTTP_HOST"] = "localhost:8000"
+        credentials = base64.b64encode(b"testnodeuser:testnodepass").decode("utf-8")
+        self.client.credentials(HTTP_AUTHORIZATION="Basic " + credentials)
+
+    def remote_author(self, n):
+        return {"type": "author", "id": f"http://remotenode.com/social/api/authors/{n}",
+                "host": "http://remotenode.com/social/api/", "displayName": f"Remote {n}"}
+
+    def test_batch_stores_items_and_reports_each(self):
+        inbox = f"{self.author1.id}/inbox"
+        like = {"type": "like", "id": "http://remotenode.com/social/api/authors/2/liked/1",
+                "author": self.remote_author(2), "object": self.post.id}
+        entries = [
+            {"to": inbox, "activity": like},
+            {"to": inbox, "activity": {"type": "comment", "id": "http://remotenode.com/social/api/authors/2/commented/1",
+                                       "author": self.remote_author(2), "comment": "Nice", "post": self.post.id}},
+            {"to": self.author1.id, "activity": {"type": "Follow", "actor": self.remote_author(3),
+                                                 "object": {"id": self.author1.id}}},
+            {"to": inbox, "activity": dict(like, id="http://remotenode.com/social/api/authors/2/liked/2")},
+            {"to": "http://localhost:8000/social/api/authors/404", "activity": like},
+            {"to": inbox, "activity": {"type": "comment", "author": self.remote_author(2)}},
+        ]
+
+        response = self.client.post(reverse("social:api_inbox_batch"), {"type": "batch", "items": entries},
+                                    format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result["status"] for result in response.data["results"]], [201, 201, 201, 200, 404, 400])
+        self.assertEqual(Like.objects.filter(object=self.post.id).count(), 1)
+        self.assertEqual(Author.objects.get(id=self.remote_author(3)["id"]).displayName, "Remote 3")
+        self.assertEqual(sorted(self.author1.inbox_items.values_list("type", flat=True)), ["comment", "follow", "like"])
+
+    def test_batch_like_with_taken_id_is_not_counted_again(self):
+        other = Post.objects.create(title="Other", description="", contentType="text/plain",
+                                    content="hi", author=self.author1, visibility="PUBLIC")
+        like_id = "http://remotenode.com/social/api/authors/2/liked/1"
+        Like.objects.create(id=like_id, author=Author.objects.create(**{k: v for k, v in self.remote_author(2).items()
+                                                                        if k != "type"}), object=other.id)
+        entries = [{"to": self.author1.id, "activity": {"type": "like", "id": like_id,
+                                                        "author": self.remote_author(2), "object": self.post.id}}]
+
+        response = self.client.post(reverse("social:api_inbox_batch"), entries, format="json")
+
+        self.assertEqual(response.data["results"][0]["status"], 200)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+        self.assertEqual(Notification.objects.filter(content_object_id=self.post.id).count(), 0)
+
+    def test_batch_follow_from_unknown_host_registers_node(self):
+        actor = dict(self.remote_author(3), id="http://newnode.com/social/api/authors/3", host="http://newnode.com/social/api")
+        entries = [{"to": self.author1.id, "activity": {"type": "Follow", "actor": actor, "object": {"id": self.author1.id}}}]
+
+        self.client.post(reverse("social:api_inbox_batch"), entries, format="json")
+
+        self.assertTrue(Node.objects.filter(base_url="http://newnode.com/social/api/").exists())
+
+    def test_batch_requires_node_credentials_and_inbox_advertises_it(self):
+        response = APIClient().post(reverse("social:api_inbox_batch"), [], format="json", HTTP_HOST="localhost:8000")
+        self.assertIn(response.status_code, (401, 403))
+
+        response = self.client.get(reverse("social:api_inbox", args=["1"]))
+        self.assertEqual(response[BATCH_INBOX_HEADER], "http://localhost:8000/social/api/inbox/batch")
+
+    def test_retried_batch_is_answered_from_receipts(self):
+        like = {"type": "like", "id": "http://remotenode.com/social/api/authors/2/liked/1",
+                "author": self.remote_author(2), "object": self.post.id}
+        entries = [{"to": self.author1.id, "activity": like}]
+        self.client.post(reverse("social:api_inbox_batch"), entries, format="json")
+
+        with self.assertNumQueries(1):  # the receipt lookup; node auth is served by the registry
+            response = self.client.post(reverse("social:api_inbox_batch"), entries, format="json")
+        self.assertEqual(response.data["results"], [{"index": 0, "status": 201, "id": like["id"], "duplicate": True}])
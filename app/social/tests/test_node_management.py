@@ -2,6 +2,8 @@ from .test_setup import TestSetUp
 from unittest import mock
 from django.test import TestCase, Client
 from django.urls import reverse
+from django.core.cache import cache
+from social import node_registry
 from social.models import Node
 from requests import get
 from django.contrib.auth.models import User
@@ -96,4 +98,40 @@ class TestNodeManagement(TestSetUp):
         response = self.client.get(reverse('social:get_authors'), **headers)
 
         print(response.data)
-        self.assertEqual(response.status_code, 403)
\ No newline at end of file
+        self.assertEqual(response.status_code, 403)
+
+    def test_node_registry_serves_lookups_from_memory(self):
+        node_registry.by_username("user1")
+        with self.assertNumQueries(0):
+            self.assertEqual(node_registry.by_username("user2"), self.node2)
+            self.assertEqual(node_registry.by_host("http://localhost:8003/social/api/authors/5"), self.node3)
+            self.assertIsNone(node_registry.by_host("http://elsewhere.com/social/api/"))
+
+        # Saving a node reloads this process's registry at once
+        self.node2.enabled = False
+        self.node2.save()
+        self.assertTrue(node_registry.is_disabled("http://localhost:8002/"))
+
+        # A change published by another worker is picked up on the next version check
+        Node.objects.filter(pk=self.node1.pk).update(enabled=False)
+        cache.set(node_registry.VERSION_KEY, "changed-by-another-worker", None)
+        with mock.patch.object(node_registry, "CHECK_SECONDS", 0):
+            self.assertTrue(node_registry.is_disabled("http://localhost:8001/social/api/"))
+
+    def test_node_registry_matches_host_and_port(self):
+        # Two services on one host: each port is its own node
+        self.assertEqual(node_registry.by_host("http://localhost:8001/social/api/authors/1"), self.node1)
+        self.assertEqual(node_registry.by_host("localhost:8002"), self.node2)
+        self.assertIsNone(node_registry.by_host("http://localhost:8009/social/api/authors/1"))
+        self.assertIsNone(node_registry.by_host("http://localhost/social/api/authors/1"))
+
+        self.node2.enabled = False
+        self.node2.save()
+        self.assertTrue(node_registry.is_disabled("http://localhost:8002/social/api/"))
+        self.assertFalse(node_registry.is_disabled("http://localhost:8001/social/api/"))
+
+        # The scheme's default port is the same service as no port
+        default_port = Node.objects.create(name="default_port", base_url="http://node.com/social/api/",
+                                           auth_username="user4", auth_password="pass4")
+        self.assertEqual(node_registry.by_host("http://node.com:80/social/api/authors/1"), default_port)
+        self.assertIsNone(node_registry.by_host("https://node.com:8443/social/api/authors/1"))
@@ -0,0 +1,266 @@
+import json
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.utils import timezone
+from social.models import Author, Post, Node, Follow, OutboxItem, OutboxEvent
+from social.post_views import send_post_to_remote_followers
+from social import outbox, federation
+from unittest.mock import patch, MagicMock
+
+"""
+Tests the federation outbox: outbound inbox deliveries are queued as OutboxItem
+rows and sent later by the run_outbox worker, with retries and dead-lettering.
+Also checks that a fan-out stores one body per event and groups sends per node.
+"""
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        federation.reset()
+        self.user = User.objects.create_user(username="user1", password="password")
+        self.author = Author.objects.create(
+            user=self.user,
+            id="http://localhost:8000/social/api/authors/1",
+            displayName="Lara Croft",
+            host="http://localhost:8000/social/api/",
+        )
+        self.remote_node = Node.objects.create(
+            name="RemoteNode",
+            base_url="http://remotenode.com/social/api/",
+            auth_username="remoteuser",
+            auth_password="remotepass",
+        )
+        self.remote_follower_id = "http://remotenode.com/social/api/authors/5"
+        Follow.objects.create(follower_id=self.remote_follower_id, followee=self.author)
+
+        self.post = Post.objects.create(
+            title="Hello",
+            description="desc",
+            contentType="text/plain",
+            content="hello world",
+            author=self.author,
+            visibility="PUBLIC",
+        )
+
+    def ok_response(self):
+        response = MagicMock()
+        response.ok = True
+        response.status_code = 201
+        response.headers = {}
+        return response
+
+    def failed_response(self):
+        response = MagicMock()
+        response.ok = False
+        response.status_code = 503
+        response.text = "unavailable"
+        response.headers = {}
+        return response
+
+    @patch("social.federation.requests.Session.request")
+    def test_sending_post_only_queues(self, mock_post):
+        """
+        Sending a post to remote followers writes an outbox row and makes no HTTP call.
+        """
+        send_post_to_remote_followers(self.post, self.author)
+
+        mock_post.assert_not_called()
+        item = OutboxItem.objects.get()
+        self.assertEqual(item.node, self.remote_node)
+        self.assertEqual(item.inbox_url, "http://remotenode.com/social/api/authors/5/inbox")
+        self.assertEqual(item.payload["id"], self.post.id)
+        self.assertEqual(item.status, "pending")
+
+    @patch("social.federation.requests.Session.request")
+    def test_worker_delivers_pending_items(self, mock_post):
+        """
+        The worker sends due items with the node's credentials and marks them delivered.
+        """
+        mock_post.return_value = self.ok_response()
+        item = outbox.enqueue(self.remote_node, f"{self.remote_follower_id}/inbox", {"type": "like"})
+
+        counts = outbox.run_once()
+
+        self.assertEqual(counts["delivered"], 1)
+        self.assertEqual(mock_post.call_args.kwargs["data"], '{"type": "like"}')
+        self.assertEqual(counts["hosts"][self.remote_node.base_url]["sent"], 1)
+        self.assertEqual(mock_post.call_args.args[0], "POST")
+        self.assertEqual(federation.session_for(self.remote_node).auth, ("remoteuser", "remotepass"))
+        self.assertEqual(federation.metrics()[self.remote_node.base_url]["requests"], 1)
+        item.refresh_from_db()
+        self.assertEqual(item.status, "delivered")
+        self.assertEqual(item.attempts, 1)
+        self.assertIsNotNone(item.delivered_at)
+
+    @patch("social.federation.requests.Session.request")
+    def test_failed_delivery_backs_off(self, mock_post):
+        """
+        A failed delivery is rescheduled with exponential backoff and is not retried before it is due.
+        """
+        mock_post.return_value = self.failed_response()
+        item = outbox.enqueue(self.remote_node, f"{self.remote_follower_id}/inbox", {"type": "like"})
+
+        outbox.run_once()
+        item.refresh_from_db()
+        self.assertEqual(item.status, "pending")
+        self.assertEqual(item.attempts, 1)
+        self.assertIn("503", item.last_error)
+        self.assertGreater(item.next_attempt_at, timezone.now())
+
+        # Not due yet, so nothing is claimed
+        self.assertEqual(outbox.run_once()["claimed"], 0)
+        self.assertEqual(outbox.backoff_delay(3), outbox.backoff_delay(1) * 4)
+
+    @patch("social.federation.requests.Session.request")
+    def test_item_is_dead_lettered_after_max_attempts(self, mock_post):
+        mock_post.return_value = self.failed_response()
+        item = outbox.enqueue(self.remote_node, f"{self.remote_follower_id}/inbox", {"type": "like"})
+        OutboxItem.objects.filter(pk=item.pk).update(attempts=outbox.MAX_ATTEMPTS - 1)
+
+        counts = outbox.run_once()
+
+        self.assertEqual(counts["dead"], 1)
+        item.refresh_from_db()
+        self.assertEqual(item.status, "dead")
+
+    @patch("social.federation.requests.Session.request")
+    def test_update_falls_back_to_post_then_put(self, mock_request):
+        """
+        Nodes that reject the custom 'update' type get the post again as 'post', then as a PUT.
+        """
+        mock_request.side_effect = lambda method, url, **kwargs: (
+            self.ok_response() if method == "PUT" else self.failed_response()
+        )
+        outbox.enqueue(self.remote_node, f"{self.remote_follower_id}/inbox", {"type": "update", "id": self.post.id})
+
+        outbox.run_once()
+
+        methods = [call.args[0] for call in mock_request.call_args_list]
+        self.assertEqual(methods, ["POST", "POST", "PUT"])
+        self.assertIn('"type": "post"', mock_request.call_args_list[1].kwargs["data"])
+
+    @patch("social.federation.requests.Session.request")
+    def test_new_post_falls_back_to_put(self, mock_request):
+        """
+        A new post is retried like an update: POSTed again, then sent as a PUT.
+        """
+        mock_request.side_effect = lambda method, url, **kwargs: (
+            self.ok_response() if method == "PUT" else self.failed_response()
+        )
+        item = outbox.enqueue(self.remote_node, f"{self.remote_follower_id}/inbox", {"type": "post", "id": self.post.id})
+
+        outbox.run_once()
+
+        methods = [call.args[0] for call in mock_request.call_args_list]
+        self.assertEqual(methods, ["POST", "POST", "PUT"])
+        item.refresh_from_db()
+        self.assertEqual(item.status, "delivered")
+
+    @patch("social.federation.requests.Session.request")
+    def test_other_types_are_not_resent(self, mock_request):
+        mock_request.return_value = self.failed_response()
+        outbox.enqueue(self.remote_node, f"{self.remote_follower_id}/inbox", {"type": "like"})
+
+        outbox.run_once()
+
+        self.assertEqual(mock_request.call_count, 1)
+
+    def test_per_node_cap_limits_claims(self):
+        for i in range(5):
+            outbox.enqueue(self.remote_node, f"{self.remote_follower_id}/inbox", {"type": "like", "n": i})
+
+        claimed = outbox.claim_batch(limit=10, per_node=2)
+
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual(OutboxItem.objects.filter(status="pending").count(), 3)
+
+    @patch("social.federation.requests.Session.request")
+    def test_fan_out_serializes_once_per_event(self, mock_post):
+        """
+        A post sent to many followers on two hosts stores a single body, and the
+        worker reports per-host results.
+        """
+        mock_post.return_value = self.ok_response()
+        other_node = Node.objects.create(
+            name="OtherNode",
+            base_url="http://othernode.com/social/api/",
+            auth_username="otheruser",
+            auth_password="otherpass",
+        )
+        for i in range(6, 10):
+            Follow.objects.create(follower_id=f"http://remotenode.com/social/api/authors/{i}", followee=self.author)
+            Follow.objects.create(follower_id=f"http://othernode.com/social/api/authors/{i}", followee=self.author)
+
+        send_post_to_remote_followers(self.post, self.author)
+
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+        self.assertEqual(OutboxItem.objects.count(), 9)
+
+        counts = outbox.run_once(limit=50, per_node=10)
+
+        self.assertEqual(counts["delivered"], 9)
+        self.assertEqual(counts["hosts"][self.remote_node.base_url]["sent"], 5)
+        self.assertEqual(counts["hosts"][other_node.base_url]["sent"], 4)
+        bodies = {call.kwargs["data"] for call in mock_post.call_args_list}
+        self.assertEqual(len(bodies), 1)
+
+    @patch("social.federation.requests.Session.request")
+    def test_batch_inbox_is_learned_and_used(self, mock_request):
+        """
+        A peer that advertises a batch inbox gets later likes in one request, and
+        each item is settled from its own entry in the per-item results.
+        """
+        batch_url = "http://remotenode.com/social/api/inbox/batch"
+        advertising = self.ok_response()
+        advertising.headers = {federation.BATCH_INBOX_HEADER: batch_url}
+        mock_request.return_value = advertising
+        outbox.enqueue(self.remote_node, f"{self.remote_follower_id}/inbox", {"type": "like"})
+        outbox.run_once()
+        self.remote_node.refresh_from_db()
+        self.assertEqual(self.remote_node.batch_inbox_url, batch_url)
+
+        batch_response = self.ok_response()
+        batch_response.status_code = 200
+        batch_response.json.return_value = {"results": [
+            {"index": 0, "status": 201}, {"index": 1, "status": 404, "error": "Recipient not found"}, {"index": 2, "status": 200},
+        ]}
+        mock_request.reset_mock()
+        mock_request.return_value = batch_response
+        items = [outbox.enqueue(self.remote_node, f"{self.remote_follower_id}/inbox", {"type": "Like", "n": i})
+                 for i in range(3)]
+
+        counts = outbox.run_once(per_node=1)
+
+        self.assertEqual(mock_request.call_count, 1)
+        method, url = mock_request.call_args.args
+        self.assertEqual((method, url), ("POST", batch_url))
+        body = json.loads(mock_request.call_args.kwargs["data"])
+        self.assertEqual([entry["activity"]["n"] for entry in body["items"]], [0, 1, 2])
+        self.assertEqual(counts["delivered"], 2)
+        self.assertEqual([OutboxItem.objects.get(pk=item.pk).status for item in items],
+                         ["delivered", "pending", "delivered"])
+
+    @patch("social.federation.requests.Session.request")
+    def test_batch_inbox_on_another_origin_is_ignored(self, mock_request):
+        """
+        Batches carry our credentials for the node, so a batch inbox advertised on
+        another host or scheme is never stored or used.
+        """
+        for advertised in ["http://attacker.example/inbox/batch", "https://remotenode.com/social/api/inbox/batch"]:
+            response = self.ok_response()
+            response.headers = {federation.BATCH_INBOX_HEADER: advertised}
+            mock_request.return_value = response
+            outbox.enqueue(self.remote_node, f"{self.remote_follower_id}/inbox", {"type": "like"})
+            outbox.run_once()
+            self.remote_node.refresh_from_db()
+            self.assertEqual(self.remote_node.batch_inbox_url, "")
+
+        # A URL stored before this check is not used either
+        self.remote_node.batch_inbox_url = "http://attacker.example/inbox/batch"
+        self.remote_node.save()
+        mock_request.reset_mock()
+        mock_request.return_value = self.ok_response()
+        outbox.enqueue(self.remote_node, f"{self.remote_follower_id}/inbox", {"type": "like"})
+        outbox.run_once()
+        self.assertNotIn("attacker.example", mock_request.call_args.args[1])
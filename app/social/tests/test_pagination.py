@@ -0,0 +1,102 @@
+from .test_setup import TestSetUp
+from base64 import b64encode
+from django.urls import reverse
+from social import inbox_service
+from social.models import Author, Comment, Like, Post
+
+"""
+Keyset (cursor) pagination of the list APIs, and the page/size compatibility layer
+"""
+class TestPagination(TestSetUp):
+
+    def node_headers(self):
+        credentials = b64encode(b"admin9:secret9").decode("ascii")
+        return {"HTTP_AUTHORIZATION": f"Basic {credentials}"}
+
+    def create_authors(self, count):
+        Author.objects.bulk_create([
+            Author(id=f"http://localhost:8000/social/api/authors/{1000 + i}",
+                   host="http://localhost:8000/social/api/", displayName=f"Author {i}")
+            for i in range(count)
+        ])
+
+    def walk(self, url, key, **params):
+        seen, pages = [], 0
+        response = self.client.get(url, params, **self.node_headers())
+        while True:
+            self.assertEqual(response.status_code, 200)
+            seen += [item["id"] for item in response.data[key]]
+            pages += 1
+            if not response.data["next"]:
+                return seen, pages
+            response = self.client.get(response.data["next"], **self.node_headers())
+
+    def test_authors_cursor_walk_returns_every_author_once(self):
+        self.create_authors(24)
+        seen, pages = self.walk(reverse("social:get_authors"), "authors", size=10)
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(seen, sorted(set(seen)))
+
+    def test_page_and_size_still_work(self):
+        self.create_authors(24)
+        url = reverse("social:get_authors")
+        first = self.client.get(url, {"size": 10}, **self.node_headers())
+        by_cursor = self.client.get(first.data["next"], **self.node_headers())
+        by_page = self.client.get(url, {"page": 2, "size": 10}, **self.node_headers())
+
+        self.assertEqual([a["id"] for a in by_page.data["authors"]], [a["id"] for a in by_cursor.data["authors"]])
+        self.assertIn("cursor=", by_page.data["next"])
+
+    def test_size_is_capped_and_bad_cursor_is_rejected(self):
+        self.create_authors(120)
+        url = reverse("social:get_authors")
+        response = self.client.get(url, {"size": 1000}, **self.node_headers())
+        self.assertEqual(len(response.data["authors"]), 100)
+
+        response = self.client.get(url, {"cursor": "not-a-cursor"}, **self.node_headers())
+        self.assertEqual(response.status_code, 400)
+
+    def test_liked_reports_page_number_and_count_only_in_page_mode(self):
+        for i in range(3):
+            Like.objects.create(author=self.author, object=f"{self.author.id}/posts/{i}")
+        url = reverse("social:get_liked_by_author_fqid", kwargs={"author_fqid": self.author.id})
+
+        by_page = self.client.get(url, {"page": 1, "size": 2}, **self.node_headers())
+        self.assertEqual(by_page.status_code, 200)
+        self.assertEqual((by_page.data["page_number"], by_page.data["count"]), (1, 3))
+
+        by_cursor = self.client.get(by_page.data["next"], **self.node_headers())
+        self.assertEqual(len(by_cursor.data["src"]), 1)
+        self.assertNotIn("page_number", by_cursor.data)
+        self.assertNotIn("count", by_cursor.data)
+
+    def test_inbox_cursor_walks_items_newest_first(self):
+        delivered = []
+        for i in range(4):
+            post = Post.objects.create(title=f"Post {i}", description="", contentType="text/plain",
+                                       content="hi", author=self.author, visibility="PUBLIC")
+            like = Like.objects.create(author=self.author, object=post.id)
+            comment = Comment.objects.create(author=self.author, comment="c", post=post.id)
+            for kind, obj in (("post", post), ("like", like), ("comment", comment)):
+                inbox_service.deliver(self.author, kind, obj)
+                delivered.append(obj.id)
+
+        url = reverse("social:api_inbox", args=["9"])
+        seen, pages = self.walk(url, "items", size=5)
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(seen, delivered[::-1])
+
+    def test_inbox_page_loads_targets_with_one_query_per_type(self):
+        for i in range(3):
+            like = Like.objects.create(author=self.author, object=f"{self.author.id}/posts/{i}")
+            comment = Comment.objects.create(author=self.author, comment="c", post=f"{self.author.id}/posts/{i}")
+            inbox_service.deliver(self.author, "like", like)
+            inbox_service.deliver(self.author, "comment", comment)
+
+        # The items, then the likes and the comments with their authors
+        with self.assertNumQueries(3):
+            items, _ = inbox_service.inbox_page(self.author, size=10)
+        self.assertEqual(len(items), 6)
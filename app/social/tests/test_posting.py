@@ -1,8 +1,16 @@
 
 from .test_setup import TestSetUp
 from social.models import Post
+from social import thumbnails
+from PIL import Image
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+import io
 import json
 import base64
+import hashlib
+from unittest import mock
 
 class TestPosting(TestSetUp):
     '''
@@ -40,6 +48,20 @@ class TestPosting(TestSetUp):
         self.assertEqual(get_response.data['post']['contentType'], self.plaintext_post_data['contentType'])
         self.assertEqual(get_response.data['post']['content'], self.plaintext_post_data['content'])
 
+    def test_get_post_does_not_depend_on_request_scheme_or_author_mismatch(self):
+        create_response = self.client.post(
+            self.posts_url, self.plaintext_post_data, format="json")
+        parts = create_response.data['id'].split('/')
+        author_serial = int(parts[-3])
+        post_serial = int(parts[-1])
+
+        get_response = self.client.get(self.post_general_url(author_serial, post_serial), secure=True)
+        self.assertEqual(get_response.status_code, 200)
+        self.assertEqual(get_response.data['post']['id'], create_response.data['id'])
+
+        wrong_author = self.client.get(self.post_general_url(author_serial + 1, post_serial))
+        self.assertEqual(wrong_author.status_code, 404)
+
     '''
     Posting 3. Successfully update an exisitng post. Tests 'api/authors/<int:id>/posts/<int:internal_id>/update/' endpoint
     '''
@@ -128,6 +150,199 @@ class TestPosting(TestSetUp):
     
 
 
+    '''
+    Image posts are kept as media files, not base64 in the database, but the API still returns base64
+    '''
+    def test_image_post_is_stored_as_media_file(self):
+        create_response = self.client.post(
+            self.posts_url, self.image_post_data, format="json")
+        self.assertEqual(create_response.status_code, 201)
+
+        post = Post.objects.get(id=create_response.data['id'])
+        self.assertEqual(post.content, "")
+        self.assertTrue(post.media.name.startswith("posts/"))
+        self.assertTrue(post.media.name.endswith(".png"))
+        with post.media.open('rb') as media_file:
+            self.assertEqual(media_file.read(), base64.b64decode(self.image_post_data['content']))
+
+        image_response = self.client.get(reverse('social:post_image', args=[post.internal_id]))
+        self.assertEqual(image_response.status_code, 200)
+        self.assertEqual(image_response['Content-Type'], 'image/png')
+        self.assertEqual(b"".join(image_response.streaming_content), base64.b64decode(self.image_post_data['content']))
+
+    def test_uploaded_image_is_not_base64_encoded(self):
+        image_bytes = base64.b64decode(self.image_post_data['content'])
+        for title in ["First", "Second"]:
+            response = self.client.post(reverse('social:create_post'), {
+                "title": title,
+                "description": "desc",
+                "contentType": "image/png;base64",
+                "visibility": "PUBLIC",
+                "image": SimpleUploadedFile("red.png", image_bytes, content_type="image/png"),
+            })
+            self.assertEqual(response.status_code, 302)
+
+        first, second = Post.objects.filter(title__in=["First", "Second"])
+        self.assertEqual(first.content, "")
+        # Identical uploads share a single content-addressed file
+        self.assertEqual(first.media.name, second.media.name)
+
+    '''
+    Uploads are streamed to disk; the digest and the video header check happen per chunk
+    '''
+    def upload_video(self, video_bytes):
+        return self.client.post(reverse('social:create_video_post'), {
+            "title": "Clip",
+            "description": "desc",
+            "contentType": "video/mp4;base64",
+            "visibility": "PUBLIC",
+            "video": SimpleUploadedFile("clip.mp4", video_bytes, content_type="video/mp4"),
+        })
+
+    def test_uploaded_video_is_named_by_streamed_digest(self):
+        video_bytes = b"\x00\x00\x00\x1cftypisom" + bytes(range(256)) * 512
+        response = self.upload_video(video_bytes)
+        self.assertEqual(response.status_code, 302)
+
+        post = Post.objects.get(title="Clip")
+        self.assertIn(hashlib.sha256(video_bytes).hexdigest(), post.media.name)
+        with post.media.open('rb') as media_file:
+            self.assertEqual(media_file.read(), video_bytes)
+
+    def test_upload_with_bad_video_header_is_rejected(self):
+        response = self.upload_video(b"not a video at all" * 100)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Post.objects.filter(title="Clip").exists())
+
+        # Shorter than the header
+        response = self.upload_video(b"tiny")
+        self.assertEqual(response.status_code, 403)
+
+    '''
+    ?w= serves downscaled variants, WebP when accepted, from a size-bounded disk cache
+    '''
+    def test_image_width_variants(self):
+        source = io.BytesIO()
+        Image.new("RGB", (1000, 500), (200, 30, 30)).save(source, "PNG")
+        response = self.client.post(reverse('social:create_post'), {
+            "title": "Wide",
+            "description": "desc",
+            "contentType": "image/png;base64",
+            "visibility": "PUBLIC",
+            "image": SimpleUploadedFile("wide.png", source.getvalue(), content_type="image/png"),
+        })
+        self.assertEqual(response.status_code, 302)
+        image_url = reverse('social:post_image', args=[Post.objects.get(title="Wide").internal_id])
+
+        webp = self.client.get(image_url + "?w=300", HTTP_ACCEPT="image/webp,*/*")
+        self.assertEqual(webp.status_code, 200)
+        self.assertEqual(webp['Content-Type'], 'image/webp')
+        self.assertIn('Accept', webp['Vary'])
+        self.assertEqual(Image.open(io.BytesIO(b"".join(webp.streaming_content))).size, (320, 160))
+
+        png = self.client.get(image_url + "?w=640")
+        self.assertEqual(png['Content-Type'], 'image/png')
+        self.assertEqual(Image.open(io.BytesIO(b"".join(png.streaming_content))).size, (640, 320))
+
+        cached = self.client.get(image_url + "?w=640", HTTP_IF_NONE_MATCH=png['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        # A bad width serves the original
+        original = self.client.get(image_url + "?w=abc")
+        self.assertEqual(b"".join(original.streaming_content), source.getvalue())
+
+        self.assertGreater(thumbnails.evict(max_bytes=0), 0)
+        self.assertEqual(thumbnails.evict(max_bytes=0), 0)
+
+    def test_thumbnail_miss_walks_the_cache_only_when_due(self):
+        source = io.BytesIO()
+        Image.new("RGB", (1000, 500), (30, 200, 30)).save(source, "PNG")
+        self.client.post(reverse('social:create_post'), {
+            "title": "Budget",
+            "description": "desc",
+            "contentType": "image/png;base64",
+            "visibility": "PUBLIC",
+            "image": SimpleUploadedFile("budget.png", source.getvalue(), content_type="image/png"),
+        })
+        image_url = reverse('social:post_image', args=[Post.objects.get(title="Budget").internal_id])
+        thumbnails.evict()
+
+        with mock.patch.object(thumbnails.os, "walk", wraps=thumbnails.os.walk) as walk:
+            self.client.get(image_url + "?w=320")
+            self.assertEqual(walk.call_count, 0)
+
+            with mock.patch.object(thumbnails, "MAX_BYTES", 0):
+                self.client.get(image_url + "?w=640")
+            self.assertEqual(walk.call_count, 1)
+
+            # Variants written by other processes are caught by a periodic walk
+            with mock.patch.object(thumbnails, "WALK_SECONDS", 0):
+                self.client.get(image_url + "?w=1280")
+            self.assertEqual(walk.call_count, 2)
+
+    def test_migrate_post_media_moves_inline_content(self):
+        create_response = self.client.post(
+            self.posts_url, self.image_post_data, format="json")
+        # Simulate a row written before media storage existed
+        Post.objects.filter(id=create_response.data['id']).update(content=self.image_post_data['content'], media='')
+
+        call_command("migrate_post_media", stdout=io.StringIO())
+
+        post = Post.objects.get(id=create_response.data['id'])
+        self.assertEqual(post.content, "")
+        self.assertTrue(post.media.name.startswith("posts/"))
+
+
+    '''
+    Video and image endpoints support byte ranges and conditional requests
+    '''
+    def create_video_post(self, video_bytes):
+        video_post_data = self.plaintext_post_data.copy()
+        video_post_data["contentType"] = "video/mp4;base64"
+        video_post_data["content"] = base64.b64encode(video_bytes).decode()
+        create_response = self.client.post(self.posts_url, video_post_data, format="json")
+        self.assertEqual(create_response.status_code, 201)
+        return Post.objects.get(id=create_response.data['id'])
+
+    def test_video_range_request_returns_partial_content(self):
+        video_bytes = bytes(range(256)) * 1024
+        post = self.create_video_post(video_bytes)
+        video_url = reverse('social:test_video', args=[post.internal_id])
+
+        response = self.client.get(video_url, HTTP_RANGE="bytes=1000-1999")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f"bytes 1000-1999/{len(video_bytes)}")
+        self.assertEqual(response['Content-Length'], "1000")
+        self.assertEqual(b"".join(response.streaming_content), video_bytes[1000:2000])
+
+        response = self.client.get(video_url, HTTP_RANGE="bytes=-10")
+        self.assertEqual(b"".join(response.streaming_content), video_bytes[-10:])
+
+        response = self.client.get(video_url, HTTP_RANGE=f"bytes={len(video_bytes)}-")
+        self.assertEqual(response.status_code, 416)
+
+        response = self.client.get(video_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], "bytes")
+        self.assertEqual(b"".join(response.streaming_content), video_bytes)
+
+    def test_image_etag_and_last_modified_allow_304(self):
+        create_response = self.client.post(
+            self.posts_url, self.image_post_data, format="json")
+        post = Post.objects.get(id=create_response.data['id'])
+        image_url = reverse('social:post_image', args=[post.internal_id])
+
+        response = self.client.get(image_url)
+        etag = response['ETag']
+        self.assertIn(post.media.name.split('/')[-1].split('.')[0], etag)
+
+        response = self.client.get(image_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(image_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+
     '''
     Posting 9. Successfully delete a post by updating its visibility field
     '''
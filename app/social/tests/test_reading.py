@@ -1,4 +1,7 @@
 from .test_setup import TestSetUp
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from social.models import Post, Comment, Like
 
 class TestReading(TestSetUp):
 
@@ -93,4 +96,64 @@ class TestReading(TestSetUp):
         self.assertTemplateUsed(get_response, 'social/index.html')
         # Check stream does not display the post's fields
         self.assertNotContains(get_response,  self.plaintext_post_data['title'])
-        self.assertNotContains(get_response,  self.plaintext_post_data['description'])
\ No newline at end of file
+        self.assertNotContains(get_response,  self.plaintext_post_data['description'])
+
+
+    '''
+    Stream page costs the same number of queries however many posts, comments and likes are visible
+    '''
+    def create_posts_with_activity(self, count):
+        for i in range(count):
+            post = Post.objects.create(
+                title=f"Post {i}", description="desc", contentType="text/plain",
+                content="content", author=self.author, visibility="PUBLIC",
+            )
+            comment = Comment.objects.create(author=self.author, comment=f"Comment {i}", post=post.id)
+            Like.objects.create(author=self.author, object=post.id)
+            Like.objects.create(author=self.author, object=comment.id)
+
+    def count_stream_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            get_response = self.client.get(self.stream_url)
+        self.assertEqual(get_response.status_code, 200)
+        return len(queries), get_response
+
+    def test_stream_query_count_is_constant(self):
+        self.create_posts_with_activity(2)
+        small_count, _ = self.count_stream_queries()
+
+        self.create_posts_with_activity(12)
+        large_count, get_response = self.count_stream_queries()
+
+        self.assertEqual(small_count, large_count)
+        posts = get_response.context['posts']
+        self.assertEqual(len(posts), 10)
+        self.assertTrue(all(post.is_liked and post.like_count == 1 for post in posts))
+        self.assertTrue(all(post.comment_list[0].is_liked for post in posts))
+
+    '''
+    Post lists return a content preview and a media URL; full content stays on the detail endpoints
+    '''
+    def test_post_list_returns_previews(self):
+        text_post = Post.objects.create(
+            title="Long", description="desc", contentType="text/plain",
+            content="x" * 5000, author=self.author, visibility="PUBLIC",
+        )
+        # bulk_create keeps the base64 inline, like rows stored before media moved to disk
+        video_post, = Post.objects.bulk_create([Post(
+            id=f"{self.author.id}/posts/video", title="Video", description="desc",
+            contentType="video/mp4;base64", content="AAAA" * 1000, author=self.author, visibility="PUBLIC",
+        )])
+        video_post = Post.objects.get(id=video_post.id)
+
+        self.assertEqual(Post.objects.previews().get(pk=video_post.pk).get_deferred_fields(), {"content"})
+
+        get_response = self.client.get(self.posts_url)
+        self.assertEqual(get_response.status_code, 200)
+
+        posts = {post["id"]: post for post in get_response.data}
+        self.assertEqual(len(posts[text_post.id]["content"]), 500)
+        self.assertTrue(posts[video_post.id]["content"].endswith(f"/social/test-video/{video_post.internal_id}/"))
+
+        detail_response = self.client.get(self.post_general_url(9, text_post.internal_id))
+        self.assertEqual(len(detail_response.data["post"]["content"]), 5000)
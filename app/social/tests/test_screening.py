@@ -0,0 +1,39 @@
+import re
+
+from django.test import TestCase
+from django.urls import reverse
+
+from social import screening
+
+"""
+Tests SecurityMiddleware's request screening: the compiled, trigger-filtered
+rules flag exactly what the old per-rule loop flagged, and hits are counted.
+"""
+
+
+class ScreeningTests(TestCase):
+    SAMPLES = [
+        "plain words only", "a.b.c 42", "O'Brien", "x = 1; y", "1 -- comment", "%27 OR 1", "/ID'OR",
+        "EXEC sp_who", "<SCRIPT>alert(1)</script>", "JavaScript:void", "<img onerror=x>", "eval(a)",
+        "document.cookie", "<iframe src=x></iframe>", "a | b", "$(id)", "${HOME}", "`ls`", "a && b && c",
+        "<ſcript>x</ſcript>", "javascrıpt:", "tab\there", "100%",
+    ]
+
+    def setUp(self):
+        screening.reset_hit_counts()
+
+    def test_matches_the_per_rule_loop(self):
+        patterns = [pattern for _, pattern, _ in screening.RULES]
+        for value in self.SAMPLES:
+            legacy = any(re.search(pattern, value, re.IGNORECASE) for pattern in patterns)
+            self.assertEqual(screening.scan(value) is not None, legacy, value)
+
+    def test_middleware_rejects_and_counts(self):
+        response = self.client.post(reverse("social:login"), "comment=<script>alert(1)</script>",
+                                    content_type="application/x-www-form-urlencoded")
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(screening.hit_counts()["xss_script_tag"], 1)
+
+    def test_scans_the_whole_value(self):
+        self.assertEqual(screening.scan("a" * (1024 * 1024) + "<script>x</script>"), "xss_script_tag")
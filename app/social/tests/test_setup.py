@@ -6,6 +6,7 @@ from social.models import Author, Node
 from django.core.files.uploadedfile import SimpleUploadedFile
 import io
 import os
+import tempfile
 from PIL import Image 
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
@@ -24,6 +25,7 @@ from django.test import TestCase, override_settings
 
  
 
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix="social-test-media-"))
 class TestSetUp(TestCase):
     '''
     re-run app with docker compose build & up
@@ -0,0 +1,140 @@
+import io
+import struct
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+
+from .test_setup import TestSetUp
+from social import video_probe
+from social.models import Post
+
+
+def box(kind, payload):
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def sample_mp4():
+    mvhd = box(b"mvhd", bytes(4) + struct.pack(">IIII", 0, 0, 1000, 12500) + bytes(80))
+    tkhd = box(b"tkhd", bytes(76) + struct.pack(">II", 640 << 16, 360 << 16))
+    hdlr = box(b"hdlr", bytes(8) + b"vide" + bytes(13))
+    stsd = box(b"stsd", bytes(4) + struct.pack(">I", 1) + box(b"avc1", bytes(78)))
+    trak = box(b"trak", tkhd + box(b"mdia", hdlr + box(b"minf", box(b"stbl", stsd))))
+    # moov after mdat, as written by encoders without faststart
+    return box(b"ftyp", b"isom" + bytes(4)) + box(b"mdat", bytes(4096)) + box(b"moov", mvhd + trak)
+
+
+def element(element_id, payload):
+    id_bytes = element_id.to_bytes((element_id.bit_length() + 7) // 8, "big")
+    return id_bytes + (0x01 << 56 | len(payload)).to_bytes(8, "big") + payload
+
+
+def sample_webm(width=(320).to_bytes(2, "big")):
+    info = element(video_probe.INFO, element(video_probe.TIMECODE_SCALE, (1000000).to_bytes(3, "big"))
+                   + element(video_probe.DURATION, struct.pack(">d", 4000.0)))
+    video = element(video_probe.VIDEO, element(video_probe.PIXEL_WIDTH, width)
+                    + element(video_probe.PIXEL_HEIGHT, (240).to_bytes(1, "big")))
+    track = element(video_probe.TRACK_ENTRY, element(video_probe.TRACK_TYPE, b"\x01")
+                    + element(video_probe.CODEC_ID, b"V_VP9") + video)
+    cluster = element(video_probe.CLUSTER, bytes(512))
+    # Segment of unknown size, as written by live encoders
+    segment = b"\x18\x53\x80\x67\x01\xff\xff\xff\xff\xff\xff\xff" + info + element(video_probe.TRACKS, track) + cluster
+    return element(video_probe.EBML_HEADER, b"\x42\x82\x84webm") + segment
+
+
+class VideoProbeTests(TestSetUp):
+
+    def setUp(self):
+        super().setUp()
+        video_probe._retry_at.clear()
+
+    def test_probe_mp4(self):
+        info = video_probe.probe(io.BytesIO(sample_mp4()))
+        self.assertEqual(info, video_probe.VideoInfo(12.5, 640, 360, "h264"))
+
+    def test_probe_webm(self):
+        info = video_probe.probe(io.BytesIO(sample_webm()))
+        self.assertEqual(info, video_probe.VideoInfo(4.0, 320, 240, "vp9"))
+
+    def test_probe_rejects_other_files(self):
+        self.assertIsNone(video_probe.probe(io.BytesIO(b"not a video at all")))
+        self.assertIsNone(video_probe.probe(io.BytesIO(b"\x00\x00\x00\x1cftypisom" + bytes(range(256)))))
+
+    def test_probe_tolerates_malformed_headers(self):
+        empty = box(b"ftyp", b"isom" + bytes(4)) + box(b"moov", box(b"mvhd", b"") + box(b"trak", box(b"tkhd", b"")
+                    + box(b"mdia", box(b"hdlr", bytes(8) + b"vide"))))
+        self.assertEqual(video_probe.probe(io.BytesIO(empty)), video_probe.VideoInfo(None, None, None, ""))
+
+        oversized = sample_webm(width=bytes([0xff]) * 8)
+        self.assertEqual(video_probe.probe(io.BytesIO(oversized)).width, None)
+
+    def test_unreadable_video_is_still_marked_probed(self):
+        response = self.client.post(reverse('social:create_video_post'), {
+            "title": "Broken",
+            "description": "desc",
+            "contentType": "video/mp4;base64",
+            "visibility": "PUBLIC",
+            "video": SimpleUploadedFile("clip.mp4", sample_mp4(), content_type="video/mp4"),
+        })
+        self.assertEqual(response.status_code, 302)
+
+        with mock.patch.object(video_probe, "probe", side_effect=IndexError("bad box")):
+            self.assertEqual(video_probe.run_once(), 1)
+        post = Post.objects.get(title="Broken")
+        self.assertTrue(post.video_probed)
+        self.assertIsNone(post.video_duration)
+
+    def test_missing_file_is_retried_later(self):
+        self.client.post(reverse('social:create_video_post'), {
+            "title": "Unmounted",
+            "description": "desc",
+            "contentType": "video/mp4;base64",
+            "visibility": "PUBLIC",
+            "video": SimpleUploadedFile("clip.mp4", sample_mp4(), content_type="video/mp4"),
+        })
+
+        with mock.patch.object(video_probe.media_storage, "open_media", side_effect=FileNotFoundError("gone")) as open_media:
+            self.assertEqual(video_probe.run_once(), 0)
+            self.assertEqual(video_probe.run_once(), 0)
+        self.assertEqual(open_media.call_count, 1)
+        self.assertFalse(Post.objects.get(title="Unmounted").video_probed)
+
+        video_probe._retry_at.clear()
+        with mock.patch.object(video_probe, "extract_poster", return_value=None):
+            self.assertEqual(video_probe.run_once(), 1)
+        post = Post.objects.get(title="Unmounted")
+        self.assertTrue(post.video_probed)
+        self.assertEqual(post.video_duration, 12.5)
+
+    '''
+    create_video_post leaves the probing to the worker; feeds then render the stored metadata
+    '''
+    def test_video_post_is_probed_in_background(self):
+        response = self.client.post(reverse('social:create_video_post'), {
+            "title": "Clip",
+            "description": "desc",
+            "contentType": "video/mp4;base64",
+            "visibility": "PUBLIC",
+            "video": SimpleUploadedFile("clip.mp4", sample_mp4(), content_type="video/mp4"),
+        })
+        self.assertEqual(response.status_code, 302)
+        post = Post.objects.get(title="Clip")
+        self.assertFalse(post.video_probed)
+
+        with mock.patch.object(video_probe, "extract_poster", return_value=b"\xff\xd8poster\xff\xd9"):
+            self.assertEqual(video_probe.run_once(), 1)
+        self.assertEqual(video_probe.run_once(), 0)
+
+        post.refresh_from_db()
+        self.assertTrue(post.video_probed)
+        self.assertEqual((post.video_duration, post.video_width, post.video_height), (12.5, 640, 360))
+        self.assertEqual(post.video_codec, "h264")
+        self.assertEqual(post.video_duration_label, "0:12")
+
+        poster = self.client.get(reverse('social:post_poster', args=[post.internal_id]))
+        self.assertEqual(poster['Content-Type'], 'image/jpeg')
+        self.assertEqual(b"".join(poster.streaming_content), b"\xff\xd8poster\xff\xd9")
+
+        feed = self.client.get(reverse('social:index'))
+        self.assertContains(feed, 'preload="none"')
+        self.assertContains(feed, reverse('social:post_poster', args=[post.internal_id]))
@@ -0,0 +1,176 @@
+"""
+Downscaled and WebP variants of post images.
+
+serve_post_image used to return the original upload for every <img>, so a feed
+card 250px tall transferred the full-size photo. Image endpoints now accept
+?w=<width>: the width is rounded up to one of WIDTHS (so there is a bounded
+number of variants per image), the image is resized on first request and the
+result is kept in a disk cache under MEDIA_ROOT/CACHE_DIR:
+
+    <media sha256>-<width>.<webp|jpg|png>
+
+WebP is served to clients whose Accept header lists image/webp, the original
+format otherwise. A cached variant is named after the digest of its source,
+so it never goes stale; a hit touches the file's mtime, and when the cache
+grows over MAX_BYTES the least recently used files are evicted.
+
+A miss does not walk the cache: each process keeps a running total of its size,
+taken from one walk and then advanced by the size of every variant it writes,
+and evict() walks the directory only once that total is over budget. Variants
+written by other processes are not in the total, so a miss also walks when the
+last walk is older than WALK_SECONDS, and run_outbox (which mounts the same
+media volume) calls evict() every few minutes.
+"""
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from . import media_storage
+
+WIDTHS = getattr(settings, "THUMBNAIL_WIDTHS", (320, 640, 1280))
+CACHE_DIR = getattr(settings, "THUMBNAIL_CACHE_DIR", "thumbnails")
+MAX_BYTES = getattr(settings, "THUMBNAIL_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+WALK_SECONDS = getattr(settings, "THUMBNAIL_CACHE_WALK_SECONDS", 10 * 60)
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+# Bytes in the cache as this process last counted them; None until the first walk
+_cache_bytes = None
+_walked_at = 0.0
+_cache_bytes_lock = threading.Lock()
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+
+
+def snap_width(value):
+    """Returns the smallest of WIDTHS >= `value` (the largest for bigger values), or None if not a width."""
+    try:
+        width = int(value)
+    except (TypeError, ValueError):
+        return None
+    if width <= 0:
+        return None
+    for allowed in WIDTHS:
+        if width <= allowed:
+            return allowed
+    return WIDTHS[-1]
+
+
+def cache_root():
+    return os.path.join(settings.MEDIA_ROOT, CACHE_DIR)
+
+
+def _extension(post, accept):
+    if "image/webp" in (accept or ""):
+        return "webp"
+    return "jpg" if post.contentType == "image/jpeg;base64" else "png"
+
+
+def _render(post, width, path, extension):
+    pil_format, _ = FORMATS[extension]
+    with media_storage.open_media(post) as source:
+        image = Image.open(source)
+        # JPEG decodes straight to a reduced scale when the target is much smaller
+        image.draft("RGB", (width, width * image.height // max(image.width, 1)))
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            image.thumbnail((width, image.height), Image.LANCZOS, reducing_gap=3.0)
+        if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+            image = image.convert("RGBA")
+
+        # Write beside the target and rename, so concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                if pil_format == "WEBP":
+                    image.save(out, pil_format, quality=WEBP_QUALITY, method=4)
+                elif pil_format == "JPEG":
+                    image.save(out, pil_format, quality=JPEG_QUALITY, optimize=True, progressive=True)
+                else:
+                    image.save(out, pil_format, optimize=True)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def evict(max_bytes=None):
+    """Deletes least recently used variants until the cache fits in `max_bytes`. Returns the bytes freed."""
+    global _cache_bytes, _walked_at
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    total = 0
+    for dirpath, _, filenames in os.walk(cache_root()):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+    freed = 0
+    entries.sort()
+    for _, size, path in entries:
+        if total - freed <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        freed += size
+    with _cache_bytes_lock:
+        _cache_bytes = total - freed
+        _walked_at = time.monotonic()
+    return freed
+
+
+def _added(size):
+    """
+    Counts a new variant of `size` bytes, evicting once the running total is
+    over MAX_BYTES or the last walk is older than WALK_SECONDS.
+    """
+    global _cache_bytes
+    with _cache_bytes_lock:
+        if _cache_bytes is not None:
+            _cache_bytes += size
+        due = (_cache_bytes is None or _cache_bytes > MAX_BYTES
+               or time.monotonic() - _walked_at >= WALK_SECONDS)
+    if due:
+        evict()
+
+
+def variant(post, width, accept=""):
+    """
+    Returns (path, etag, mime type) of the post's image at `width` (already
+    snapped) in the best format for `accept`, rendering it on a cache miss.
+    Returns None when the media is not a decodable image.
+    """
+    digest = media_storage.media_etag(post).strip('"')
+    extension = _extension(post, accept)
+    directory = os.path.join(cache_root(), digest[:2])
+    path = os.path.join(directory, f"{digest}-{width}.{extension}")
+
+    try:
+        # Hit: bump the mtime that eviction orders by
+        os.utime(path)
+    except FileNotFoundError:
+        os.makedirs(directory, exist_ok=True)
+        try:
+            _render(post, width, path, extension)
+        except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError) as e:
+            print(f"From thumbnails: Could not render {post.id} at {width}px: {e}")
+            return None
+        _added(os.path.getsize(path))
+    return path, f'"{digest}-{width}.{extension}"', FORMATS[extension][1]
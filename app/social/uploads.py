@@ -0,0 +1,64 @@
+"""
+Streaming upload handler for post images and videos.
+
+Django buffers small uploads in memory and copies large ones to a temporary
+file; the view then hashed the file in a second pass before storing it.
+MediaUploadHandler (settings.FILE_UPLOAD_HANDLERS) writes every uploaded file
+straight to a temporary file chunk by chunk, and as the chunks arrive it:
+
+    - feeds them to a sha256, exposed as upload.sha256 when the file completes
+      (media_storage.store_file uses it instead of re-reading the file)
+    - checks the first HEADER_SIZE bytes of video uploads against
+      SecurityMiddleware.VIDEO_SIGNATURES and drops a video whose header does
+      not match, without receiving the rest into storage
+
+Memory per upload stays at a few chunks whatever the file size. Rejected files
+are recorded in request.rejected_uploads ({field name: reason}), which
+SecurityMiddleware answers with a 403.
+"""
+import hashlib
+
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+
+from .middleware import SecurityMiddleware
+
+HEADER_SIZE = 16
+
+
+def is_video_header(header):
+    """True if `header` (a file's first bytes) carries one of the known video signatures."""
+    return any(signature in header for signatures in SecurityMiddleware.VIDEO_SIGNATURES.values()
+               for signature in signatures)
+
+
+class MediaUploadHandler(TemporaryFileUploadHandler):
+    def new_file(self, field_name, file_name, content_type, *args, **kwargs):
+        super().new_file(field_name, file_name, content_type, *args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.header = b""
+        self.check_video = field_name == "video" or (content_type or "").startswith("video/")
+
+    def receive_data_chunk(self, raw_data, start):
+        if len(self.header) < HEADER_SIZE:
+            self.header += raw_data[:HEADER_SIZE - len(self.header)]
+            if len(self.header) == HEADER_SIZE and not self._header_ok():
+                raise SkipFile()
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        # Files shorter than the header are checked here; SkipFile is not caught at this point
+        if len(self.header) < HEADER_SIZE and not self._header_ok():
+            return None
+        upload = super().file_complete(file_size)
+        upload.sha256 = self.digest.hexdigest()
+        return upload
+
+    def _header_ok(self):
+        if not self.check_video or is_video_header(self.header):
+            return True
+        self.file.close()
+        if not hasattr(self.request, "rejected_uploads"):
+            self.request.rejected_uploads = {}
+        self.request.rejected_uploads[self.field_name] = "Invalid video format or corrupted file"
+        return False
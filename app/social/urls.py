@@ -6,11 +6,11 @@ from . import comment_like_views
 from . import like_views
 from . import video_views
 from .views import *
-from .inbox_views import(InboxView, inbox_view, follow_inbox_view, )
+from .inbox_views import(InboxView, InboxBatchView, inbox_view, follow_inbox_view, )
 from .follow_views import (FollowerDetailView, FollowersListView, follow_view, followers_view, unfollow_view, following_view, friends_view, send_follow_decision_to_inbox, fetch_remote_authors_view,local_follow_finalize,send_unfollow_to_inbox)
-from .image_views import( get_image_with_serial, get_image_with_fqid)
+from .image_views import( get_image_with_serial, get_image_with_fqid, get_image_with_internal_id)
 from .github_activity import(github_authorize, github_callback)
-from .node_views import NodeListCreateAPIView, NodeRetrieveUpdateDestroyAPIView
+from .node_views import NodeListCreateAPIView, NodeRetrieveUpdateDestroyAPIView, NodeMetricsAPIView
 from .comment_views import(get_post_comments,get_comments_by_post_fqid, get_specific_comment,send_comment_to_inbox_view, create_local_comment)
 from .comment_like_views import(get_comment_likes,like_comment,send_comment_like_to_inbox, is_comment_liked)
 from .like_views import(send_like_to_inbox)
@@ -31,6 +31,7 @@ urlpatterns = [
 
     # NODES
     path('api/nodes/', NodeListCreateAPIView.as_view(), name='node_list_create'),
+    path('api/nodes/metrics/', NodeMetricsAPIView.as_view(), name='node_metrics'),
     path('api/nodes/<int:pk>/', NodeRetrieveUpdateDestroyAPIView.as_view(), name='node_detail'),
 
     path('api/authors/', views.get_authors, name='get_authors'),
@@ -42,6 +43,7 @@ urlpatterns = [
     # Image Posts
     path('api/authors/<int:author_serial>/posts/<int:post_serial>/image', get_image_with_serial, name='get_image_with_serial'),
     re_path(r'^api/posts/(?P<post_fqid>.+)/image$', get_image_with_fqid, name='get_image_with_FQID'),   # Use a regex pattern to explicitly match the URL without the "/image" suffix
+    path('post/<int:internal_id>/image/', get_image_with_internal_id, name='post_image'),
 
     path('api/posts/', post_views.PostListCreateAPIView.as_view(), name='post_list_create'), # getting all the posts
     path('api/posts/<int:internal_id>/', post_views.PostDetailAPIView.as_view(), name='post_detail'),  # getting all the posts as well as updating, deleting them
@@ -66,6 +68,7 @@ urlpatterns = [
     path('debug/current-url/', video_views.debug_video_url, name='debug_video_url'),
 
     path('test-video/<int:post_id>/', video_views.test_video, name='test_video'),
+    path('post/<int:internal_id>/poster/', video_views.get_video_poster, name='post_poster'),
     # Github authorization
     path('github/authorize/', github_authorize, name='github_authorize'),
     path('github/callback/', github_callback, name='github_callback'),
@@ -75,6 +78,7 @@ urlpatterns = [
     path("api/authors/<str:author_id>/followers/<path:follower_fqid>", FollowerDetailView.as_view(), name="manage_follower"),
     path("api/authors/<str:author_id>/inbox",InboxView.as_view(), name="api_inbox"),
     path("api/authors/<str:author_id>/inbox/",InboxView.as_view(), name="api_inbox"),
+    path("api/inbox/batch", InboxBatchView.as_view(), name="api_inbox_batch"),
 
     ############################## Like post
     path('api/authors/<str:author_id>/posts/<str:post_id>/like/', views.PostLikeView.as_view(), name='like_post'),
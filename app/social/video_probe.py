@@ -0,0 +1,393 @@
+"""
+Container metadata and poster frames for video posts.
+
+Feeds used to render every video with the browser fetching the file to find
+out what it was. A video post is now probed once, off the request path: the
+run_outbox worker picks up video posts with video_probed unset and stores on
+the Post
+
+    - video_duration (seconds), video_width, video_height and video_codec,
+      parsed from the MP4 (moov/mvhd/tkhd/stsd boxes) or WebM (EBML Info and
+      Tracks elements) headers, without decoding any frame
+    - poster: a JPEG frame from about one second in, written to media storage;
+      this needs the ffmpeg binary (FFMPEG_BINARY), without it only the
+      metadata is stored
+
+so feed pages can render <video preload="none" poster=...> and never touch the
+video bytes until played. media_storage.attach_upload clears video_probed when
+a post gets a new file.
+
+A post whose file cannot be opened (missing, or media storage not mounted where
+the worker runs) stays unprobed and is skipped for RETRY_SECONDS, so it is
+probed once the storage is reachable. A file that opens but cannot be parsed is
+marked probed with no metadata.
+"""
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import time
+import traceback
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from . import media_storage
+from .models import Post
+
+FFMPEG_BINARY = getattr(settings, "FFMPEG_BINARY", "ffmpeg")
+POSTER_WIDTH = getattr(settings, "VIDEO_POSTER_WIDTH", 640)
+POSTER_TIMEOUT = getattr(settings, "VIDEO_POSTER_TIMEOUT", 30)
+RETRY_SECONDS = getattr(settings, "VIDEO_PROBE_RETRY_SECONDS", 10 * 60)
+
+# Header values outside these bounds are treated as unknown (they come from untrusted uploads)
+MAX_DIMENSION = 65535
+MAX_DURATION = 7 * 24 * 60 * 60
+
+VideoInfo = namedtuple("VideoInfo", ["duration", "width", "height", "codec"])
+
+CODEC_NAMES = {
+    "avc1": "h264", "avc3": "h264", "hvc1": "hevc", "hev1": "hevc", "av01": "av1",
+    "vp08": "vp8", "vp09": "vp9", "mp4v": "mpeg4",
+    "V_VP8": "vp8", "V_VP9": "vp9", "V_AV1": "av1", "V_MPEG4/ISO/AVC": "h264",
+}
+
+
+def _codec_name(raw):
+    return CODEC_NAMES.get(raw, raw.strip().lower())[:32]
+
+
+def _dimension(value):
+    return value if value and 0 < value <= MAX_DIMENSION else None
+
+
+def _duration(value):
+    # Also rejects NaN and infinity from a float Duration element
+    return value if value and 0 < value <= MAX_DURATION else None
+
+
+def _size(f):
+    f.seek(0, os.SEEK_END)
+    return f.tell()
+
+
+# =============================================================================
+# MP4 (ISO base media file format)
+# =============================================================================
+
+def _boxes(f, start, end):
+    """Yields (type, payload start, box end) for the boxes between `start` and `end`."""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield kind, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _child(f, start, end, kind):
+    for child, child_start, child_end in _boxes(f, start, end):
+        if child == kind:
+            return child_start, child_end
+    return None
+
+
+def _read(f, start, end, limit=256):
+    f.seek(start)
+    return f.read(min(end - start, limit))
+
+
+def _mp4_track(f, start, end):
+    """Returns (width, height, codec) for a video trak box, None for other tracks."""
+    mdia = _child(f, start, end, b"mdia")
+    hdlr = mdia and _child(f, *mdia, b"hdlr")
+    if not hdlr or _read(f, *hdlr)[8:12] != b"vide":
+        return None
+
+    width = height = None
+    tkhd = _child(f, start, end, b"tkhd")
+    if tkhd:
+        data = _read(f, *tkhd)
+        offset = 88 if data[:1] == b"\x01" else 76
+        if len(data) >= offset + 8:
+            # 16.16 fixed point display size
+            width, height = (value >> 16 for value in struct.unpack(">II", data[offset:offset + 8]))
+
+    codec = ""
+    minf = _child(f, *mdia, b"minf")
+    stbl = minf and _child(f, *minf, b"stbl")
+    stsd = stbl and _child(f, *stbl, b"stsd")
+    if stsd:
+        data = _read(f, *stsd)
+        if len(data) >= 16:
+            codec = _codec_name(data[12:16].decode("latin-1"))
+        if not width and len(data) >= 44:
+            width, height = struct.unpack(">HH", data[40:44])
+    return _dimension(width), _dimension(height), codec
+
+
+def probe_mp4(f):
+    end = _size(f)
+    first = next(_boxes(f, 0, end), None)
+    if first is None or first[0] != b"ftyp":
+        return None
+    moov = _child(f, 0, end, b"moov")
+    if moov is None:
+        return None
+
+    duration = None
+    mvhd = _child(f, *moov, b"mvhd")
+    if mvhd:
+        data = _read(f, *mvhd)
+        if data[:1] == b"\x01" and len(data) >= 32:
+            timescale, length = struct.unpack(">IQ", data[20:32])
+        elif data[:1] == b"\x00" and len(data) >= 20:
+            timescale, length = struct.unpack(">II", data[12:20])
+        else:
+            timescale = length = 0
+        if timescale and length:
+            duration = _duration(length / timescale)
+
+    for kind, start, stop in _boxes(f, *moov):
+        if kind == b"trak":
+            track = _mp4_track(f, start, stop)
+            if track:
+                return VideoInfo(duration, *track)
+    return VideoInfo(duration, None, None, "")
+
+
+# =============================================================================
+# WebM (Matroska / EBML)
+# =============================================================================
+
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+CLUSTER = 0x1F43B675
+
+
+def _vint(f, keep_marker):
+    """Reads an EBML variable-length integer. Returns (value, length, unknown size)."""
+    first = f.read(1)
+    if not first:
+        raise ValueError("Truncated EBML element")
+    mask, length = 0x80, 1
+    while length <= 8 and not first[0] & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError("Invalid EBML length")
+    value = first[0] if keep_marker else first[0] & (mask - 1)
+    for byte in f.read(length - 1):
+        value = (value << 8) | byte
+    return value, length, not keep_marker and value == (1 << (7 * length)) - 1
+
+
+def _elements(f, start, end):
+    """Yields (id, data start, data end) for the elements between `start` and `end`."""
+    pos = start
+    while pos < end:
+        f.seek(pos)
+        element_id, id_length, _ = _vint(f, keep_marker=True)
+        size, size_length, unknown = _vint(f, keep_marker=False)
+        data = pos + id_length + size_length
+        stop = end if unknown else min(data + size, end)
+        yield element_id, data, stop
+        pos = stop
+
+
+def _uint(f, start, end):
+    f.seek(start)
+    return int.from_bytes(f.read(min(end - start, 8)), "big")
+
+
+def probe_webm(f):
+    end = _size(f)
+    elements = _elements(f, 0, end)
+    first = next(elements, None)
+    if first is None or first[0] != EBML_HEADER:
+        return None
+    segment = next((element for element in elements if element[0] == SEGMENT), None)
+    if segment is None:
+        return None
+
+    scale, raw_duration = 1000000, None
+    width = height = None
+    codec = ""
+    for element_id, start, stop in _elements(f, segment[1], segment[2]):
+        if element_id == INFO:
+            for child_id, child_start, child_stop in _elements(f, start, stop):
+                if child_id == TIMECODE_SCALE:
+                    scale = _uint(f, child_start, child_stop)
+                elif child_id == DURATION and child_stop - child_start in (4, 8):
+                    f.seek(child_start)
+                    data = f.read(child_stop - child_start)
+                    raw_duration = struct.unpack(">f" if len(data) == 4 else ">d", data)[0]
+        elif element_id == TRACKS:
+            for entry_id, entry_start, entry_stop in _elements(f, start, stop):
+                if entry_id != TRACK_ENTRY or codec:
+                    continue
+                fields = {child_id: (child_start, child_stop)
+                          for child_id, child_start, child_stop in _elements(f, entry_start, entry_stop)}
+                if TRACK_TYPE not in fields or _uint(f, *fields[TRACK_TYPE]) != 1:
+                    continue
+                if CODEC_ID in fields:
+                    f.seek(fields[CODEC_ID][0])
+                    raw = f.read(fields[CODEC_ID][1] - fields[CODEC_ID][0])
+                    codec = _codec_name(raw.rstrip(b"\x00").decode("ascii", "replace"))
+                if VIDEO in fields:
+                    for video_id, video_start, video_stop in _elements(f, *fields[VIDEO]):
+                        if video_id == PIXEL_WIDTH:
+                            width = _uint(f, video_start, video_stop)
+                        elif video_id == PIXEL_HEIGHT:
+                            height = _uint(f, video_start, video_stop)
+        elif element_id == CLUSTER:
+            # Frame data from here on; Info and Tracks precede it
+            break
+
+    duration = _duration(raw_duration * scale / 1e9) if raw_duration else None
+    return VideoInfo(duration, _dimension(width), _dimension(height), codec)
+
+
+def probe(f):
+    """Returns the VideoInfo of a seekable binary video file, or None if it is neither MP4 nor WebM."""
+    f.seek(0)
+    header = f.read(16)
+    if b"ftyp" in header:
+        return probe_mp4(f)
+    if header.startswith(b"\x1A\x45\xDF\xA3"):
+        return probe_webm(f)
+    return None
+
+
+# =============================================================================
+# Poster frames
+# =============================================================================
+
+def extract_poster(post, duration=None):
+    """
+    Returns one JPEG frame of the post's video (at most POSTER_WIDTH wide), or
+    None if ffmpeg is not installed or cannot decode the file.
+    """
+    binary = shutil.which(FFMPEG_BINARY)
+    if binary is None:
+        return None
+    at = min(1.0, duration / 2) if duration else 0
+
+    temporary = None
+    try:
+        try:
+            path = default_storage.path(post.media.name) if post.media else None
+        except NotImplementedError:
+            path = None
+        if path is None:
+            # Remote storage or legacy inline content: ffmpeg needs a seekable file
+            temporary = tempfile.NamedTemporaryFile(suffix=".video", delete=False)
+            with temporary, media_storage.open_media(post) as source:
+                shutil.copyfileobj(source, temporary)
+            path = temporary.name
+
+        result = subprocess.run(
+            [binary, "-v", "error", "-ss", f"{at:.3f}", "-i", path, "-frames:v", "1",
+             "-vf", f"scale='min({POSTER_WIDTH},iw)':-2", "-f", "image2", "-c:v", "mjpeg", "-q:v", "4", "pipe:1"],
+            capture_output=True, timeout=POSTER_TIMEOUT,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"From video_probe: ffmpeg failed for {post.id}: {e}")
+        return None
+    finally:
+        if temporary is not None:
+            os.remove(temporary.name)
+    if result.returncode != 0 or not result.stdout:
+        print(f"From video_probe: No poster frame for {post.id}: {result.stderr.decode(errors='replace')[:200]}")
+        return None
+    return result.stdout
+
+
+# =============================================================================
+# Background job
+# =============================================================================
+
+def probe_post(post):
+    """
+    Probes one video post and stores the result. The post is marked probed even
+    if its headers could not be parsed; returns None, leaving it unprobed, if
+    the file could not be opened or read.
+    """
+    info = None
+    try:
+        with media_storage.open_media(post) as video_file:
+            info = probe(video_file)
+    except OSError as e:
+        print(f"From video_probe: Could not open {post.id}, will retry: {e!r}")
+        return None
+    except Exception as e:
+        # Any malformed upload: store nothing rather than retry it forever
+        print(f"From video_probe: Could not read {post.id}: {e!r}")
+
+    poster = ""
+    if info is not None:
+        try:
+            data = extract_poster(post, info.duration)
+            if data:
+                poster = media_storage.store_bytes(data, 'image/jpeg;base64')
+        except Exception as e:
+            print(f"From video_probe: Could not store a poster for {post.id}: {e!r}")
+
+    # Only if the post still has the file that was probed
+    return Post.objects.filter(pk=post.pk, media=post.media.name).update(
+        video_probed=True,
+        video_duration=info.duration if info else None,
+        video_width=info.width if info else None,
+        video_height=info.height if info else None,
+        video_codec=info.codec if info else "",
+        poster=poster,
+    )
+
+
+# Post pk -> time.monotonic() before which a post whose file could not be opened is skipped
+_retry_at = {}
+
+
+def run_once(limit=5):
+    """Probes up to `limit` pending video posts. Returns how many were probed."""
+    now = time.monotonic()
+    for pk, retry_at in list(_retry_at.items()):
+        if retry_at <= now:
+            del _retry_at[pk]
+    pending = list(
+        Post.objects.filter(contentType__startswith='video/', video_probed=False)
+        .exclude(pk__in=list(_retry_at))
+        .only('internal_id', 'id', 'contentType', 'content', 'media')[:limit]
+    )
+    probed = 0
+    for post in pending:
+        try:
+            if probe_post(post) is None:
+                _retry_at[post.pk] = now + RETRY_SECONDS
+                continue
+        except Exception:
+            traceback.print_exc()
+            # Never pick the same post up again on the next loop
+            Post.objects.filter(pk=post.pk).update(video_probed=True)
+        probed += 1
+    return probed
@@ -2,8 +2,12 @@ from rest_framework.decorators import api_view
 from .models import Post, Author
 from django.shortcuts import get_object_or_404
 from django.http import JsonResponse, HttpResponse
+from django.core.files.storage import default_storage
 from urllib.parse import unquote
 import base64
+import os
+from . import media_storage
+from . import resolver
 
 @api_view(['GET'])
 def get_video_with_serial(request, author_serial, post_serial):
@@ -14,76 +18,25 @@ def get_video_with_serial(request, author_serial, post_serial):
     post_fqid = f"{node_name}social/api/authors/{author_serial}/posts/{post_serial}"
     post = get_object_or_404(Post, id=post_fqid)
 
-    return serve_post_video(post)
+    return serve_post_video(request, post)
 
 @api_view(['GET'])
 def get_video_with_fqid(request, post_fqid):
     """
     Returns a post's video as binary given the post's fqid
     """
-    import sys
-    sys.stdout.write(f"\n===== get_video_with_fqid CALLED =====\n")
-    sys.stdout.write(f"Raw post_fqid: {post_fqid}\n")
-    sys.stdout.flush()
-
-    # First, URL decode the FQID
-    decoded_fqid = unquote(post_fqid)
-    sys.stdout.write(f"Decoded post_fqid: {decoded_fqid}\n")
-    sys.stdout.flush()
-
     try:
-        # Method 1: Try direct lookup by ID
-        try:
-            post = Post.objects.get(id=decoded_fqid)
-            sys.stdout.write(f"Found post by exact ID match: {post.title}\n")
-            sys.stdout.flush()
-        except Post.DoesNotExist:
-            sys.stdout.write(f"Post not found by exact ID, trying alternatives...\n")
-            sys.stdout.flush()
-
-            # Method 2: Try extracting the internal_id
-            try:
-                parts = decoded_fqid.split("/posts/")
-                if len(parts) > 1:
-                    internal_id = parts[1]
-                    sys.stdout.write(f"Extracted internal_id: {internal_id}\n")
-                    sys.stdout.flush()
-
-                    post = Post.objects.get(internal_id=internal_id)
-                    sys.stdout.write(f"Found post by internal_id: {post.title}\n")
-                    sys.stdout.flush()
-                else:
-                    raise Post.DoesNotExist("Could not extract internal_id")
-            except (Post.DoesNotExist, IndexError, ValueError) as e:
-                sys.stdout.write(f"Error finding post by internal_id: {str(e)}\n")
-                sys.stdout.flush()
-
-                # Method 3: List all posts and look for similar IDs
-                sys.stdout.write("Listing all posts to find match:\n")
-                posts = Post.objects.all()
-                for p in posts:
-                    sys.stdout.write(f"Post ID: {p.id}, internal_id: {p.internal_id}, title: {p.title}\n")
-
-                    # Check if this post's ID contains the post_fqid
-                    if str(p.internal_id) in decoded_fqid:
-                        sys.stdout.write(f"Found potential match by internal_id in string: {p.title}\n")
-                        post = p
-                        break
-                else:
-                    return HttpResponse("Post not found after all attempts", status=404)
+        # Exact id, then the local serial; see resolver.py
+        post = resolver.resolve_post(post_fqid)
+        if post is None:
+            return HttpResponse("Post not found after all attempts", status=404)
 
         # Ensure it's a video post
         if not post.contentType.startswith('video/'):
-            sys.stdout.write(f"Found post is not a video: {post.contentType}\n")
-            sys.stdout.flush()
             return HttpResponse("Not a video post", status=400)
 
         # Serve the video
         try:
-            video_data = base64.b64decode(post.content)
-            sys.stdout.write(f"Successfully decoded {len(video_data)} bytes of video data\n")
-            sys.stdout.flush()
-
             # Determine content type
             if post.contentType == 'video/mp4;base64':
                 mime_type = 'video/mp4'
@@ -92,32 +45,38 @@ def get_video_with_fqid(request, post_fqid):
             else:
                 mime_type = 'video/mp4'  # Default
 
-            sys.stdout.write(f"Serving video with MIME type: {mime_type}\n")
-            sys.stdout.flush()
-
-            # Create and return the response
-            response = HttpResponse(video_data, content_type=mime_type)
-            return response
+            # Stream the video (supports Range requests for seeking)
+            return media_storage.media_response(request, post, mime_type)
 
         except Exception as e:
-            sys.stdout.write(f"Error serving video: {str(e)}\n")
-            sys.stdout.flush()
             return HttpResponse(f"Error serving video: {str(e)}", status=500)
 
     except Exception as e:
-        import traceback
-        sys.stdout.write(f"Unexpected error: {str(e)}\n")
-        sys.stdout.write(traceback.format_exc())
-        sys.stdout.flush()
         return HttpResponse(f"Error: {str(e)}", status=500)
 
-def serve_post_video(post):
+def get_video_poster(request, internal_id):
     """
-    Helper function to serve a video from a Post object where content is stored as base64.
-    Returns the decoded binary video data.
+    Returns the poster frame of a video post (a JPEG written by video_probe.py),
+    so feeds can show a preview without loading the video.
+    """
+    post = get_object_or_404(Post.objects.only('internal_id', 'poster'), internal_id=internal_id)
+    if not post.poster:
+        return JsonResponse({"error": "Poster not found"}, status=404)
+    name = post.poster.name
+    # Posters are content-addressed like other media, so the name is a strong ETag
+    etag = f'"{os.path.splitext(os.path.basename(name))[0]}"'
+    return media_storage.file_response(
+        request, lambda: default_storage.open(name, 'rb'), etag, default_storage.get_modified_time(name), 'image/jpeg'
+    )
+
+def serve_post_video(request, post):
+    """
+    Helper function to serve a video from a Post object, whether it is stored as
+    a media file or as legacy base64 content. Streams the binary video data with
+    Range support so browsers can seek.
     """
     # Check if the post has content
-    if not post.content:
+    if not media_storage.has_media(post):
         return JsonResponse({"error": "Video not found"}, status=404)
 
     # Check if the post's contentType is a video type
@@ -125,9 +84,6 @@ def serve_post_video(post):
         return JsonResponse({"error": "File is not a valid video"}, status=404)
 
     try:
-        # Decode the base64 content back to binary
-        video_data = base64.b64decode(post.content)
-
         # Determine the MIME type from the contentType field
         if post.contentType == 'video/mp4;base64':
             mime_type = 'video/mp4'
@@ -137,9 +93,8 @@ def serve_post_video(post):
             # Default
             mime_type = 'video/mp4'
 
-        # Create a response with the binary video data
-        response = HttpResponse(video_data, content_type=mime_type)
-        return response
+        # Stream the stored file (or decoded legacy base64 content)
+        return media_storage.media_response(request, post, mime_type)
 
     except base64.binascii.Error:
         return JsonResponse({"error": "Invalid base64 data"}, status=400)
@@ -222,14 +177,9 @@ def test_video(request, post_id):
             return HttpResponse("Not a video post", status=400)
 
         try:
-            video_data = base64.b64decode(post.content)
-            sys.stdout.write(f"Decoded video data: {len(video_data)} bytes\n")
-            sys.stdout.flush()
-
             mime_type = 'video/mp4' if post.contentType == 'video/mp4;base64' else 'video/webm'
 
-            response = HttpResponse(video_data, content_type=mime_type)
-            return response
+            return media_storage.media_response(request, post, mime_type)
         except base64.binascii.Error as e:
             sys.stdout.write(f"Base64 decode error: {str(e)}\n")
             sys.stdout.flush()
@@ -260,22 +210,20 @@ def get_video_with_fqid_fix(request, post_path):
     # Remove the /video suffix to get the actual post_fqid
     post_fqid = post_path[:-6]  # Remove '/video'
 
-    # Unquote the post_fqid
-    post_fqid = unquote(post_fqid)
-
     try:
         # Try to find the post
-        post = Post.objects.get(id=post_fqid)
+        post = resolver.resolve_post(post_fqid)
+        if post is None:
+            raise Post.DoesNotExist
 
         # Make sure it's a video
         if not post.contentType.startswith('video/'):
             return HttpResponse("Not a video post", status=400)
 
         # Serve the video
-        video_data = base64.b64decode(post.content)
         mime_type = 'video/mp4' if post.contentType == 'video/mp4;base64' else 'video/webm'
 
-        return HttpResponse(video_data, content_type=mime_type)
+        return media_storage.media_response(request, post, mime_type)
     except Post.DoesNotExist:
         return HttpResponse("Post not found", status=404)
     except Exception as e:
@@ -45,12 +45,20 @@ from .models import Post, Comment
 from .serializers import LikeSerializer
 from .models import Like
 from .authentication import NodeBasicAuthentication
+from . import outbox
+from . import federation
+from . import counters
+from . import fqid
+from . import resolver
+from . import node_registry
+from .feed import get_feed_page, decorate_posts
+from .pagination import InvalidCursor, KeysetPagination, next_link, paginate
+from .friendships import are_friends
 
 import requests  # Correct placement of requests import
 from django.conf import settings
 import json
 import os
-from rest_framework.pagination import PageNumberPagination
 from .utils import *
 
 from .github_activity import fetch_user_activity
@@ -59,10 +67,6 @@ def get_base_url(request):
     """Extracts the base URL (protocol + domain) from the request"""
     return f"{request.scheme}://{request.get_host()}"
 
-class CustomPageNumberPagination(PageNumberPagination):
-    page_size_query_param = 'size'
-    max_page_size = 100  # Optional: Prevent very large queries
-
 ######################################
 #           STREAM/INDEX AREA        
 ######################################
@@ -92,33 +96,9 @@ def stream(request):
         authors=friends,
         visibilities=['PUBLIC', 'FRIENDS']
     )
-        # Add `is_liked` status to each post
-    for post in post_list:
-        if request.user.is_authenticated:
-            try:
-                author = request.user.author
-                post.is_liked = Like.objects.filter(object=post.id, author=author).exists()
-            except:
-                post.is_liked = False
-        else:
-            post.is_liked = False
 
-
-    # Handle likes for comments
-    for post in post_list:
-        for comment in post.comments.all():
-            if request.user.is_authenticated:
-                try:
-                    author = request.user.author
-                    comment.is_liked = Like.objects.filter(author=author, object=comment.id).exists()
-                except:
-                    comment.is_liked = False
-            else:
-                comment.is_liked = False
-    # Pagination
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    posts = paginator.get_page(page_number)
+    # Paginate first, then resolve comments and likes for this page only
+    posts = get_feed_page(post_list, request.user.author, request.GET.get('page'))
 
     return render(request, 'social/index.html', {'posts': posts})
 
@@ -268,40 +248,23 @@ def get_author_with_fqid(request, author_fqid):
 def get_authors(request):
     """
     Retrieves authors whose `host` starts with the requesting base URL.
-    Supports optional pagination with `page` and `size` query parameters.
-    If pagination is not requested, returns all authors.
+    Pages follow `next` (a ?cursor= link); the spec's `page` and `size` query
+    parameters are also accepted. At most MAX_PAGE_SIZE authors per page.
     """
     base_url = get_base_url(request)
     authors = Author.objects.filter(host__startswith=base_url)
 
-    # Get pagination parameters
-    page = request.query_params.get('page')
-    size = request.query_params.get('size')
-
-    if page and size:  # Apply manual pagination only if both parameters are provided
-        try:
-            page = int(page)
-            size = int(size)
-            start = (page - 1) * size
-            end = start + size
-            authors = authors[start:end]
-        except ValueError:
-            return Response({"error": "Invalid pagination parameters"}, status=400)
-    
-    elif page:  # page provided but no size
-        try:
-            page = int(page)
-            size = 1
-            start = (page - 1) * size
-            end = start + size
-            authors = authors[start:end]
-        except ValueError:
-            return Response({"error": "Invalid pagination parameters"}, status=400)
+    # Keyset pagination on id (?cursor=); ?page=&size= still work for the spec
+    try:
+        authors, next_cursor = paginate(request, authors, ordering=('pk',))
+    except InvalidCursor:
+        return Response({"error": "Invalid pagination parameters"}, status=400)
     
     serializer = AuthorSerializer(authors, many=True)
 
     return Response({
         "type": "authors",
+        "next": next_link(request, next_cursor),
         "authors": serializer.data
     })
 
@@ -321,7 +284,7 @@ def remote_author_profile(request, author_fqid):
         # Check if the current user is a friend of the profile author
         is_friend = False
         if current_user_author:
-            is_friend = currentAuthor in current_user_author.friends
+            is_friend = are_friends(current_user_author, currentAuthor)
         
         # Base query for posts by the author
         posts_query = Post.objects.filter(author=currentAuthor).exclude(visibility="DELETED")
@@ -330,16 +293,8 @@ def remote_author_profile(request, author_fqid):
         if not is_friend:
             posts_query = posts_query.exclude(visibility="FRIENDS")
         
-        # Fetch posts with additional context
-        posts = list(posts_query)
-        
-        # Annotate posts dynamically if needed
-        for post in posts:
-            # No need to set likes_count, it's a property
-            # Check if the current user has liked the post
-            post.is_liked = False
-            if request.user.is_authenticated:
-                post.is_liked = post.likes.filter(author=request.user.author).exists()
+        # Fetch posts with their comments and likes
+        posts = decorate_posts(posts_query.previews().select_related('author'), current_user_author)
 
         return render(request, 'social/remote_profile.html', {
             "posts": posts,
@@ -353,18 +308,13 @@ def remote_author_profile(request, author_fqid):
     except Author.DoesNotExist:
         # Fetch remote author information
         author_host = author_fqid.split('/api/')[0]
-        node = Node.objects.filter(base_url__contains=author_host).first()
+        node = node_registry.by_host(author_host)
         
         if not node:
             return render(request, 'social/not_found_author.html', status=404)
         
         try:
-            response = requests.get(
-                author_fqid,
-                auth=(node.auth_username, node.auth_password),
-                headers={"Accept": "application/json"},
-                timeout=5
-            )
+            response = federation.get(node, author_fqid)
             
             if response.ok:
                 remote_author_data = response.json()
@@ -403,17 +353,20 @@ def profile_page(request, id):
         follower_number = len(set(Follow.objects.filter(followee_id=full_author_id).values_list("follower_id", flat=True)))
         
         # Get all posts by this author (excluding deleted)
-        posts = Post.objects.filter(author=currentAuthor).exclude(visibility="DELETED").values()
+        posts = Post.objects.filter(author=currentAuthor).exclude(visibility="DELETED").previews().values(
+            "title", "content_preview", "contentType", "description", "internal_id", "published")
 
         # Format posts for rendering
         postsToRender = []
         for post in posts:
             postDict = {
                 "title": post["title"],
-                "content": post["content"],
+                "content": post["content_preview"],
                 "contentType": post["contentType"],
                 "description": post["description"],
-                "id": post["internal_id"]
+                "id": post["internal_id"],
+                "internal_id": post["internal_id"],
+                "published": post["published"]
             }
             postsToRender.append(postDict)
         
@@ -476,10 +429,15 @@ def profile_edit(request, id):
 class AuthorPostListAPIView(generics.ListAPIView):
     serializer_class = PostSerializer
     permission_classes = [AllowAny]  # Allow anyone to list posts
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         author_id = self.kwargs['author_id']
-        return Post.objects.filter(author__id=author_id)
+        return Post.objects.filter(author__id=author_id).previews()
+
+    def get_serializer_context(self):
+        # List pages return a content preview; full content is on the detail endpoints
+        return {**super().get_serializer_context(), 'preview': True}
     
 class AuthorPostCreateAPIView(generics.CreateAPIView):
     serializer_class = PostSerializer
@@ -505,9 +463,7 @@ def my_posts(request):
     )
 
     # Pagination
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    posts = paginator.get_page(page_number)
+    posts = get_feed_page(post_list, user, request.GET.get('page'))
 
     return render(request, 'social/my_posts.html', {'posts': posts})
 
@@ -563,40 +519,23 @@ class PostLikeView(APIView):
     def post(self, request, author_id, post_id):
         try:
             # Normalize author_id (remove URL if present)
-            if isinstance(author_id, str) and '/authors/' in author_id:
-                author_id = author_id.split('/authors/')[-1].split('/')[0]
+            author_id = fqid.author_serial(author_id)
             
             # Construct the full post URL
-            full_post_url = f"{request.get_host()}/social/api/authors/{author_id}/posts/{post_id}"
+            full_post_url = f"http://{request.get_host()}/social/api/authors/{author_id}/posts/{post_id}"
             print(f"Constructed Post URL: {full_post_url}")
             
-            # Find the post
-            try:
-                # Try to find the post by its full URL ID first
-                post = Post.objects.get(id=full_post_url)
-            except Post.DoesNotExist:
-                # Fallback to finding by internal_id
-                try:
-                    post = Post.objects.get(internal_id=post_id)
-                except Post.DoesNotExist:
-                    # Log all existing posts for debugging
-                    all_posts = Post.objects.all()
-                    print("All Posts in Database:")
-                    for p in all_posts:
-                        print(f"Full ID: {p.id}")
-                        print(f"Internal ID: {p.internal_id}")
-                        print(f"Author ID: {p.author.id}")
-                        print(f"Title: {p.title}")
-                        print("---")
-                    
-                    return Response({
-                        'error': 'Post not found', 
-                        'details': {
-                            'full_url': full_post_url,
-                            'author_id': author_id,
-                            'post_id': post_id
-                        }
-                    }, status=status.HTTP_404_NOT_FOUND)
+            # Find the post by its full id or its serial; see resolver.py
+            post = resolver.resolve_post(full_post_url)
+            if post is None:
+                return Response({
+                    'error': 'Post not found', 
+                    'details': {
+                        'full_url': full_post_url,
+                        'author_id': author_id,
+                        'post_id': post_id
+                    }
+                }, status=status.HTTP_404_NOT_FOUND)
             
             # Get or create the author profile for the current user
             try:
@@ -626,7 +565,7 @@ class PostLikeView(APIView):
                 try:
                     # Check if the post is local
                     current_host = request.get_host()
-                    post_author_host = post.author.host.split('//')[1].rstrip('/') if '//' in post.author.host else post.author.host.rstrip('/')
+                    post_author_host = fqid.host_of(post.author.host) or post.author.host.rstrip('/')
                     
                     is_local_post = not post.author.host or current_host in post_author_host
                     
@@ -659,7 +598,7 @@ class PostLikeView(APIView):
             
             return Response({
                 'action': action,
-                'like_count': post.likes.count()
+                'like_count': counters.like_count(post.id)
             })
         
         except Exception as e:
@@ -699,22 +638,15 @@ class PostLikeView(APIView):
                 "object": post.id
             }
 
-            # Send the post to the recipient's inbox
-            response = requests.post(
-                inbox_url,
-                json=like_data,
-                auth=(post_node.auth_username, post_node.auth_password),
-                headers={"Content-Type": "application/json"},
-                timeout=5
-            )
-            response.raise_for_status()
-            print(f"Successfully sent like to {post.author.id}")
+            # Queue the like for the post author's inbox
+            outbox.enqueue(post_node, inbox_url, like_data)
+            print(f"Queued like for {post.author.id}")
 
         except Node.DoesNotExist:
             print(f"Node does not exist for host: {post.author.host}. May have been removed.")
             pass
         except Exception as e:
-            print(f"Failed to send like to {post.author.id}: {str(e)}")
+            print(f"Failed to queue like for {post.author.id}: {str(e)}")
             pass
 
 # comments
@@ -728,8 +660,7 @@ def add_comment(request, author_id, post_id):
         print(f"Raw Post ID: {post_id}")
         
         # Normalize author_id (remove URL if present)
-        if isinstance(author_id, str) and '/authors/' in author_id:
-            author_id = author_id.split('/authors/')[-1].split('/')[0]
+        author_id = fqid.author_serial(author_id)
         
         # Construct the full post URL
         full_post_url = f"http://localhost:8000/social/api/authors/{author_id}/posts/{post_id}"
@@ -826,8 +757,7 @@ class CommentLikeView(APIView):
             print(f"Raw Comment ID: {comment_id}")
             
             # Normalize author_id (remove URL if present)
-            if isinstance(author_id, str) and '/authors/' in author_id:
-                author_id = author_id.split('/authors/')[-1].split('/')[0]
+            author_id = fqid.author_serial(author_id)
             
             # Construct the full post URL
             full_post_url = f"http://localhost:8000/social/api/authors/{author_id}/posts/{post_id}"